@@ -13,8 +13,8 @@ echo "Continuing..."
 echo "~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"
 echo "> Zip lambda function"
 cd ./lambda_hamilton || exit
-# zip folder bin and psycopg2 and file lambda_function to lambda_function.zip
-zip -r lambda_function_payload.zip bin/ psycopg2/ lambda_function.py
+# zip folder bin and psycopg2 and the lambda modules to lambda_function.zip
+zip -r lambda_function_payload.zip bin/ psycopg2/ lambda_function.py render_engine.py seating.py
 cd ..
 echo "> Generated lambda_hamilton/lambda_function_payload.zip"
 echo "Copying credential file to terraform"
@@ -1,8 +1,10 @@
 import json
-import subprocess
 import os
+import time
 import psycopg2
-import json
+
+import render_engine
+import seating
 
 # Environment variables from AWS Lambda configuration
 DB_HOST = os.environ['DB_HOST']
@@ -12,11 +14,20 @@ DB_PASS = os.environ['DB_PASS']
 DB_HOST = DB_HOST.split(":")[0]
 
 INPUT_PATH = "/tmp"
-OUTPUT_PATH = "/tmp"
-HAMILTON_PATH = "./bin/hamilton-v1.1.0-linux-amd64"
+HAMILTON_PATH = os.environ.get("HAMILTON_PATH", "./bin/hamilton-v1.1.0-linux-amd64")
+
+# Created on the first render and kept across warm invocations, see render_engine
+_engine = None
+# Seating plans rendered recently, updated in place when only the purchased count changed
+seat_maps = seating.SeatMapCache()
 
 pre_data = {}
 
+# Connection kept by the execution environment across warm invocations, see get_connection
+_conn = None
+# connects: new connections, reuses: warm invocations that kept theirs, setup_ms: time spent in get_connection
+connection_stats = {"connects": 0, "reuses": 0, "setup_ms": 0.0}
+
 
 def connect_to_db():
     conn = psycopg2.connect(
@@ -28,38 +39,94 @@ def connect_to_db():
     return conn
 
 
-def exec_hamilton(cmd):
-    print(">> start exec hamilton")
-    try:
-        output = subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT)
-        print(">> Output:", output.decode('utf-8'))
-    except subprocess.CalledProcessError as e:
-        print(">> Error output:", e.output.decode('utf-8'))
-        raise e
-
-    print(">> hamilton finished")
+def get_connection():
+    """
+    Return the connection of this execution environment, reconnecting when it is closed or no
+    longer answers (e.g. the server dropped it while the environment was frozen between invocations).
+    """
+    global _conn
+    started = time.perf_counter()
+    if _conn is not None and not _conn.closed:
+        try:
+            with _conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            _conn.rollback()
+            connection_stats["reuses"] += 1
+        except psycopg2.Error as e:
+            print(f">> db connection is dead, reconnecting: {e}")
+            _conn.close()
+            _conn = None
+    if _conn is None or _conn.closed:
+        _conn = connect_to_db()
+        connection_stats["connects"] += 1
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    connection_stats["setup_ms"] += elapsed_ms
+    print(f">> db connection ready in {elapsed_ms:.1f} ms ({connection_stats})")
+    return _conn
+
+
+def end_transaction(conn):
+    """
+    Roll back what a render left open: a render that returned without committing (nothing to update)
+    still holds the locks of its reads, they are released here rather than kept while the environment
+    waits for the next batch. A connection that broke during the render, whether psycopg2 noticed yet
+    or not, is replaced for the remaining records.
+    """
+    if not conn.closed:
+        try:
+            conn.rollback()
+            return conn
+        except psycopg2.Error as e:
+            print(f">> db connection lost during the render, reconnecting: {e}")
+            conn.close()
+    return get_connection()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = render_engine.from_environ(HAMILTON_PATH, INPUT_PATH)
+        print(f">> render engine: {_engine.name}")
+    return _engine
+
+
+def render_seating_incrementally(seating_input, conn):
+    """
+    Mark the newly sold seats on the plan stored for the concert, None when it has to be drawn in
+    full: no plan yet (new or updated concert), a different capacity, or fewer purchased seats.
+    """
+    seating_id = seating_input["id"]
+    cur = conn.cursor()
+    # svg_hash is kept by a trigger (0006_concert_svg_hash.sql), the plan itself is only read on a miss
+    cur.execute("SELECT svg_hash FROM concerts WHERE id = %s", (seating_id,))
+    row = cur.fetchone()
+    if row is None or row[0] is None:
+        seat_maps.discard(seating_id)
+        return None
+
+    seat_map = seat_maps.get(seating_id, row[0])
+    if seat_map is None:
+        cur.execute("SELECT svg FROM concerts WHERE id = %s", (seating_id,))
+        seat_map = seating.SeatMap.parse(cur.fetchone()[0])
+        if seat_map is None:
+            print(f">> stored seating plan of {seating_id} is not incremental, drawing it in full")
+            return None
+
+    purchased = seating_input["seats"]["purchased"]
+    if seat_map.max_seats != seating_input["seats"]["max"] or purchased < seat_map.purchased:
+        return None
+    print(f">> seating plan of {seating_id}: {purchased - seat_map.purchased} more seat(s) sold")
+    seat_map.sell(purchased)
+    svg_content = seat_map.render()
+    seat_maps.put(seat_map)
+    return svg_content
 
 
 def handler_ticket(ticket_input, conn):
     ticket_id = ticket_input["id"]
-    input_path = f"{INPUT_PATH}/{ticket_id}.json"
-    output_path = f"{OUTPUT_PATH}/{ticket_id}"
-
     print(f">> ticket id: {ticket_id}")
-    print(f">> input path: {input_path}")
-    print(f">> output path: {output_path}")
 
-    # dump input to file
-    with open(input_path, "w") as f:
-        json.dump(ticket_input, f)
-
-    cmd = f"{HAMILTON_PATH} generate ticket --input {input_path} --output {output_path}"
-
-    # run exec_hamilton
-    exec_hamilton(cmd)
-
-    with open(f"{output_path}.svg", "r") as f:
-        svg_content = f.read()
+    svg_content = get_engine().render("ticket", ticket_input)
 
     # write svg_content to svg field in table tickets
     cur = conn.cursor()
@@ -79,24 +146,11 @@ def handler_ticket(ticket_input, conn):
 def handler_seating(seating_input, conn):
     global pre_data
     seating_id = seating_input["id"]
-    input_path = f"{INPUT_PATH}/{seating_id}.json"
-    output_path = f"{OUTPUT_PATH}/{seating_id}"
-
     print(f">> seating id: {seating_id}")
-    print(f">> input path: {input_path}")
-    print(f">> output path: {output_path}")
-
-    # dump input to file
-    with open(input_path, "w") as f:
-        json.dump(seating_input, f)
-
-    cmd = f"{HAMILTON_PATH} generate seating --input {input_path} --output {output_path}"
-
-    # run exec_hamilton
-    exec_hamilton(cmd)
 
-    with open(f"{output_path}.svg", "r") as f:
-        svg_content = f.read()
+    svg_content = render_seating_incrementally(seating_input, conn)
+    if svg_content is None:
+        svg_content = get_engine().render("seating", seating_input)
     ############################
     # get svg_seat_num from concerts table, only one value will be fetch
     cur = conn.cursor()
@@ -183,77 +237,96 @@ def get_concert_info(concert_id, conn):
             }}
 
 
-# the input {"event": "ticket",
-#           "id": "[UUID]",}
-def lambda_handler(event, context):
-    global pre_data
+def render_ticket(ticket_id, conn):
+    ticket_info = get_ticket_info(ticket_id, conn)
+    return handler_ticket(ticket_info, conn)
 
-    print("original event:")
-    print(event)
-    print("\n\n")
-    print("event['body']:")
-    print("len(event['Records'])")
-    print(len(event['Records']))
-    print("\n\n")
-    event = json.loads(event['Records'][0]['body'])
-    print(event)
-    event_name = event["event"]
-    _id = event["id"]
-
-    # if the event is not "concert" or "ticket", return 404
-    if event_name != "concert" and event_name != "ticket":
-        return {
-            'statusCode': 404,
-            'body': json.dumps('Something happened')
-        }
-    conn = connect_to_db()
 
-    if event_name == "ticket":
-        print(">> ticket event")
-        ticket_info = get_ticket_info(_id, conn)
-        handler_ticket(ticket_info, conn)
-        conn.close()
+def render_concert(concert_id, conn):
+    global pre_data
+    concert_info = get_concert_info(concert_id, conn)
+    # copy concert_info to pre_data
+    pre_data = concert_info.copy()
+    print(">> pre_data:")
+    print(pre_data)
+    # get svg_seat_num from concerts table, only one value will be fetch
+    cur = conn.cursor()
+    cur.execute(f"SELECT svg_seat_num FROM concerts WHERE id = '{concert_id}'")
+    svg_seat_num = cur.fetchone()[0]
+    # if svg_seat_num is none, keep it. else concert it to int
+    if svg_seat_num is not None:
+        svg_seat_num = int(svg_seat_num)
+    # if the svg_seat_num is not None, generate pic
+    if svg_seat_num is None:
+        print(">> svg_seat_num is None, continue processing ")
+        return handler_seating(concert_info, conn)
+    # if the svg_Seat_num is greater than purchased_count, return 400
+    if svg_seat_num > concert_info["seats"]["purchased"]:
+        print(f">> abort: svg_seat_num = {svg_seat_num} > purchased_count = {concert_info['seats']['purchased']}")
         return {
-            'statusCode': 200,
-            'body': json.dumps(ticket_info)
-        }
-    elif event_name == "concert":
-        print(">> concert event")
-        concert_info = get_concert_info(_id, conn)
-        # copy concert_info to pre_data
-        pre_data = concert_info.copy()
-        print(">> pre_data:")
-        print(pre_data)
-        # get svg_seat_num from concerts table, only one value will be fetch
-        cur = conn.cursor()
-        cur.execute(f"SELECT svg_seat_num FROM concerts WHERE id = '{_id}'")
-        svg_seat_num = cur.fetchone()[0]
-        # if svg_seat_num is none, keep it. else concert it to int
-        if svg_seat_num is not None:
-            svg_seat_num = int(svg_seat_num)
-        # if the svg_seat_num is not None, generate pic
-        if svg_seat_num is None:
-            print(">> svg_seat_num is None, continue processing ")
-            return handler_seating(concert_info, conn)
-            # if the svg_Seat_num is greater than purchased_count, return 400
-        if svg_seat_num > concert_info["seats"]["purchased"]:
-            print(f">> abort: svg_seat_num = {svg_seat_num} > purchased_count = {concert_info['seats']['purchased']}")
-            return {
-                'statusCode': 400,
-                'body': json.dumps({"error": "Invalid seating"}),
-                'headers': {
-                    'Content-Type': 'application/json'
-                }
+            'statusCode': 400,
+            'body': json.dumps({"error": "Invalid seating"}),
+            'headers': {
+                'Content-Type': 'application/json'
             }
-        res = handler_seating(concert_info, conn)
-        conn.close()
-        return res
-
-    conn.close()
-    return {
-        'statusCode': 404,
-        'body': json.dumps({"error": f"Invalid UUID"}),
-        'headers': {
-            'Content-Type': 'application/json'
         }
+    return handler_seating(concert_info, conn)
+
+
+RENDERERS = {
+    "ticket": render_ticket,
+    "concert": render_concert,
+}
+
+
+def group_records(records):
+    """
+    Group the SQS records of a batch by event type and id: {event: {id: [messageId, ...]}}.
+    A concert queued several times in one batch is rendered once, the render reads the latest
+    seat count anyway. Records that are not a known event are dropped, retrying cannot fix them.
+    """
+    groups = {event_name: {} for event_name in RENDERERS}
+    for record in records:
+        try:
+            body = json.loads(record["body"])
+            event_name, _id = body["event"], body["id"]
+        except (ValueError, KeyError, TypeError):
+            print(f">> drop malformed record {record.get('messageId')}: {record.get('body')}")
+            continue
+        if event_name not in groups:
+            print(f">> drop unknown event {event_name} of record {record.get('messageId')}")
+            continue
+        groups[event_name].setdefault(_id, []).append(record["messageId"])
+    return groups
+
+
+# each record body is {"event": "ticket" | "concert", "id": "[UUID]"}
+def lambda_handler(event, context):
+    """
+    Render every record of the SQS batch over the connection kept across warm invocations. Records
+    whose render fails are reported in batchItemFailures (ReportBatchItemFailures), so SQS only
+    redelivers those.
+    """
+    records = event['Records']
+    print(f">> batch of {len(records)} records")
+    groups = group_records(records)
+
+    failures = []
+    renders = 0
+    conn = get_connection()
+    for event_name, ids in groups.items():
+        for _id, message_ids in ids.items():
+            print(f">> {event_name} event {_id}, {len(message_ids)} record(s)")
+            try:
+                RENDERERS[event_name](_id, conn)
+                renders += 1
+            except Exception as e:
+                print(f">> {event_name} {_id} failed: {e}")
+                failures.extend(message_ids)
+            finally:
+                conn = end_transaction(conn)
+
+    print(f">> {renders} render(s) for {len(records)} records, {len(failures)} failed")
+    return {
+        "batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]
     }
@@ -0,0 +1,247 @@
+"""
+Render engines turning a ticket or seating input into an SVG.
+
+OneShotEngine is the original way of running Hamilton: write the input to a file, start the binary
+and read the SVG it wrote. PipeEngine starts it the same way but without files: the input goes to
+its stdin and the SVG comes back over a pipe. Hamilton v1.1.0 is a one-shot CLI, it cannot be kept
+alive across renders, so a process per render remains.
+
+NativeTicketEngine renders tickets in process from its own template. It is a different ticket
+design than Hamilton's, only the SVG preamble is the same; choose it when a ticket does not have to
+look like Hamilton's. The engine is chosen per event kind, see from_environ.
+"""
+import json
+import os
+import string
+import subprocess
+from xml.sax.saxutils import escape
+
+
+def exec_hamilton(argv, **kwargs):
+    """
+    Run Hamilton with the argument list argv, without a shell.
+    """
+    print(">> start exec hamilton")
+    try:
+        output = subprocess.check_output(argv, stderr=subprocess.STDOUT, **kwargs)
+        print(">> Output:", output.decode('utf-8'))
+    except subprocess.CalledProcessError as e:
+        print(">> Error output:", e.output.decode('utf-8'))
+        raise e
+
+    print(">> hamilton finished")
+
+
+class RenderError(Exception):
+    pass
+
+
+class OneShotEngine:
+    """
+    One Hamilton process per render, input and output through files in work_dir.
+    """
+    name = "oneshot"
+
+    def __init__(self, hamilton_path, work_dir="/tmp"):
+        self.hamilton_path = hamilton_path
+        self.work_dir = work_dir
+
+    def render(self, kind, render_input):
+        input_path = f"{self.work_dir}/{render_input['id']}.json"
+        output_path = f"{self.work_dir}/{render_input['id']}"
+        print(f">> input path: {input_path}")
+        print(f">> output path: {output_path}")
+
+        # dump input to file
+        with open(input_path, "w") as f:
+            json.dump(render_input, f)
+
+        exec_hamilton([self.hamilton_path, "generate", kind, "--input", input_path, "--output", output_path])
+
+        with open(f"{output_path}.svg", "r") as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+
+class PipeEngine:
+    """
+    One Hamilton process per render without temporary files: the input is written to its stdin
+    (--input /dev/stdin) and the SVG read from a pipe. Hamilton appends .svg to --output, so the
+    output path is a symlink kept in work_dir, hamilton-fd<N>.svg -> /dev/fd/<N>, which the process
+    resolves to the write end of the pipe it inherits as fd N.
+
+    Renders go to `fallback` for good once a render fails through the pipes and succeeds through it,
+    e.g. with a Hamilton build that only reads and writes regular files.
+    """
+    name = "pipe"
+
+    def __init__(self, hamilton_path, fallback, work_dir="/tmp"):
+        self.hamilton_path = hamilton_path
+        self.fallback = fallback
+        self.work_dir = work_dir
+        self.unavailable = False
+        self._links = set()
+
+    def _output_path(self, fd):
+        """
+        --output for a pipe inherited as fd, its symlink created on first use.
+        """
+        path = os.path.join(self.work_dir, f"hamilton-fd{fd}")
+        if fd not in self._links:
+            target = f"/dev/fd/{fd}"
+            link = f"{path}.svg"
+            if not (os.path.islink(link) and os.readlink(link) == target):
+                if os.path.lexists(link):
+                    os.remove(link)
+                os.symlink(target, link)
+            self._links.add(fd)
+        return path
+
+    def _render(self, kind, render_input):
+        read_fd, write_fd = os.pipe()
+        with open(read_fd, "rb") as output:
+            try:
+                argv = [self.hamilton_path, "generate", kind, "--input", "/dev/stdin",
+                        "--output", self._output_path(write_fd)]
+                # Hamilton's own output goes to the lambda's log, the SVG only through the pipe
+                process = subprocess.Popen(argv, stdin=subprocess.PIPE, pass_fds=(write_fd,))
+            finally:
+                os.close(write_fd)
+            with process:
+                # the input is far below the pipe buffer, writing it cannot wait for Hamilton to read
+                process.stdin.write(json.dumps(render_input).encode())
+                process.stdin.close()
+                svg = output.read().decode()
+            if process.returncode != 0:
+                raise RenderError(f"hamilton exited with {process.returncode}")
+        if "<svg" not in svg:
+            raise RenderError(f"hamilton wrote no svg to the pipe: {svg[:200]!r}")
+        return svg
+
+    def render(self, kind, render_input):
+        if self.unavailable:
+            return self.fallback.render(kind, render_input)
+        try:
+            return self._render(kind, render_input)
+        except (RenderError, OSError) as e:
+            print(f">> piped render of {kind} {render_input.get('id')} failed, rendering through files: {e}")
+            error = e
+        svg = self.fallback.render(kind, render_input)
+        # the input is fine, the pipes are what this Hamilton cannot use
+        print(f">> rendering through files from now on: {error}")
+        self.unavailable = True
+        return svg
+
+    def close(self):
+        pass
+
+
+# The native ticket design. Its header, desc and background lines are those of the seating plans
+# Hamilton draws with SVGo; the layout below them is not a copy of Hamilton's ticket.
+TICKET_TEMPLATE = """<?xml version="1.0"?>
+<!-- Generated by SVGo -->
+<svg width="1200" height="400"
+     xmlns="http://www.w3.org/2000/svg"
+     xmlns:xlink="http://www.w3.org/1999/xlink">
+<desc>{id}</desc>
+<rect x="0" y="0" width="1200" height="400" style="fill:rgb(255,255,255)" />
+<text x="600" y="100" style="text-anchor:middle;font-size:36px;fill:black" >{concert_name}</text>
+<text x="600" y="150" style="text-anchor:middle;font-size:24px;fill:black" >{concert_venue}</text>
+<text x="600" y="190" style="text-anchor:middle;font-size:24px;fill:black" >{concert_date}</text>
+<line x1="300" y1="210" x2="900" y2="210" style="stroke:rgb(0,0,0);stroke-width:2" />
+<text x="600" y="260" style="text-anchor:middle;font-size:24px;fill:black" >{name}</text>
+<text x="600" y="300" style="text-anchor:middle;font-size:18px;fill:black" >{email}</text>
+<text x="600" y="360" style="text-anchor:middle;font-size:14px;fill:gray" >{id}</text>
+</svg>
+"""
+
+# quotes are escaped too, the lambda still writes the svg into its UPDATE statement as a literal
+XML_ENTITIES = {"'": "&apos;", '"': "&quot;"}
+
+
+class NativeTicketEngine:
+    """
+    Renders tickets without Hamilton. The template is split into literals and fields once, a
+    render only escapes the fields and joins the pieces.
+    """
+    name = "native"
+
+    def __init__(self, template=TICKET_TEMPLATE):
+        self.pieces = [(literal, field) for literal, field, _, _ in string.Formatter().parse(template)]
+
+    def render(self, kind, render_input):
+        if kind != "ticket":
+            raise RenderError(f"the native engine does not render {kind}")
+        concert = render_input["concert"]
+        fields = {
+            "id": render_input["id"],
+            "name": render_input["name"],
+            "email": render_input["email"],
+            "concert_name": concert["name"],
+            "concert_venue": concert["venue"],
+            "concert_date": concert["date"],
+        }
+        fields = {key: escape(str(value), XML_ENTITIES) for key, value in fields.items()}
+        return "".join(literal + (fields[field] if field else "") for literal, field in self.pieces)
+
+    def close(self):
+        pass
+
+
+class EngineByKind:
+    """
+    Dispatches each render to the engine configured for its kind.
+    """
+
+    def __init__(self, engines):
+        self.engines = engines
+
+    @property
+    def name(self):
+        return ",".join(f"{kind}={engine.name}" for kind, engine in self.engines.items())
+
+    def render(self, kind, render_input):
+        return self.engines[kind].render(kind, render_input)
+
+    def close(self):
+        for engine in set(self.engines.values()):
+            engine.close()
+
+
+# event kinds Hamilton renders, and the engines that can render them
+KINDS = ("ticket", "seating")
+ENGINES = {"oneshot": KINDS, "pipe": KINDS, "native": ("ticket",)}
+
+
+def create_engine(name, hamilton_path, work_dir="/tmp"):
+    """
+    One engine: "oneshot", "pipe" (falling back to oneshot) or "native" (tickets only).
+    """
+    if name == "native":
+        return NativeTicketEngine()
+    one_shot = OneShotEngine(hamilton_path, work_dir)
+    if name == "oneshot":
+        return one_shot
+    if name == "pipe":
+        return PipeEngine(hamilton_path, one_shot, work_dir)
+    raise ValueError(f"unknown render engine {name!r}")
+
+
+def from_environ(hamilton_path, work_dir="/tmp"):
+    """
+    RENDER_ENGINE picks the engine of every kind (default "pipe"), RENDER_ENGINE_TICKET and
+    RENDER_ENGINE_SEATING override it per kind. Kinds configured with the same engine share it.
+    """
+    default = os.environ.get("RENDER_ENGINE", "pipe")
+    created = {}
+    engines = {}
+    for kind in KINDS:
+        name = os.environ.get(f"RENDER_ENGINE_{kind.upper()}", default)
+        if kind not in ENGINES.get(name, KINDS):
+            raise ValueError(f"render engine {name!r} cannot render {kind}")
+        if name not in created:
+            created[name] = create_engine(name, hamilton_path, work_dir)
+        engines[kind] = created[name]
+    return EngineByKind(engines)
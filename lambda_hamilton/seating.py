@@ -0,0 +1,111 @@
+"""
+Incremental updates of Hamilton seating plans.
+
+Hamilton draws one `<rect ... width="20" height="20" />` line per seat and fills the first
+`purchased` of them, in document order, with SOLD_STYLE. The layout only depends on the concert
+(name, venue, capacity), so once a plan was drawn, selling more seats only restyles the next
+rects and rewrites the `<desc>id|max|purchased</desc>`.
+
+SeatMap keeps a parsed plan as lines; `sell` touches the delta of newly sold seats only. The maps of
+recently rendered concerts stay in memory across warm invocations, keyed by concert id and checked
+against the svg_hash the database keeps for the stored plan (md5, like `digest`), so a plan replaced
+elsewhere is parsed again.
+"""
+import collections
+import hashlib
+import re
+
+SOLD_STYLE = ' style="fill:rgb(50,98,115);" />'
+SEAT = re.compile(r'^<rect x="\d+" y="\d+" width="20" height="20"( style="[^"]*")? />$')
+DESC = re.compile(r"^<desc>([^|<]+)\|(\d+)\|(\d+)</desc>$")
+
+# seat maps kept across warm invocations
+CACHE_SIZE = 64
+
+
+def digest(svg):
+    return hashlib.md5(svg.encode("utf-8")).hexdigest()
+
+
+class SeatMap:
+    def __init__(self, head, desc_index, seats, tail, concert_id, max_seats, purchased):
+        self.head = head
+        self.desc_index = desc_index
+        self.seats = seats
+        self.tail = tail
+        self.concert_id = concert_id
+        self.max_seats = max_seats
+        self.purchased = purchased
+        self.digest = None
+
+    @classmethod
+    def parse(cls, svg):
+        """
+        SeatMap of a plan drawn by Hamilton, None if the plan does not have the expected shape.
+        """
+        lines = svg.split("\n")
+        desc_index = next((i for i, line in enumerate(lines) if DESC.match(line)), None)
+        if desc_index is None:
+            return None
+        concert_id, max_seats, purchased = DESC.match(lines[desc_index]).groups()
+        max_seats, purchased = int(max_seats), int(purchased)
+
+        # seats follow the </style> of the stylesheet, the plan ends with </svg>
+        try:
+            start = lines.index("</style>", desc_index) + 1
+        except ValueError:
+            return None
+        end = start
+        while end < len(lines) and SEAT.match(lines[end]):
+            end += 1
+        seats = lines[start:end]
+        sold = [seat.endswith(SOLD_STYLE) if i < purchased else " style=" not in seat
+                for i, seat in enumerate(seats)]
+        if len(seats) != max_seats or not all(sold):
+            return None
+
+        seat_map = cls(lines[:start], desc_index, seats, lines[end:], concert_id, max_seats, purchased)
+        seat_map.digest = digest(svg)
+        return seat_map
+
+    def sell(self, purchased):
+        """
+        Mark seats up to `purchased` as sold, only the ones sold since the last call are touched.
+        """
+        if purchased < self.purchased or purchased > self.max_seats:
+            raise ValueError(f"cannot go from {self.purchased} to {purchased} of {self.max_seats} seats")
+        for i in range(self.purchased, purchased):
+            self.seats[i] = self.seats[i][:-len(" />")] + SOLD_STYLE
+        self.purchased = purchased
+        self.head[self.desc_index] = f"<desc>{self.concert_id}|{self.max_seats}|{purchased}</desc>"
+
+    def render(self):
+        svg = "\n".join(self.head + self.seats + self.tail)
+        self.digest = digest(svg)
+        return svg
+
+
+class SeatMapCache:
+    """
+    Least recently used seat maps by concert id.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.maps = collections.OrderedDict()
+
+    def get(self, concert_id, stored_digest):
+        seat_map = self.maps.get(concert_id)
+        if seat_map is None or seat_map.digest != stored_digest:
+            return None
+        self.maps.move_to_end(concert_id)
+        return seat_map
+
+    def put(self, seat_map):
+        self.maps[seat_map.concert_id] = seat_map
+        self.maps.move_to_end(seat_map.concert_id)
+        while len(self.maps) > self.size:
+            self.maps.popitem(last=False)
+
+    def discard(self, concert_id):
+        self.maps.pop(concert_id, None)
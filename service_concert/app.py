@@ -1,10 +1,41 @@
 from os import environ
 from flask import Flask
-from views.routers import concerts_blueprint
-from models import db
+from sqlalchemy import inspect, text
+from views.routers import concerts_blueprint, concert_keys
+from models import db, SCHEMA_VERSION
+from outbox import OutboxRelay
+from blob_cache import BlobCache
+from single_flight import SingleFlight
+from invalidation import ConcertListener, INVALIDATION_MODES
+import sqs_client
+import db_pool
 import logging
 
 
+SCHEMA_MODES = ("check", "skip")
+
+
+def prepare_schema(app):
+    """
+    Apply the SCHEMA_MODE startup policy. Workers never run DDL, the schema is
+    migrated once per deploy by terraform/database/migrate.py.
+    check: fail fast unless the database is migrated to the SCHEMA_VERSION of the models.
+    skip: do not touch the database at startup.
+    """
+    mode = app.config['SCHEMA_MODE']
+    if mode not in SCHEMA_MODES:
+        raise ValueError(f"Unknown SCHEMA_MODE {mode!r}, expected one of {', '.join(SCHEMA_MODES)}")
+
+    if mode == "check":
+        if not inspect(db.engine).has_table("schema_migrations"):
+            raise RuntimeError("Database is not migrated, run terraform/database/migrate.py first")
+        version = db.session.execute(text("SELECT max(version) FROM schema_migrations")).scalar()
+        db.session.commit()
+        if version is None or version < SCHEMA_VERSION:
+            raise RuntimeError(f"Database schema version {version} is older than {SCHEMA_VERSION}, "
+                               f"run terraform/database/migrate.py first")
+
+
 def create_app(config_overrides=None):
     app = Flask(__name__)
 
@@ -17,36 +48,66 @@ def create_app(config_overrides=None):
     app.config['SERVICE_TICKET_URL'] = environ.get("SERVICE_TICKET_URL")
     app.config['SERVICE_HAMILTON_URL'] = environ.get("SERVICE_HAMILTON_URL")
     app.config['SQS_QUEUE_URL'] = environ.get("SQS_QUEUE_URL")
+    app.config['OUTBOX_POLL_INTERVAL'] = float(environ.get("OUTBOX_POLL_INTERVAL", 0.5))
+    app.config['SQS_MAX_POOL_CONNECTIONS'] = int(environ.get("SQS_MAX_POOL_CONNECTIONS", 10))
+    app.config['SVG_CACHE_BYTES'] = int(environ.get("SVG_CACHE_BYTES", 32 * 1024 * 1024))
+    # Seconds a worker keeps a concert it read for GET /concerts/<id> and /seats, 0 only coalesces reads.
+    app.config['CONCERT_CACHE_TTL'] = float(environ.get("CONCERT_CACHE_TTL", 1.0))
+    app.config['CONCERT_CACHE_SIZE'] = int(environ.get("CONCERT_CACHE_SIZE", 10000))
+    # How a worker learns of concerts changed by other processes: listen or none (the TTL only).
+    app.config['CONCERT_INVALIDATION'] = environ.get("CONCERT_INVALIDATION", "listen")
+    # Rows per page of the list endpoints, 0 lists everything unless a request asks for a limit.
+    app.config['LIST_PAGE_SIZE'] = int(environ.get("LIST_PAGE_SIZE", 0))
+    app.config['LIST_MAX_PAGE_SIZE'] = int(environ.get("LIST_MAX_PAGE_SIZE", 1000))
 
     app.config['SQLALCHEMY_DATABASE_URI'] = environ.get("SQLALCHEMY_DATABASE_URI")
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-        'pool_size': 1,
-        'pool_recycle': 30,
-        'max_overflow': 1
-    }
+    # How the worker treats the schema at startup: check or skip.
+    app.config['SCHEMA_MODE'] = environ.get("SCHEMA_MODE", "check")
+    # sized for the request threads of a worker, plus the outbox relay when it runs
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_pool.engine_options(
+        background_threads=1 if app.config['SQS_QUEUE_URL'] else 0)
 
     if config_overrides:
         app.config.update(config_overrides)
+    if app.config['CONCERT_INVALIDATION'] not in INVALIDATION_MODES:
+        raise ValueError(f"Unknown CONCERT_INVALIDATION {app.config['CONCERT_INVALIDATION']!r}, "
+                         f"expected one of {', '.join(INVALIDATION_MODES)}")
 
     # Initialize the database
     db.init_app(app)
 
-    # Create the database tables.
+    # Prepare the database schema once, when the worker starts.
     with app.app_context():
-        db.create_all()
-        db.session.commit()
+        prepare_schema(app)
+
+    # Render requests are written to the outbox table and sent to SQS by a background thread of the worker
+    if app.config['SQS_QUEUE_URL']:
+        with app.app_context():
+            app.extensions['outbox_relay'] = OutboxRelay(
+                db.engine, app.config['SQS_QUEUE_URL'], app.logger,
+                client_factory=lambda: sqs_client.get_client(app.config['SQS_MAX_POOL_CONNECTIONS']),
+                poll_interval=app.config['OUTBOX_POLL_INTERVAL']).start()
+
+    # Rendered seating plans by content hash, bounded per worker
+    app.extensions['svg_cache'] = BlobCache(app.config['SVG_CACHE_BYTES'])
+    # Concurrent identical concert reads of a worker share one query
+    concert_reads = app.extensions['concert_reads'] = SingleFlight(
+        "concert_reads", app.config['CONCERT_CACHE_TTL'], app.config['CONCERT_CACHE_SIZE'])
+
+    # Concerts changed by other workers, the ticket service or the lambda are evicted when postgres announces them
+    if app.config['CONCERT_INVALIDATION'] == "listen":
+        with app.app_context():
+            app.extensions['concert_listener'] = ConcertListener(
+                db.engine, app.logger,
+                on_change=lambda concert_id: concert_reads.forget(*concert_keys(concert_id)),
+                on_reset=concert_reads.clear).start()
 
     # Register the blueprint
     app.register_blueprint(concerts_blueprint, url_prefix='/api/v1')
     return app
 
 
-def wsgi_app(environ, start_response):
-    app = create_app()
-    return app(environ, start_response)
-
-
 if __name__ == '__main__':
     # Override the SQLALCHEMY_DATABASE_URI configuration for the development environment.
     config_overrides = {}
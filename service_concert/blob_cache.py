@@ -0,0 +1,72 @@
+import collections
+import gzip
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional, responses are gzip or identity encoded without it
+    brotli = None
+
+from metrics import metrics
+
+# Content-Encodings a blob is stored in, in order of preference
+ENCODINGS = ("br", "gzip", "identity") if brotli else ("gzip", "identity")
+
+
+class Blob:
+    """
+    One rendered document under its content hash, with every encoding precomputed.
+    """
+    __slots__ = ("digest", "variants", "size")
+
+    def __init__(self, digest, content):
+        self.digest = digest
+        identity = content.encode("utf-8")
+        self.variants = {"identity": identity, "gzip": gzip.compress(identity, mtime=0)}
+        if brotli:
+            self.variants["br"] = brotli.compress(identity)
+        self.size = sum(len(variant) for variant in self.variants.values())
+
+
+def etag(digest, encoding):
+    """
+    Strong ETag of one encoding of a blob, the encodings are different representations.
+    """
+    return digest if encoding == "identity" else f"{digest}-{encoding}"
+
+
+class BlobCache:
+    """
+    Blobs by content hash, least recently used first out once their total size passes max_bytes.
+    Shared by the threads of a worker.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._blobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            blob = self._blobs.get(digest)
+            if blob is not None:
+                self._blobs.move_to_end(digest)
+        metrics.incr("blob_cache.hit" if blob is not None else "blob_cache.miss")
+        return blob
+
+    def put(self, digest, content):
+        blob = Blob(digest, content)
+        if blob.size > self.max_bytes:
+            return blob
+        with self._lock:
+            if digest not in self._blobs:
+                self._blobs[digest] = blob
+                self.size += blob.size
+            while self.size > self.max_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self.size -= evicted.size
+        return blob
+
+    def __len__(self):
+        return len(self._blobs)
@@ -0,0 +1,42 @@
+import time
+from os import environ
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from metrics import metrics
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool reporting how long each checkout waited for a connection (db.pool.checkout_wait,
+    including opening a new one) and how often it gave up after pool_timeout (db.pool.timeout).
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.incr("db.pool.timeout")
+            raise
+        finally:
+            metrics.observe("db.pool.checkout_wait", time.perf_counter() - started)
+
+
+def engine_options(background_threads=0):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS of a worker. Each of its GUNICORN_THREADS request threads, plus
+    background_threads (the outbox relay), holds at most one connection at a time, so that is the
+    pool size; DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and DB_POOL_RECYCLE override it.
+    Connections are checked with a ping when they are taken from the pool.
+    """
+    threads = int(environ.get("GUNICORN_THREADS", 1))
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(environ.get("DB_POOL_SIZE", threads + background_threads)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 1)),
+        "pool_timeout": float(environ.get("DB_POOL_TIMEOUT", 10)),
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
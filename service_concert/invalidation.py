@@ -0,0 +1,93 @@
+"""
+Eviction of cached concerts across workers. Postgres announces every committed change of a concert
+on the concert_changed channel (migration 0008), whichever service or lambda made it. Each worker
+keeps one connection LISTENing to it and evicts the concerts it is told about, so its caches stay
+current within the time a notification takes instead of their TTL.
+
+Notifications sent while a worker is not listening are lost, so a worker drops its whole cache each
+time it (re)connects.
+"""
+import select
+import threading
+
+from metrics import metrics
+
+CHANNEL = "concert_changed"
+INVALIDATION_MODES = ("listen", "none")
+# longest wait between attempts to connect, the wait doubles from reconnect_delay while they fail
+MAX_RECONNECT_DELAY = 30.0
+
+
+class ConcertListener:
+    """
+    Calls on_change(concert_id) from a background thread of the worker for each concert_changed
+    notification, and on_reset() whenever it starts listening. The connection is opened from engine
+    and detached from its pool, the request threads keep every pooled connection.
+    """
+
+    def __init__(self, engine, logger, on_change, on_reset, poll_interval=1.0, ping_interval=30.0,
+                 reconnect_delay=1.0):
+        self.engine = engine
+        self.logger = logger
+        self.on_change = on_change
+        self.on_reset = on_reset
+        self.poll_interval = poll_interval
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.listening = threading.Event()
+        self._failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="concert-listener", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                metrics.incr("concert_listener.error")
+                self.logger.error(f"Concert listener failed: {e}")
+            self._failures += 1
+            self._stop.wait(min(self.reconnect_delay * 2 ** (self._failures - 1), MAX_RECONNECT_DELAY))
+
+    def _listen(self):
+        connection = self.engine.raw_connection()
+        conn = connection.driver_connection
+        connection.detach()
+        try:
+            conn.rollback()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            self.on_reset()
+            self.listening.set()
+            self._failures = 0
+
+            idle = 0.0
+            while not self._stop.is_set():
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    # a connection that died silently only shows when it is used
+                    idle += self.poll_interval
+                    if idle >= self.ping_interval:
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT 1")
+                        idle = 0.0
+                    continue
+                idle = 0.0
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    metrics.incr("concert_listener.notify")
+                    self.on_change(notify.payload)
+        finally:
+            self.listening.clear()
+            connection.close()
@@ -0,0 +1,49 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Process wide counters and timers, reported by the /metrics endpoint of the service.
+    Each gunicorn worker has its own numbers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timers = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timer = self._timers.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            timer["count"] += 1
+            timer["total_ms"] += seconds * 1000
+            timer["max_ms"] = max(timer["max_ms"], seconds * 1000)
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "timers": {name: dict(timer) for name, timer in self._timers.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+
+
+metrics = Metrics()
@@ -1,2 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
+
+# Latest migration in terraform/database/migrations the models rely on.
+SCHEMA_VERSION = 8
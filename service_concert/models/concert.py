@@ -9,23 +9,23 @@ class Concert(db.Model):
     date = db.Column(db.String, nullable=False)
     capacity = db.Column(db.Integer, nullable=False)
     status = db.Column(db.String, nullable=False)
-    svg = db.Column(db.String, nullable=True)
+    # rendered seating plan, loaded only where it is served (GET /concerts/<id>/seats) with undefer
+    svg = db.deferred(db.Column(db.String, nullable=True), raiseload=True)
     svg_seat_num = db.Column(db.Integer, nullable=True)
+    # md5 of svg, kept by a trigger (0006_concert_svg_hash.sql)
+    svg_hash = db.Column(db.String(32), nullable=True)
+    # maintained by the ticket service when a seat is reserved, see create_ticket
+    tickets_sold = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     def to_dict(self, exclude_fields=[]):
-        concert_dict = {
-            "id": self.id,
-            "name": self.name,
-            "venue": self.venue,
-            "date": self.date,
-            "capacity": self.capacity,
-            "status": self.status,
-            "svg": self.svg if self.svg else None,
-            "svg_seat_num": self.svg_seat_num if self.svg_seat_num else None,
-        }
-
-        for field in exclude_fields:
-            if field in concert_dict:
-                del concert_dict[field]
+        # excluded fields are never read, svg is not loaded unless asked for
+        fields = ("id", "name", "venue", "date", "capacity", "status", "svg", "svg_seat_num")
+        concert_dict = {}
+        for field in fields:
+            if field not in exclude_fields:
+                concert_dict[field] = getattr(self, field)
+        for field in ("svg", "svg_seat_num"):
+            if field in concert_dict and not concert_dict[field]:
+                concert_dict[field] = None
 
         return concert_dict
@@ -0,0 +1,50 @@
+import datetime
+import json
+
+from sqlalchemy.dialects.postgresql import insert
+
+from . import db
+
+
+class OutboxMessage(db.Model):
+    """
+    A Hamilton render request waiting to be sent to SQS, see outbox.OutboxRelay.
+    """
+    __tablename__ = "outbox"
+    id = db.Column(db.BigInteger, primary_key=True)
+    body = db.Column(db.String, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    # at most one pending message per dedup_key, see 0005_outbox_coalescing.sql
+    dedup_key = db.Column(db.String, nullable=True, unique=True)
+    available_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    coalesced = db.Column(db.Integer, nullable=False, server_default="0")
+
+    @staticmethod
+    def dedup_key_for(event, _id):
+        """
+        Seating plan renders of a concert are coalesced, ticket renders are not.
+        """
+        return f"concert:{_id}" if event == "concert" else None
+
+    @classmethod
+    def render_request(cls, event, _id, delay=0):
+        """
+        INSERT statement queuing the message for the lambda_hamilton handler, e.g.
+        db.session.execute(OutboxMessage.render_request("ticket", ticket_id)).
+        Execute it in the transaction that changes the ticket or concert so both commit together.
+        A seating plan request waits `delay` seconds and merges with one already pending for the concert.
+        """
+        statement = insert(cls).values(
+            body=json.dumps({"event": event, "id": str(_id)}),
+            dedup_key=cls.dedup_key_for(event, _id),
+            available_at=db.func.now() + datetime.timedelta(seconds=delay),
+        )
+        if event != "concert":
+            return statement
+        return statement.on_conflict_do_update(
+            index_elements=[cls.dedup_key],
+            set_={
+                "coalesced": cls.coalesced + 1,
+                "available_at": db.func.least(cls.available_at, statement.excluded.available_at),
+            },
+        )
@@ -0,0 +1,106 @@
+"""
+Single-flight reads of hot concerts. When thousands of clients ask a worker for the same concert at
+once (presale, evening), the first request loads it and the concurrent identical ones wait for that
+load instead of sending their own query. The result is then kept for a short TTL, so the requests
+right behind the burst are answered from memory too.
+
+`forget` drops a key as soon as the concert changes: ConcertListener (invalidation.py) calls it for
+every concert_changed notification, whichever worker, service or lambda made the change. The TTL
+only bounds staleness when that is off (CONCERT_INVALIDATION=none) or while the listener is
+disconnected.
+"""
+import collections
+import threading
+import time
+
+from metrics import metrics
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Results of load() by key, shared by the threads of a worker: one load per key at a time, its
+    result (or exception) handed to every caller that came in meanwhile and kept for ttl seconds
+    (0 only coalesces). At most max_entries results are kept, least recently used first out.
+
+    Reports <name>.load, <name>.coalesced (callers that waited for another one's load) and
+    <name>.hit (answered from the kept results) to the metrics.
+    """
+
+    def __init__(self, name, ttl, max_entries, clock=time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._results = collections.OrderedDict()
+        self._calls = {}
+        # bumped by forget, a load that started before is not kept
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def do(self, key, load):
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self._results.move_to_end(key)
+                    metrics.incr(f"{self.name}.hit")
+                    return value
+                del self._results[key]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                generation = self._generation
+
+        if not leader:
+            metrics.incr(f"{self.name}.coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        metrics.incr(f"{self.name}.load")
+        try:
+            call.value = load()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                if call.error is None and self.ttl > 0 and generation == self._generation:
+                    self._results[key] = (self.clock() + self.ttl, call.value)
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            call.done.set()
+        return call.value
+
+    def forget(self, *keys):
+        """
+        Drop the results of keys, and detach loads in flight so later callers load again.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._results.pop(key, None)
+                self._calls.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._results.clear()
+            self._calls.clear()
+
+    def __len__(self):
+        return len(self._results)
@@ -1,12 +1,13 @@
-import json
-
 from flask import Blueprint, jsonify, current_app, request, abort, Response, make_response
 from models.concert import Concert
 from models.ticket import Ticket
+from models.outbox import OutboxMessage
 from models import db
+from metrics import metrics
+from blob_cache import ENCODINGS, etag
+from pagination import Page, PageError
 import uuid
 import datetime
-import boto3
 
 concerts_blueprint = Blueprint("concerts", __name__)
 
@@ -27,17 +28,35 @@ def health_check():
         return jsonify({"error": "Service is not healthy."}), 503
 
 
+@concerts_blueprint.route("/concerts/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Counters and timings of this worker, e.g. time spent building the SQS client and sending to it.
+    """
+    return jsonify(metrics.snapshot()), 200
+
+
 @concerts_blueprint.route("/concerts", methods=["GET"])
 def get_all_concerts():
-    concerts = Concert.query.all()
-    concerts_list = [concert.to_dict() for concert in concerts]
+    try:
+        page = Page.from_request()
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
+    if page:
+        concerts, next_cursor = page.rows(Concert.query, Concert.id)
+    else:
+        concerts, next_cursor = Concert.query.all(), None
+    concerts_list = [concert.to_dict(exclude_fields=["svg"]) for concert in concerts]
     allowed_fields = {"id", "name", "venue", "date", "capacity", "status"}
     # only allowed_fields can be returned
     filtered_concerts_list = [
         {key: concert[key] for key in concert.keys() if key in allowed_fields}
         for concert in concerts_list
     ]
-    return jsonify(filtered_concerts_list), 200
+    response = jsonify(filtered_concerts_list)
+    if next_cursor:
+        response.headers["Link"] = page.link(next_cursor)
+    return response, 200
 
 
 def valid_date(date):
@@ -105,7 +124,10 @@ def create_concert():
         # current_app.db_concerts.insert_one(concert)
         new_concert = Concert(**concert)
         db.session.add(new_concert)
+        # request  to generate svg, sent by the outbox relay once the concert is committed
+        db.session.execute(OutboxMessage.render_request("concert", concert_id))
         db.session.commit()
+        forget_concert(concert_id)
     except Exception as e:
         current_app.logger.error(f"{e}")
         abort(500, description=f"An unknown error occurred: {e}")
@@ -118,44 +140,9 @@ def create_concert():
         "capacity": concert["capacity"],
         "status": concert["status"],
     }
-    # request  to generate svg
-    request_hamilton(concert_id)
-    # current_app.db_concerts.update_one({"id": concert_id}, {"$set": {"print_status": "PENDING"}})
-    concert = Concert.query.filter_by(id=concert_id).first()
-    db.session.close()
-    if concert:
-        concert.print_status = "PENDING"
-        db.session.commit()
-    # todo: update to db
-
     return jsonify(concert_response), 201
 
 
-def request_hamilton(concert_id):
-    try:
-        # create a boto3 client
-        sqs = boto3.client('sqs')
-        # your queue url
-        queue_url = current_app.config['SQS_QUEUE_URL']
-        # create the message body
-        message_body = {
-            "event": "concert",
-            "id": str(concert_id)
-        }
-        # send the message
-        response = sqs.send_message(
-            QueueUrl=queue_url,
-            MessageBody=json.dumps(message_body),
-        )
-
-        # log the message id
-        current_app.logger.info(f"Message sent to Hamilton queue. Message ID: {response['MessageId']}")
-
-    except Exception as e:
-        current_app.logger.error(f"{e}")
-        abort(500, description=f"An unknown error occurred: {e}")
-
-
 @concerts_blueprint.route("/concerts/<concert_id>", methods=["GET"])
 def get_concert_by_id(concert_id):
     if concert_id == "health":
@@ -168,18 +155,37 @@ def get_concert_by_id(concert_id):
 
     # concert_data = current_app.db_concerts.find_one({"id": concert_id},
     #                                                 projection={"_id": 0, "svg": 0, "print_status": 0})
-    concert = Concert.query.filter_by(id=concert_id).first()
-    db.session.close()
-
-    if concert:
-        concert_data = concert.to_dict(exclude_fields=["svg", "print_status", "svg_seat_num"])
-    else:
-        concert_data = None
+    # concurrent requests for the concert share one query, see single_flight.py
+    concert_reads = current_app.extensions["concert_reads"]
+    concert_data = concert_reads.do(("concert", concert_id), lambda: load_concert(concert_id))
     if not concert_data:
         abort(404, description=f"Concert with id {concert_id} does not exist")
     return jsonify(concert_data), 200
 
 
+def load_concert(concert_id):
+    """
+    The response of GET /concerts/<id>, None when the concert does not exist.
+    """
+    concert = Concert.query.filter_by(id=concert_id).first()
+    db.session.close()
+    return concert.to_dict(exclude_fields=["svg", "print_status", "svg_seat_num"]) if concert else None
+
+
+def concert_keys(concert_id):
+    """
+    Keys of the concert_reads entries of a concert, the plan itself is cached by content hash.
+    """
+    return ("concert", concert_id), ("seats", concert_id)
+
+
+def forget_concert(concert_id):
+    """
+    Drop what this worker keeps of a concert it just changed, before the notification arrives.
+    """
+    current_app.extensions["concert_reads"].forget(*concert_keys(concert_id))
+
+
 @concerts_blueprint.route("/concerts/<string:concert_id>", methods=["PUT"])
 def update_concert(concert_id):
     update_data = request.get_json()
@@ -195,7 +201,7 @@ def update_concert(concert_id):
     # concert_data = current_app.db_concerts.find_one({"id": concert_id})
     concert = Concert.query.filter_by(id=concert_id).first()
     db.session.close()
-    concert_data = concert.to_dict() if concert else None
+    concert_data = concert.to_dict(exclude_fields=["svg"]) if concert else None
 
     if not concert_data:
         abort(404, description=f"Concert with id {concert_id} does not exist")
@@ -227,29 +233,12 @@ def update_concert(concert_id):
         except ValueError:
             return jsonify({"error": "Capacity should be a integer"}), 400
 
-    # Update concert details in the database
-
+    # Update concert details in the database. The new details, the reset of the rendered seating plan and
+    # tickets, and the render request in the outbox are committed in one transaction.
     concert = Concert.query.filter_by(id=concert_id).first()
     for key, value in update_data.items():
         setattr(concert, key, value)
-
-    db.session.commit()
-
-    if concert:
-        concert.svg = None
-        # concert.svg_seat_num = None
-        db.session.commit()
-
-    concert = Concert.query.filter_by(id=concert_id).first()
-    if concert:
-        updated_concert = {attr: getattr(concert, attr) for attr in
-                           ['id', 'name', 'venue', 'date', 'capacity', 'status']}
-    else:
-        updated_concert = None
-
-    # request  to generate svg
-    db.session.commit()
-    request_hamilton(concert_id)
+    concert.svg = None
 
     # update all tickets which concert_id = concert_id status in database by sql-alchemy, set the print_status to
     # "NOT_PRINTED" set svg to None
@@ -257,7 +246,14 @@ def update_concert(concert_id):
         'print_status': 'NOT_PRINTED',
         'svg': None
     })
+
+    # request  to generate svg
+    db.session.execute(OutboxMessage.render_request("concert", concert_id))
+
+    updated_concert = {attr: getattr(concert, attr) for attr in
+                       ['id', 'name', 'venue', 'date', 'capacity', 'status']}
     db.session.commit()
+    forget_concert(concert_id)
 
     return jsonify(updated_concert), 200
 
@@ -266,30 +262,61 @@ def update_concert(concert_id):
 def get_printed_seat(concert_id):
     if valid_uuid(concert_id) is False:
         return jsonify({"error": "Invalid concert id"}), 404
-    concert_data = Concert.query.filter_by(id=concert_id).first()
-    db.session.close()
-    if concert_data:
-        concert_data = concert_data.to_dict()
+    # only the content hash: a conditional request or a cached plan never reads the svg itself.
+    # Concurrent requests for the plan share one query, see single_flight.py
+    concert_reads = current_app.extensions["concert_reads"]
+    concert_data = concert_reads.do(("seats", concert_id),
+                                    lambda: db.session.query(Concert.svg_hash).filter_by(id=concert_id).first())
 
     # if concert does not exist, return 404
     if not concert_data:
+        db.session.close()
         return jsonify({"error": "The concert does not exist."}), 404
 
     # if svg field not exit or is None, return 404
-    if "svg" not in concert_data or concert_data["svg"] is None:
+    digest = concert_data.svg_hash
+    if digest is None:
+        db.session.close()
         return jsonify({"error": "The concert does not have a svg file."}), 404
 
-    # Ensure the SVG data is a bytes object, not a str
-    if isinstance(concert_data["svg"], str):
-        svg_data = concert_data["svg"].encode('utf-8')
-    else:
-        svg_data = concert_data["svg"]
+    encoding = request.accept_encodings.best_match(ENCODINGS, default="identity")
+    if request.if_none_match.contains(etag(digest, encoding)):
+        db.session.close()
+        metrics.incr("seats.not_modified")
+        response = Response(status=304)
+        response.set_etag(etag(digest, encoding))
+        response.vary.add("Accept-Encoding")
+        return response
+
+    svg_cache = current_app.extensions["svg_cache"]
+    blob = svg_cache.get(digest)
+    if blob is None:
+        blob = concert_reads.do(("svg", concert_id, digest), lambda: load_svg(svg_cache, concert_id))
+        if blob is None:
+            db.session.close()
+            return jsonify({"error": "The concert does not have a svg file."}), 404
+    db.session.close()
 
-    response = make_response(svg_data)
+    response = make_response(blob.variants[encoding])
     response.headers.set('Content-Type', 'image/svg+xml')
+    if encoding != "identity":
+        response.headers.set('Content-Encoding', encoding)
+    response.set_etag(etag(blob.digest, encoding))
+    response.vary.add("Accept-Encoding")
     return response
 
 
+def load_svg(svg_cache, concert_id):
+    """
+    The plan of a concert into svg_cache, None if it has none. The hash is read again with the svg,
+    the plan may have been re-rendered since it was looked up.
+    """
+    concert_data = db.session.query(Concert.svg, Concert.svg_hash).filter_by(id=concert_id).first()
+    if not concert_data or concert_data.svg is None:
+        return None
+    return svg_cache.put(concert_data.svg_hash, concert_data.svg)
+
+
 def valid_uuid(uuid_str):
     try:
         uuid.UUID(uuid_str)
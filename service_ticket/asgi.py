@@ -0,0 +1,251 @@
+"""
+ASGI entry point of the ticket service, selected with TICKET_SERVER=asgi:
+
+    gunicorn "asgi:create_app()" -k uvicorn.workers.UvicornWorker
+
+The same /api/v1/tickets routes as app.py, served by Starlette on one event loop per worker with the
+asyncpg driver: a request waiting on postgres gives the loop to the next one instead of holding a
+thread, so a worker keeps many purchases in flight with a handful of connections. The routes share
+the validation, statements and serializers of views/routers.py.
+
+Configuration, the startup schema check and the outbox relay come from the Flask app built by
+app.create_app. Purchases only write their render request to the outbox; the relay thread sends it to
+SQS off the request path, as with the threaded workers.
+"""
+import contextlib
+import traceback
+
+from sqlalchemy import select, type_coerce, update
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import db_pool
+from app import create_app as create_flask_app
+from metrics import metrics
+from models.concert import Concert
+from models.outbox import OutboxMessage
+from models.ticket import Ticket
+from pagination import PAGE_PARAMS, Page, PageError
+from streaming import json_array_chunks
+from views.routers import (PURCHASE_TICKET, TICKET_COLUMNS, purchase_request, ticket_response,
+                           ticket_serializer, valid_uuid)
+
+UNKNOWN_FILTER = {"error": "Unknown identifier provided as filter parameter"}
+
+
+def as_uuid(column):
+    """
+    column compared as a uuid. The models declare the uuid columns as String, which asyncpg would
+    bind as varchar, and postgres has no uuid = varchar operator.
+    """
+    return type_coerce(column, UUID(as_uuid=False)).label(column.key)
+
+
+TICKET_ID = as_uuid(Ticket.id)
+TICKET_FILTERS = {"user_id": as_uuid(Ticket.user_id), "concert_id": as_uuid(Ticket.concert_id)}
+
+
+def json_response(request, content, status_code=200, headers=None):
+    """
+    content encoded like jsonify, with the JSON provider of the Flask app.
+    """
+    body = request.app.state.dumps(content, separators=(",", ":")) + "\n"
+    return Response(body, status_code, headers, media_type="application/json")
+
+
+def is_json(request):
+    mimetype = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    return mimetype == "application/json" or (mimetype.startswith("application/") and mimetype.endswith("+json"))
+
+
+async def get_metrics(request):
+    return json_response(request, metrics.snapshot())
+
+
+async def get_all_tickets(request):
+    args = request.query_params
+    # unknown filter parameters and ids that are not uuids match no ticket
+    if any(param not in {"user_id", "concert_id"} | PAGE_PARAMS for param in args):
+        return json_response(request, UNKNOWN_FILTER, 404)
+    filters = {name: args[name] for name in TICKET_FILTERS if args.get(name)}
+    if not all(valid_uuid(value) for value in filters.values()):
+        return json_response(request, UNKNOWN_FILTER, 404)
+
+    config = request.app.state.config
+    try:
+        page = Page.from_args(args, config)
+    except PageError as e:
+        return json_response(request, {"error": str(e)}, 400)
+
+    statement = select(*TICKET_COLUMNS).where(*(TICKET_FILTERS[name] == value for name, value in filters.items()))
+    to_response = ticket_serializer(config)
+    stream_rows = config["LIST_STREAM_ROWS"]
+    if not page and stream_rows:
+        return await stream_tickets(request, statement.execution_options(yield_per=stream_rows), filters,
+                                    to_response, stream_rows)
+
+    async with request.app.state.sessions() as session:
+        if page:
+            rows = (await session.execute(page.bound(statement, TICKET_ID))).all()
+            tickets, next_cursor = page.split(rows, TICKET_ID)
+        else:
+            tickets, next_cursor = (await session.execute(statement)).all(), None
+    # an unknown filter has no tickets, a page past the last one is just empty
+    if filters and not tickets and not (page and page.after):
+        return json_response(request, UNKNOWN_FILTER, 404)
+
+    headers = {"Link": page.link(next_cursor, request.url.path, args)} if next_cursor else None
+    return json_response(request, list(map(to_response, tickets)), 200, headers)
+
+
+async def stream_tickets(request, statement, filters, to_response, stream_rows):
+    """
+    The whole list from a server side cursor, stream_rows tickets at a time. The session stays open
+    until the response is sent; the first rows are read up front for the 404 of a filter (as a
+    partition: a fetchone before partitions() would drop the rest of the cursor's first fetch).
+    """
+    session = request.app.state.sessions()
+    result = await session.stream(statement)
+    partitions = result.partitions(stream_rows)
+    first = await anext(partitions, [])
+    if filters and not first:
+        await result.close()
+        await session.close()
+        return json_response(request, UNKNOWN_FILTER, 404)
+
+    async def chunks():
+        try:
+            yield list(map(to_response, first))
+            async for rows in partitions:
+                yield list(map(to_response, rows))
+        finally:
+            await result.close()
+            await session.close()
+
+    body = json_array_chunks(chunks(), request.app.state.dumps)
+    return StreamingResponse(body, media_type="application/json")
+
+
+async def create_ticket(request):
+    # the errors Flask's request.get_json() raises
+    if not is_json(request):
+        return json_response(request, {"error": "Did not attempt to load JSON data because the request "
+                                                "Content-Type was not 'application/json'."}, 415)
+    try:
+        data = await request.json()
+    except ValueError:
+        return json_response(request, {"error": "Failed to decode JSON object."}, 400)
+    config = request.app.state.config
+    try:
+        params = purchase_request(data, config["RENDER_COALESCE_WINDOW"])
+    except ValueError as e:
+        return json_response(request, {"error": str(e)}, 400)
+    concert_id = params["concert_id"]
+    user_id = params["user_id"]
+
+    # the purchase, plus marking the concert SOLD_OUT when it is full, in one transaction
+    async with request.app.state.sessions() as session:
+        try:
+            result = (await session.execute(PURCHASE_TICKET, params)).one()
+            if not result.purchased and result.user_exists and result.concert_exists:
+                await session.execute(update(Concert).where(as_uuid(Concert.id) == concert_id).values(status="SOLD_OUT"))
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            request.app.state.logger.error(traceback.format_exc())
+            return json_response(request, {"error": f"An unknown error occurred: {e}"}, 500)
+
+    if not result.concert_exists or not result.user_exists:
+        request.app.state.logger.info(f"concert {concert_id} or user {user_id} does not exist")
+        return json_response(request, {"error": "concert or user does not exist"}, 400)
+
+    if not result.purchased:
+        request.app.state.logger.info("concert is full")
+        return json_response(request, {"error": "concert is full"}, 422)
+
+    return json_response(request, ticket_response(params["ticket_id"], concert_id, user_id, "NOT_PRINTED", config), 201)
+
+
+async def get_ticket_by_id(request):
+    ticket_id = request.path_params["ticket_id"]
+    if ticket_id == "health":
+        return json_response(request, {"healthy": True})
+    if not valid_uuid(ticket_id):
+        return json_response(request, {"error": "The ticket id is not valid."}, 404)
+    async with request.app.state.sessions() as session:
+        ticket = (await session.execute(select(*TICKET_COLUMNS).where(TICKET_ID == ticket_id))).first()
+    if not ticket:
+        return json_response(request, {"error": "The ticket does not exist."}, 404)
+    return json_response(request, ticket_response(*ticket, request.app.state.config))
+
+
+async def print_ticket(request):
+    ticket_id = request.path_params["ticket_id"]
+    if not valid_uuid(ticket_id):
+        return json_response(request, {"error": "The ticket id is not valid."}, 404)
+    async with request.app.state.sessions() as session:
+        print_status = await session.scalar(select(Ticket.print_status).where(TICKET_ID == ticket_id))
+        if print_status is None:
+            return json_response(request, {"error": "The ticket does not exist."}, 404)
+        if print_status == "PENDING":
+            return json_response(request, {"error": "still processing"}, 500)
+        elif print_status == "PRINTED":
+            return json_response(request, {"error": "already printed"}, 500)
+
+        # the status change and the render request commit together, the outbox relay sends it to Hamilton
+        await session.execute(update(Ticket).where(TICKET_ID == ticket_id).values(print_status="PENDING"))
+        await session.execute(OutboxMessage.render_request("ticket", ticket_id))
+        await session.commit()
+
+    return json_response(request, {"status": "The asynchronous request was successfully started."}, 202)
+
+
+async def get_printed_ticket(request):
+    ticket_id = request.path_params["ticket_id"]
+    if not valid_uuid(ticket_id):
+        return json_response(request, {"error": "The ticket id is not valid."}, 404)
+    async with request.app.state.sessions() as session:
+        ticket = (await session.execute(select(Ticket.print_status, Ticket.svg).where(TICKET_ID == ticket_id))).first()
+    if not ticket:
+        return json_response(request, {"error": "The ticket does not exist or has not been printed yet."}, 404)
+    if ticket.print_status != "PRINTED":
+        return json_response(request, {"error": "The ticket is being pending for printing."}, 404)
+    return Response(ticket.svg, media_type="image/svg+xml")
+
+
+ROUTES = [
+    Route("/tickets/metrics", get_metrics, methods=["GET"]),
+    Route("/tickets", get_all_tickets, methods=["GET"]),
+    Route("/tickets", create_ticket, methods=["POST"]),
+    Route("/tickets/{ticket_id}", get_ticket_by_id, methods=["GET"]),
+    Route("/tickets/{ticket_id}/print", print_ticket, methods=["POST"]),
+    Route("/tickets/{ticket_id}/print", get_printed_ticket, methods=["GET"]),
+]
+
+
+def async_database_uri(database_uri):
+    return make_url(database_uri).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def create_app(config_overrides=None):
+    flask_app = create_flask_app(config_overrides)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        # the engine belongs to the event loop of the worker, it is created once the loop runs
+        engine = create_async_engine(async_database_uri(flask_app.config['SQLALCHEMY_DATABASE_URI']),
+                                     **db_pool.async_engine_options())
+        app.state.sessions = async_sessionmaker(engine, expire_on_commit=False)
+        yield
+        await engine.dispose()
+
+    app = Starlette(routes=[Mount("/api/v1", routes=ROUTES)], lifespan=lifespan)
+    app.state.flask_app = flask_app
+    app.state.config = flask_app.config
+    app.state.dumps = flask_app.json.dumps
+    app.state.logger = flask_app.logger
+    return app
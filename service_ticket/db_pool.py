@@ -0,0 +1,67 @@
+import time
+from os import environ
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from metrics import metrics
+
+
+class TimedCheckout:
+    """
+    Pool mixin reporting how long each checkout waited for a connection (db.pool.checkout_wait,
+    including opening a new one) and how often it gave up after pool_timeout (db.pool.timeout).
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.incr("db.pool.timeout")
+            raise
+        finally:
+            metrics.observe("db.pool.checkout_wait", time.perf_counter() - started)
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(background_threads=0):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS of a worker. Each of its GUNICORN_THREADS request threads, plus
+    background_threads (the outbox relay), holds at most one connection at a time, so that is the
+    pool size; DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and DB_POOL_RECYCLE override it.
+    Connections are checked with a ping when they are taken from the pool.
+    """
+    threads = int(environ.get("GUNICORN_THREADS", 1))
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(environ.get("DB_POOL_SIZE", threads + background_threads)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 1)),
+        "pool_timeout": float(environ.get("DB_POOL_TIMEOUT", 10)),
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
+
+
+def async_engine_options():
+    """
+    Options of the asyncpg engine of an ASGI worker (asgi.py). Its requests share one event loop and
+    only hold a connection while they wait on postgres, so the pool is not tied to a thread count:
+    DB_POOL_SIZE (default 10) connections, then DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and DB_POOL_RECYCLE
+    as for the threaded workers.
+    """
+    return {
+        "poolclass": TimedAsyncQueuePool,
+        "pool_size": int(environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 1)),
+        "pool_timeout": float(environ.get("DB_POOL_TIMEOUT", 10)),
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
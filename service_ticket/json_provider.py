@@ -0,0 +1,25 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, responses are encoded by the json module without it
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify and json_array encode with orjson when it is installed. Dates, datetimes and dataclasses
+    still go through Flask's `default`, so the output only differs in non-ASCII text, which orjson
+    writes as UTF-8 instead of \\u escapes. Indented (debug) output stays with the json module.
+    """
+    if orjson:
+        def dumps(self, obj, **kwargs):
+            if kwargs.get("indent") is not None:
+                return super().dumps(obj, **kwargs)
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            if kwargs.get("sort_keys", self.sort_keys):
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=kwargs.get("default", self.default), option=option).decode("utf-8")
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
@@ -3,24 +3,25 @@ from . import db
 
 class Ticket(db.Model):
     __tablename__ = "tickets"
+    # keep in sync with terraform/database/migrations/0002_ticket_indexes.sql, 0007_ticket_keyset_indexes.sql
+    # and 0009_drop_ticket_id_print_status_index.sql
+    __table_args__ = (
+        db.Index("ix_tickets_concert_id_id", "concert_id", "id", postgresql_include=["user_id", "print_status"]),
+        db.Index("ix_tickets_user_id_id", "user_id", "id", postgresql_include=["concert_id", "print_status"]),
+    )
     id = db.Column(db.String, primary_key=True)
     concert_id = db.Column(db.String, nullable=False)
     user_id = db.Column(db.String, nullable=False)
     print_status = db.Column(db.String, nullable=False)
-    svg = db.Column(db.String, nullable=True)
+    # rendered ticket, loaded only where it is served (GET /tickets/<id>/print) with undefer
+    svg = db.deferred(db.Column(db.String, nullable=True), raiseload=True)
 
     def to_dict(self, include_fields=[]):
-        ticket_dict = {
-            "id": self.id,
-            "concert_id": self.concert_id,
-            "user_id": self.user_id,
-            "print_status": self.print_status,
-            "svg": self.svg if self.svg else None,
-        }
-
-        # if include_fields is not empty, only return the fields in include_fields
-        if include_fields:
-            ticket_dict = {key: value for key, value in ticket_dict.items() if key in include_fields}
+        # if include_fields is not empty, only the fields in include_fields are read
+        fields = include_fields or ("id", "concert_id", "user_id", "print_status", "svg")
+        ticket_dict = {field: getattr(self, field) for field in fields}
+        if "svg" in ticket_dict and not ticket_dict["svg"]:
+            ticket_dict["svg"] = None
 
         return ticket_dict
 
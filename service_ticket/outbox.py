@@ -0,0 +1,113 @@
+import threading
+
+from sqlalchemy import text
+
+import sqs_client
+from metrics import metrics
+
+# SQS accepts at most 10 entries per send_message_batch
+BATCH_SIZE = 10
+# seconds a claimed batch is hidden from other relays while it is sent
+LEASE_SECONDS = 60
+
+CLAIM_BATCH = text("""
+    UPDATE outbox SET available_at = now() + make_interval(secs => :lease)
+    WHERE id IN (
+        SELECT id FROM outbox
+        WHERE available_at <= now()
+        ORDER BY id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, body, coalesced
+""")
+
+SENT = "unnest(CAST(:ids AS bigint[]), CAST(:coalesced AS integer[])) AS sent(id, coalesced)"
+# a row is only deleted when no render request merged into it after it was claimed
+DELETE_SENT = text(f"""
+    DELETE FROM outbox USING {SENT}
+    WHERE outbox.id = sent.id AND outbox.coalesced = sent.coalesced
+""")
+# the rows that were merged into meanwhile stay queued, counting only the merges the send did not
+# cover, and leave their lease to be sent in the next round
+KEEP_MERGED = text(f"""
+    UPDATE outbox SET coalesced = outbox.coalesced - sent.coalesced - 1, available_at = now()
+    FROM {SENT}
+    WHERE outbox.id = sent.id AND outbox.coalesced > sent.coalesced
+""")
+
+
+class OutboxRelay:
+    """
+    Drains the outbox table to the Hamilton SQS queue from a background thread of the worker.
+
+    A batch is claimed in a short transaction: FOR UPDATE SKIP LOCKED picks rows no other relay is
+    claiming, and available_at is pushed LEASE_SECONDS ahead so other relays skip them while they are
+    sent. The send runs outside any transaction, so purchases merging into a claimed render never
+    wait on SQS. A second short transaction deletes what SQS accepted. Entries SQS rejects, and
+    batches whose send failed, are sent again once the lease ran out; a send slower than the lease
+    may be repeated by another relay, which the lambda tolerates (renders are idempotent).
+    Rows still inside their coalescing window (available_at in the future) are left for later.
+    """
+
+    def __init__(self, engine, queue_url, logger, client_factory=sqs_client.get_client, poll_interval=0.5):
+        self.engine = engine
+        self.queue_url = queue_url
+        self.logger = logger
+        self.client_factory = client_factory
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def drain_once(self):
+        """
+        Send one batch, return the number of messages SQS accepted.
+        """
+        with self.engine.begin() as conn:
+            rows = conn.execute(CLAIM_BATCH, {"batch_size": BATCH_SIZE, "lease": LEASE_SECONDS}).all()
+        if not rows:
+            return 0
+        rows.sort(key=lambda row: row.id)
+
+        with metrics.timer("sqs.send_message_batch"):
+            response = self.client_factory().send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(row.id), "MessageBody": row.body} for row in rows],
+            )
+
+        sent_ids = {int(entry["Id"]) for entry in response.get("Successful", [])}
+        sent = [row for row in rows if row.id in sent_ids]
+        metrics.incr("outbox.sent", len(sent))
+        # render requests that merged into a sent message instead of being sent themselves
+        metrics.incr("outbox.coalesced", sum(row.coalesced for row in sent))
+        metrics.incr("outbox.failed", len(response.get("Failed", [])))
+        for failure in response.get("Failed", []):
+            self.logger.error(f"Hamilton queue rejected outbox message {failure['Id']}: {failure.get('Message')}")
+        if sent:
+            params = {"ids": [row.id for row in sent], "coalesced": [row.coalesced for row in sent]}
+            with self.engine.begin() as conn:
+                conn.execute(DELETE_SENT, params)
+                conn.execute(KEEP_MERGED, params)
+        self.logger.info(f"Sent {len(sent)} of {len(rows)} outbox messages to Hamilton queue")
+        return len(sent)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.drain_once()
+            except Exception as e:
+                self.logger.error(f"Outbox relay failed: {e}")
+                sent = 0
+            # keep draining while batches come back full, otherwise wait for new messages
+            if sent < BATCH_SIZE:
+                self._stop.wait(self.poll_interval)
@@ -0,0 +1,25 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+from metrics import metrics
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_client(max_pool_connections=10):
+    """
+    The SQS client of this worker, created on first use and shared by every thread afterwards.
+    boto3 clients are thread safe, building one loads the botocore service model and resolves
+    credentials, which is far too slow to repeat per message. max_pool_connections sizes the
+    HTTP connection pool and only applies to the call that builds the client.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                with metrics.timer("sqs.client_build"):
+                    _client = boto3.client('sqs', config=Config(max_pool_connections=max_pool_connections))
+    return _client
@@ -0,0 +1,33 @@
+import itertools
+
+
+def json_array(items, chunk_size, dumps):
+    """
+    Encode items as one JSON array with dumps (the app's json.dumps), yielded in pieces of
+    chunk_size items, so a response of any length only ever holds one piece in memory.
+    Same bytes as jsonify outside debug mode.
+    """
+    yield "["
+    separator = ""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            break
+        yield separator + ",".join(dumps(item, separators=(",", ":")) for item in chunk)
+        separator = ","
+    yield "]\n"
+
+
+async def json_array_chunks(chunks, dumps):
+    """
+    json_array of an async iterable of lists of items, one piece per list, e.g. the partitions of
+    a result streamed by the asyncio engine of asgi.py.
+    """
+    yield "["
+    separator = ""
+    async for chunk in chunks:
+        if chunk:
+            yield separator + ",".join(dumps(item, separators=(",", ":")) for item in chunk)
+            separator = ","
+    yield "]\n"
@@ -1,13 +1,16 @@
+import json
 import traceback
 
-import boto3
-from flask import Blueprint, jsonify, request, current_app, abort, Response, make_response
+from flask import Blueprint, jsonify, request, current_app, abort, Response, make_response, stream_with_context
+from sqlalchemy import text, update
 from models.ticket import Ticket
-from models.user import User
 from models.concert import Concert
+from models.outbox import OutboxMessage
 from models import db
+from metrics import metrics
+from pagination import PAGE_PARAMS, Page, PageError
+from streaming import json_array
 import uuid
-import json
 
 tickets_blueprint = Blueprint("tickets", __name__)
 
@@ -28,6 +31,14 @@ def health_check():
         return jsonify({"error": "Service is not healthy."}), 503
 
 
+@tickets_blueprint.route("/tickets/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Counters and timings of this worker, e.g. time spent building the SQS client and sending to it.
+    """
+    return jsonify(metrics.snapshot()), 200
+
+
 def valid_uuid(uuid_str):
     try:
         uuid.UUID(uuid_str)
@@ -39,7 +50,7 @@ def valid_uuid(uuid_str):
 @tickets_blueprint.route("/tickets", methods=["GET"])
 def get_all_tickets():
     # Check for unknown filter parameters
-    allowed_params = {"user_id", "concert_id"}
+    allowed_params = {"user_id", "concert_id"} | PAGE_PARAMS
     for param in request.args:
         if param not in allowed_params:
             return jsonify({"error": f"Unknown identifier provided as filter parameter"}), 404
@@ -60,24 +71,10 @@ def get_all_tickets():
         except ValueError:
             return jsonify({"error": "Unknown identifier provided as filter parameter"}), 404
 
-    # if no parameters are provided, return all tickets
-    if not user_id and not concert_id:
-        tickets = Ticket.query.all()
-        response_list = []
-        for ticket in tickets:
-            response_list.append({
-                "id": ticket.id,
-                "concert": {
-                    "id": ticket.concert_id,
-                    "url": f"{current_app.config['SERVICE_CONCERT_URL']}/{ticket.concert_id}"
-                },
-                "user": {
-                    "id": ticket.user_id,
-                    "url": f"{current_app.config['SERVICE_USER_URL']}/{ticket.user_id}"
-                },
-                "print_status": ticket.print_status,
-            })
-        return jsonify(response_list), 200
+    try:
+        page = Page.from_request()
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
 
     # Build the query based on the parameters
     query = {}
@@ -86,121 +83,178 @@ def get_all_tickets():
     if concert_id:
         query["concert_id"] = concert_id
 
-    # List all the purchased tickets based on the query
-    # tickets_data = list(current_app.db_tickets.find(query, projection={"_id": 0, "svg": 0}))
-    tickets = Ticket.query.filter_by(**query).all()
-    if len(tickets) == 0:
+    # only the listed columns, as tuples
+    tickets_query = Ticket.query.with_entities(*TICKET_COLUMNS).filter_by(**query)
+    to_response = ticket_serializer()
+    stream_rows = current_app.config["LIST_STREAM_ROWS"]
+    if not page and stream_rows:
+        # The whole list, streamed from a server side cursor: the worker holds stream_rows tickets at
+        # a time however many there are. The first row is read up front for the 404 of a filter.
+        result = db.session.execute(tickets_query.statement.execution_options(yield_per=stream_rows))
+        first = result.fetchone() if query else None
+        if query and first is None:
+            result.close()
+            return jsonify({"error": "Unknown identifier provided as filter parameter"}), 404
+        body = json_array(map(to_response, streamed_rows(result, first)), stream_rows, current_app.json.dumps)
+        return Response(stream_with_context(body), status=200, mimetype="application/json")
+
+    # List all the purchased tickets based on the query, one page of them when paginated
+    if page:
+        tickets, next_cursor = page.rows(tickets_query, Ticket.id)
+    else:
+        tickets, next_cursor = tickets_query.all(), None
+    # an unknown filter has no tickets, a page past the last one is just empty
+    if query and len(tickets) == 0 and not (page and page.after):
         return jsonify({"error": "Unknown identifier provided as filter parameter"}), 404
 
-    response_list = []
-    for ticket in tickets:
-        response_list.append({
-            "id": ticket.id,
-            "concert": {
-                "id": ticket.concert_id,
-                "url": f"{current_app.config['SERVICE_CONCERT_URL']}/{ticket.concert_id}"
-            },
-            "user": {
-                "id": ticket.user_id,
-                "url": f"{current_app.config['SERVICE_USER_URL']}/{ticket.user_id}"
-            },
-            "print_status": ticket.print_status,
-        })
-    return jsonify(response_list), 200
-
-
-def request_hamilton_concert(concert_id):
+    response = jsonify(list(map(to_response, tickets)))
+    if next_cursor:
+        response.headers["Link"] = page.link(next_cursor)
+    return response, 200
+
+
+def streamed_rows(result, first=None):
+    """
+    first and the rest of result, which is closed with the response even when the client goes away.
+    """
     try:
-        # create a boto3 client
-        sqs = boto3.client('sqs')
-        # your queue url
-        queue_url = current_app.config['SQS_QUEUE_URL']
-        # create the message body
-        message_body = {
-            "event": "concert",
-            "id": str(concert_id)
-        }
-        # send the message
-        response = sqs.send_message(
-            QueueUrl=queue_url,
-            MessageBody=json.dumps(message_body),
-        )
+        if first is not None:
+            yield first
+        yield from result
+    finally:
+        result.close()
 
-        # log the message id
-        current_app.logger.info(f"Message sent to Hamilton queue. Message ID: {response['MessageId']}")
 
-    except Exception as e:
-        current_app.logger.error(f"{e}")
-        abort(500, description=f"An unknown error occurred: {e}")
+# the columns of a listed ticket, in the order ticket_serializer unpacks them
+TICKET_COLUMNS = (Ticket.id, Ticket.concert_id, Ticket.user_id, Ticket.print_status)
 
 
-@tickets_blueprint.route("/tickets", methods=["POST"])
-def create_ticket():
-    # Parse the request data
-    data = request.get_json()
-    # define concert_id
-    concert_id = data["concert_id"]
-    user_id = data["user_id"]
+def ticket_serializer(config=None):
+    """
+    Function turning a row of TICKET_COLUMNS into the response of a ticket, with the service URLs
+    of the app (config, default the current app's) looked up once. Same output as ticket_response.
+    """
+    config = current_app.config if config is None else config
+    concert_url = f"{config['SERVICE_CONCERT_URL']}/"
+    user_url = f"{config['SERVICE_USER_URL']}/"
+
+    def to_response(row):
+        ticket_id, concert_id, user_id, print_status = row
+        return {
+            "id": ticket_id,
+            "concert": {"id": concert_id, "url": concert_url + str(concert_id)},
+            "user": {"id": user_id, "url": user_url + str(user_id)},
+            "print_status": print_status,
+        }
 
-    # if concert_id or user_id not valid, return 400
-    if not valid_uuid(concert_id) or not valid_uuid(user_id):
-        abort(400, description="concert_id or user_id is not valid")
+    return to_response
+
+
+# The whole purchase in one statement: check the user exists, reserve a seat with the
+# conditional counter update, insert the ticket only if a seat was reserved and queue the
+# seating plan render in the outbox. Data-modifying CTEs see the snapshot taken before the
+# statement, so the outer SELECT still tells a missing concert apart from a full one.
+# The render request is held back for RENDER_COALESCE_WINDOW seconds and merges with one already
+# pending for the concert, so a burst of purchases costs one render per window (see OutboxMessage).
+PURCHASE_TICKET = text("""
+    WITH buyer AS (
+        SELECT id FROM users WHERE id = :user_id
+    ), reserved AS (
+        UPDATE concerts SET tickets_sold = tickets_sold + 1
+        WHERE id = :concert_id AND tickets_sold < capacity AND EXISTS (SELECT 1 FROM buyer)
+        RETURNING id
+    ), ticket AS (
+        INSERT INTO tickets (id, concert_id, user_id, print_status)
+        SELECT CAST(:ticket_id AS uuid), reserved.id, CAST(:user_id AS uuid), 'NOT_PRINTED' FROM reserved
+        RETURNING id
+    ), render_request AS (
+        INSERT INTO outbox (body, dedup_key, available_at)
+        SELECT :render_request, :dedup_key, now() + make_interval(secs => :coalesce_window) FROM ticket
+        ON CONFLICT (dedup_key) DO UPDATE SET coalesced = outbox.coalesced + 1
+    )
+    SELECT EXISTS (SELECT 1 FROM buyer) AS user_exists,
+           EXISTS (SELECT 1 FROM concerts WHERE id = :concert_id) AS concert_exists,
+           EXISTS (SELECT 1 FROM ticket) AS purchased
+""")
 
-    # Check if concert_id and user_id are provided
-    if not all(key in data for key in ("concert_id", "user_id")):
-        abort(400, description="concert_id and user_id are required in the request body")
 
-    current_app.logger.debug(f"Check the existing of concert {concert_id}, and user {user_id}")
-    concert = Concert.query.filter_by(id=data["concert_id"]).first()
-    user = User.query.filter_by(id=data["user_id"]).first()
+def purchase_request(data, coalesce_window):
+    """
+    Parameters of PURCHASE_TICKET for the body of POST /tickets, a ValueError with the message of
+    the 400 when it is not a valid purchase.
+    """
+    # Check if concert_id and user_id are provided
+    if not isinstance(data, dict) or not all(key in data for key in ("concert_id", "user_id")):
+        raise ValueError("concert_id and user_id are required in the request body")
+    concert_id = data["concert_id"]
+    user_id = data["user_id"]
 
-    if not concert or not user:
-        current_app.logger.info("concert or user does not exist")
-        abort(400, description="concert or user does not exist")
+    # if concert_id or user_id not valid, return 400
+    if not isinstance(concert_id, str) or not isinstance(user_id, str) \
+            or not valid_uuid(concert_id) or not valid_uuid(user_id):
+        raise ValueError("concert_id or user_id is not valid")
+
+    # a new ticket with a unique ID and NOT_PRINTED status
+    return {
+        "ticket_id": str(uuid.uuid4()),
+        "concert_id": concert_id,
+        "user_id": user_id,
+        "render_request": json.dumps({"event": "concert", "id": concert_id}),
+        "dedup_key": OutboxMessage.dedup_key_for("concert", concert_id),
+        "coalesce_window": coalesce_window,
+    }
 
-    num_tickets_sold = Ticket.query.filter_by(concert_id=data["concert_id"]).count()
 
-    if num_tickets_sold >= concert.capacity:
-        concert.status = "SOLD_OUT"
-        db.session.commit()
-        current_app.logger.info("concert is full")
-        abort(422, description="concert is full")
+def ticket_response(ticket_id, concert_id, user_id, print_status, config):
+    return {
+        "id": ticket_id,
+        "concert": {
+            "id": concert_id,
+            "url": f"{config['SERVICE_CONCERT_URL']}/{concert_id}"
+        },
+        "user": {
+            "id": user_id,
+            "url": f"{config['SERVICE_USER_URL']}/{user_id}"
+        },
+        "print_status": print_status
+    }
 
-    # Create a new ticket with a unique ID and NOT_PRINTED status
-    ticket_id = str(uuid.uuid4())
-    ticket = Ticket(
-        id=ticket_id,
-        concert_id=data["concert_id"],
-        user_id=data["user_id"],
-        print_status="NOT_PRINTED"
-    )
 
+@tickets_blueprint.route("/tickets", methods=["POST"])
+def create_ticket():
+    # Parse the request data
+    data = request.get_json()
     try:
-        db.session.add(ticket)
-        db.session.commit()
-        request_hamilton_concert(concert.id)
-        concert.print_status = "PENDING"
+        params = purchase_request(data, current_app.config["RENDER_COALESCE_WINDOW"])
+    except ValueError as e:
+        abort(400, description=str(e))
+    concert_id = params["concert_id"]
+    user_id = params["user_id"]
+
+    # Create the ticket in one transaction of at most two statements: the purchase, plus marking
+    # the concert SOLD_OUT when it is full.
+    try:
+        result = db.session.execute(PURCHASE_TICKET, params).one()
+
+        if not result.purchased and result.user_exists and result.concert_exists:
+            db.session.execute(update(Concert).where(Concert.id == concert_id).values(status="SOLD_OUT"))
         db.session.commit()
     except Exception as e:
+        db.session.rollback()
         # logging traceback
         current_app.logger.error(traceback.format_exc())
         abort(500, description=f"An unknown error occurred: {e}")
 
-    # Prepare the response
-    ticket_response = {
-        "id": ticket_id,
-        "concert": {
-            "id": concert.id,
-            "url": f"{current_app.config['SERVICE_CONCERT_URL']}/{concert.id}"
-        },
-        "user": {
-            "id": user.id,
-            "url": f"{current_app.config['SERVICE_USER_URL']}/{user.id}"
-        },
-        "print_status": "NOT_PRINTED"
-    }
+    if not result.concert_exists or not result.user_exists:
+        current_app.logger.info(f"concert {concert_id} or user {user_id} does not exist")
+        abort(400, description="concert or user does not exist")
 
-    return jsonify(ticket_response), 201
+    if not result.purchased:
+        current_app.logger.info("concert is full")
+        abort(422, description="concert is full")
+
+    # Prepare the response
+    return jsonify(ticket_response(params["ticket_id"], concert_id, user_id, "NOT_PRINTED", current_app.config)), 201
 
 
 @tickets_blueprint.route("/tickets/<string:ticket_id>", methods=["GET"])
@@ -213,48 +267,12 @@ def get_ticket_by_id(ticket_id):
     if ticket_data:
         # ticket_data = ticket_data.to_dict(include_fields=['id', 'concert_id', 'user_id', 'print_status'])
         # build response json file
-        ticket_response = {
-            "id": ticket_data.id,
-            "concert": {
-                "id": ticket_data.concert_id,
-                "url": f"{current_app.config['SERVICE_CONCERT_URL']}/{ticket_data.concert_id}"
-            },
-            "user": {
-                "id": ticket_data.user_id,
-                "url": f"{current_app.config['SERVICE_USER_URL']}/{ticket_data.user_id}"
-            },
-            "print_status": ticket_data.print_status
-        }
-        return jsonify(ticket_response), 200
+        return jsonify(ticket_response(ticket_data.id, ticket_data.concert_id, ticket_data.user_id,
+                                       ticket_data.print_status, current_app.config)), 200
     else:
         return jsonify({"error": "The ticket does not exist."}), 404
 
 
-def request_hamilton(ticket_id):
-    try:
-        # create a boto3 client
-        sqs = boto3.client('sqs')
-        # your queue url
-        queue_url = current_app.config['SQS_QUEUE_URL']
-        # create the message body
-        message_body = {
-            "event": "ticket",
-            "id": str(ticket_id)
-        }
-        # send the message
-        response = sqs.send_message(
-            QueueUrl=queue_url,
-            MessageBody=json.dumps(message_body),
-        )
-
-        # log the message id
-        current_app.logger.info(f"Message sent to Hamilton queue. Message ID: {response['MessageId']}")
-
-    except Exception as e:
-        current_app.logger.error(f"{e}")
-        abort(500, description=f"An unknown error occurred: {e}")
-
-
 @tickets_blueprint.route("/tickets/<string:ticket_id>/print", methods=["POST"])
 def print_ticket(ticket_id):
     if valid_uuid(ticket_id) is False:
@@ -269,10 +287,9 @@ def print_ticket(ticket_id):
     elif ticket_data.print_status == "PRINTED":
         return jsonify({"error": "already printed"}), 500
 
-    request_hamilton(ticket_id)
-    # current_app.db_tickets.update_one({"id": ticket_id}, {"$set": {"print_status": "PENDING"}})
-    ticket = Ticket.query.filter_by(id=ticket_id).first()
-    ticket.print_status = "PENDING"
+    # the status change and the render request commit together, the outbox relay sends it to Hamilton
+    ticket_data.print_status = "PENDING"
+    db.session.execute(OutboxMessage.render_request("ticket", ticket_id))
     db.session.commit()
 
     return jsonify({"status": "The asynchronous request was successfully started."}), 202
@@ -284,7 +301,7 @@ def get_printed_ticket(ticket_id):
     if valid_uuid(ticket_id) is False:
         return jsonify({"error": "The ticket id is not valid."}), 404
     # ticket_data = current_app.db_tickets.find_one({"id": ticket_id}, projection={"_id": 0})
-    ticket = Ticket.query.filter_by(id=ticket_id).first()
+    ticket = Ticket.query.options(db.undefer(Ticket.svg)).filter_by(id=ticket_id).first()
     ticket_data = ticket.to_dict() if ticket else None
     if not ticket_data:
         return jsonify({"error": "The ticket does not exist or has not been printed yet."}), 404
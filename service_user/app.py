@@ -1,10 +1,39 @@
 from os import environ
 from flask import Flask
+from sqlalchemy import inspect, text
 from views.routers import users_blueprint
-from models import db
+from models import db, SCHEMA_VERSION
+import user_cache
+from user_snapshot import SnapshotStore
+import db_pool
 import logging
 
 
+SCHEMA_MODES = ("check", "skip")
+USER_STORES = ("database", "snapshot")
+
+
+def prepare_schema(app):
+    """
+    Apply the SCHEMA_MODE startup policy. Workers never run DDL, the schema is
+    migrated once per deploy by terraform/database/migrate.py.
+    check: fail fast unless the database is migrated to the SCHEMA_VERSION of the models.
+    skip: do not touch the database at startup.
+    """
+    mode = app.config['SCHEMA_MODE']
+    if mode not in SCHEMA_MODES:
+        raise ValueError(f"Unknown SCHEMA_MODE {mode!r}, expected one of {', '.join(SCHEMA_MODES)}")
+
+    if mode == "check":
+        if not inspect(db.engine).has_table("schema_migrations"):
+            raise RuntimeError("Database is not migrated, run terraform/database/migrate.py first")
+        version = db.session.execute(text("SELECT max(version) FROM schema_migrations")).scalar()
+        db.session.commit()
+        if version is None or version < SCHEMA_VERSION:
+            raise RuntimeError(f"Database schema version {version} is older than {SCHEMA_VERSION}, "
+                               f"run terraform/database/migrate.py first")
+
+
 def create_app(config_overrides=None):
     app = Flask(__name__)
 
@@ -14,11 +43,26 @@ def create_app(config_overrides=None):
 
     app.config['SQLALCHEMY_DATABASE_URI'] = environ.get("SQLALCHEMY_DATABASE_URI")
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-        'pool_size': 1,
-        'pool_recycle': 30,
-        'max_overflow': 1
-    }
+    # How the worker treats the schema at startup: check or skip.
+    app.config['SCHEMA_MODE'] = environ.get("SCHEMA_MODE", "check")
+    # Rows per page of the list endpoints, 0 lists everything unless a request asks for a limit.
+    app.config['LIST_PAGE_SIZE'] = int(environ.get("LIST_PAGE_SIZE", 0))
+    app.config['LIST_MAX_PAGE_SIZE'] = int(environ.get("LIST_MAX_PAGE_SIZE", 1000))
+    # Users cached per worker (0 disables the cache), seconds a cached user is served, shared redis cache.
+    app.config['USER_CACHE_SIZE'] = int(environ.get("USER_CACHE_SIZE", 10000))
+    app.config['USER_CACHE_TTL'] = float(environ.get("USER_CACHE_TTL", 300))
+    app.config['USER_CACHE_URL'] = environ.get("USER_CACHE_URL")
+    # Ids one GET /users?id=...&id=... may ask for.
+    app.config['USER_BATCH_MAX'] = int(environ.get("USER_BATCH_MAX", 100))
+    # Where users are read from: database, or snapshot to load them all into memory at worker start.
+    app.config['USER_STORE'] = environ.get("USER_STORE", "database")
+    # Seconds between two snapshot reloads of a worker, each one scans the users table.
+    app.config['USER_SNAPSHOT_RELOAD_INTERVAL'] = float(environ.get("USER_SNAPSHOT_RELOAD_INTERVAL", 60))
+    # Shared secret of the operator endpoints (cache invalidation, snapshot reload), which are not served
+    # while it is unset.
+    app.config['INTERNAL_TOKEN'] = environ.get("INTERNAL_TOKEN")
+    # sized for the request threads of a worker
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_pool.engine_options()
 
     if config_overrides:
         app.config.update(config_overrides)
@@ -26,21 +70,24 @@ def create_app(config_overrides=None):
     # Initialize the database
     db.init_app(app)
 
-    # Create the database tables.
+    # Prepare the database schema once, when the worker starts.
     with app.app_context():
-        db.create_all()
-        db.session.commit()
+        prepare_schema(app)
+
+    # User lookups are served from memory, see user_cache.py and user_snapshot.py
+    app.extensions['user_cache'] = user_cache.from_config(app.config, app.logger)
+    if app.config['USER_STORE'] not in USER_STORES:
+        raise ValueError(f"Unknown USER_STORE {app.config['USER_STORE']!r}, expected one of {', '.join(USER_STORES)}")
+    if app.config['USER_STORE'] == "snapshot":
+        with app.app_context():
+            app.extensions['user_snapshot'] = SnapshotStore(db.session,
+                                                            app.config['USER_SNAPSHOT_RELOAD_INTERVAL'])
 
     # Register the blueprint
     app.register_blueprint(users_blueprint, url_prefix='/api/v1')
     return app
 
 
-def wsgi_app(environ, start_response):
-    app = create_app()
-    return app(environ, start_response)
-
-
 if __name__ == '__main__':
     config_overrides = {}
     # Create the Flask application instance with the configuration overrides.
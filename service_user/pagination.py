@@ -0,0 +1,103 @@
+import base64
+import uuid
+from urllib.parse import urlencode
+
+from flask import current_app, request
+
+# query parameters of a paginated list
+PAGE_PARAMS = {"limit", "cursor"}
+
+
+class PageError(ValueError):
+    pass
+
+
+def encode_cursor(last_id):
+    """
+    Opaque cursor after the row with id last_id, the 16 bytes of the uuid in url safe base64.
+    """
+    return base64.urlsafe_b64encode(uuid.UUID(str(last_id)).bytes).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        return str(uuid.UUID(bytes=base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))))
+    except ValueError:
+        raise PageError("The cursor is not valid.")
+
+
+class Page:
+    """
+    The limit and cursor of a list request. Lists are paginated with LIST_PAGE_SIZE rows per page
+    unless the request asks for another limit; with LIST_PAGE_SIZE 0 a request without limit or
+    cursor gets the whole list, as before pagination.
+    """
+
+    def __init__(self, limit, after):
+        self.limit = limit
+        self.after = after
+
+    @classmethod
+    def from_request(cls):
+        """
+        The page of the current request, None when the whole list is requested.
+        """
+        return cls.from_args(request.args, current_app.config)
+
+    @classmethod
+    def from_args(cls, args, config):
+        """
+        The page asked for by the query parameters args of an app configured with config.
+        """
+        limit = args.get("limit")
+        cursor = args.get("cursor")
+        page_size = config["LIST_PAGE_SIZE"]
+        if limit is None and cursor is None and not page_size:
+            return None
+        if limit is None:
+            limit = page_size or config["LIST_MAX_PAGE_SIZE"]
+        else:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise PageError("limit should be an integer.")
+            if limit <= 0:
+                raise PageError("limit should be greater than 0.")
+        limit = min(limit, config["LIST_MAX_PAGE_SIZE"])
+        return cls(limit, decode_cursor(cursor) if cursor else None)
+
+    def bound(self, query, key):
+        """
+        query (a Query or a select) limited to the rows of this page ordered by key, plus one to
+        tell whether another page follows: WHERE key > :after ORDER BY key LIMIT, so a page costs
+        the same wherever it is.
+        """
+        query = query.order_by(key)
+        if self.after is not None:
+            query = query.filter(key > self.after)
+        return query.limit(self.limit + 1)
+
+    def split(self, rows, key):
+        """
+        The rows of the page out of the rows of a bound query, and the cursor of the next page (None
+        on the last page).
+        """
+        if len(rows) <= self.limit:
+            return rows, None
+        rows = rows[:self.limit]
+        return rows, encode_cursor(getattr(rows[-1], key.key))
+
+    def rows(self, query, key):
+        """
+        Rows of query ordered by key that follow the cursor, and the cursor of the next page.
+        """
+        return self.split(self.bound(query, key).all(), key)
+
+    def link(self, next_cursor, path=None, args=None):
+        """
+        Link header pointing at the next page, the body stays a plain list. path and args default
+        to the ones of the current Flask request.
+        """
+        args = dict(request.args.to_dict() if args is None else args)
+        args.update(limit=self.limit, cursor=next_cursor)
+        return f'<{request.path if path is None else path}?{urlencode(args)}>; rel="next"'
@@ -0,0 +1,202 @@
+"""
+Read-through cache of user lookups. Users are loaded from users.json and almost never change, so a
+worker answers GET /users/<id> from memory and only goes to postgres on a miss.
+
+Two levels: an LRU with a TTL in each worker, then optionally a cache shared by all workers (redis,
+when USER_CACHE_URL is set and the `redis` package is installed). Entries expire after the TTL on
+both levels, `invalidate` drops users from this worker and the shared cache right away.
+"""
+import collections
+import json
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # optional, only needed for a shared cache
+    redis = None
+
+from metrics import metrics
+
+
+class LocalCache:
+    """
+    Least recently used entries of one worker, each valid for ttl seconds. Shared by its threads.
+    """
+
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedCache:
+    """
+    Entries in a redis shared by the workers of every task, as JSON under `prefix`. `client` is
+    anything with the get, mget, set(ex=), delete and scan_iter methods of redis.Redis.
+    """
+
+    def __init__(self, client, ttl, prefix="users:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, ttl):
+        if redis is None:
+            raise RuntimeError("USER_CACHE_URL is set but the redis package is not installed")
+        return cls(redis.Redis.from_url(url, socket_timeout=0.5), ttl)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def get_many(self, keys):
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def put(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value, default=str), ex=max(1, int(self.ttl)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for name in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(name)
+
+
+class UserCache:
+    """
+    Users by id, looked up in the local cache, then the shared one, then with `load`. Only found
+    users are cached, an unknown id goes to `load` every time. A failing shared cache is skipped.
+    """
+
+    def __init__(self, local, shared=None, logger=None):
+        self.local = local
+        self.shared = shared
+        self.logger = logger
+
+    def get(self, user_id, load):
+        user = self.local.get(user_id)
+        if user is not None:
+            metrics.incr("user_cache.hit")
+            return user
+        user = self._shared("get", user_id)
+        if user is not None:
+            metrics.incr("user_cache.shared_hit")
+        else:
+            metrics.incr("user_cache.miss")
+            user = load(user_id)
+            if user is None:
+                return None
+            self._shared("put", user_id, user)
+        self.local.put(user_id, user)
+        return user
+
+    def get_many(self, user_ids, load_many):
+        """
+        Users by id for the given ids, the ones in neither cache loaded with one call of load_many.
+        """
+        users = {}
+        for user_id in user_ids:
+            user = self.local.get(user_id)
+            if user is not None:
+                users[user_id] = user
+        if users:
+            metrics.incr("user_cache.hit", len(users))
+        missing = [user_id for user_id in user_ids if user_id not in users]
+        if missing and self.shared is not None:
+            shared = self._shared("get_many", missing) or {}
+            if shared:
+                metrics.incr("user_cache.shared_hit", len(shared))
+            for user_id, user in shared.items():
+                users[user_id] = user
+                self.local.put(user_id, user)
+            missing = [user_id for user_id in missing if user_id not in shared]
+        if missing:
+            metrics.incr("user_cache.miss", len(missing))
+            for user_id, user in load_many(missing).items():
+                users[user_id] = user
+                self.local.put(user_id, user)
+                self._shared("put", user_id, user)
+        return users
+
+    def invalidate(self, user_ids=None):
+        """
+        Forget the given users, or every user when user_ids is None.
+        """
+        if user_ids is None:
+            self.local.clear()
+            self._shared("clear")
+            return
+        for user_id in user_ids:
+            self.local.delete(user_id)
+            self._shared("delete", user_id)
+
+    def _shared(self, method, *args):
+        if self.shared is None:
+            return None
+        try:
+            return getattr(self.shared, method)(*args)
+        except Exception as e:
+            metrics.incr("user_cache.shared_error")
+            if self.logger:
+                self.logger.warning(f"shared user cache {method} failed: {e}")
+            return None
+
+
+class NoCache:
+    """
+    Stand-in with USER_CACHE_SIZE=0, every lookup goes to `load`.
+    """
+
+    def get(self, user_id, load):
+        return load(user_id)
+
+    def get_many(self, user_ids, load_many):
+        return load_many(user_ids)
+
+    def invalidate(self, user_ids=None):
+        pass
+
+
+def from_config(config, logger=None):
+    if not config["USER_CACHE_SIZE"]:
+        return NoCache()
+    local = LocalCache(config["USER_CACHE_SIZE"], config["USER_CACHE_TTL"])
+    shared = SharedCache.from_url(config["USER_CACHE_URL"], config["USER_CACHE_TTL"]) \
+        if config["USER_CACHE_URL"] else None
+    return UserCache(local, shared, logger)
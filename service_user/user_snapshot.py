@@ -0,0 +1,124 @@
+"""
+Every user in memory, for USER_STORE=snapshot. The user service has no write endpoints, its users
+are loaded once by terraform/database/init-db.py, so a worker can read the whole table at start
+and answer /users and /users/<id> without postgres.
+
+A snapshot is immutable: ids as one bytes object of 16 byte uuids in sorted order, found by binary
+search, and the names and emails in tuples at the same positions. A reload builds a new snapshot
+and swaps the reference, requests in flight keep reading the old one.
+"""
+import bisect
+import threading
+import time
+import uuid
+
+from sqlalchemy import text
+
+from metrics import metrics
+
+SELECT_USERS = text("SELECT id::text, name, email FROM users ORDER BY id")
+
+
+class UuidKeys:
+    """
+    Sorted 16 byte keys packed in one bytes object, a sequence for bisect.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data) // 16
+
+    def __getitem__(self, i):
+        return self.data[i * 16:(i + 1) * 16]
+
+
+class UserSnapshot:
+    __slots__ = ("keys", "ids", "names", "emails", "loaded_at")
+
+    def __init__(self, rows):
+        """
+        rows: (id, name, email) ordered by id.
+        """
+        self.ids = tuple(row[0] for row in rows)
+        self.keys = UuidKeys(b"".join(uuid.UUID(user_id).bytes for user_id in self.ids))
+        self.names = tuple(row[1] for row in rows)
+        self.emails = tuple(row[2] for row in rows)
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, session):
+        with metrics.timer("user_snapshot.load"):
+            rows = session.execute(SELECT_USERS).all()
+            session.commit()
+            return cls(rows)
+
+    def _user(self, i):
+        return {"id": self.ids[i], "name": self.names[i], "email": self.emails[i]}
+
+    def get(self, user_id):
+        try:
+            key = uuid.UUID(user_id).bytes
+        except ValueError:
+            return None
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self._user(i)
+        return None
+
+    def page(self, after, limit):
+        """
+        Up to limit users after the id `after` (from the start when None), in id order as the
+        database pages them, and the id of the last one when more follow.
+        """
+        start = bisect.bisect_right(self.keys, uuid.UUID(after).bytes) if after else 0
+        end = len(self.keys) if limit is None else min(start + limit, len(self.keys))
+        users = [self._user(i) for i in range(start, end)]
+        return users, (self.ids[end - 1] if end < len(self.keys) and users else None)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ReloadTooSoon(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"The snapshot was reloaded recently, retry in {retry_after:.0f} s.")
+        self.retry_after = retry_after
+
+
+class SnapshotStore:
+    """
+    The current snapshot of a worker, replaced as a whole by reload. Every reload scans the whole
+    table, so concurrent reloads share one scan and a reload within min_interval seconds of the last
+    one is refused.
+    """
+
+    def __init__(self, session, min_interval=0.0, clock=time.monotonic):
+        self.session = session
+        self.min_interval = min_interval
+        self.clock = clock
+        self._reload_lock = threading.Lock()
+        self.snapshot = UserSnapshot.load(session)
+        self._loaded = clock()
+
+    def reload(self):
+        """
+        The snapshot read again from the table. A call that finds a reload in progress waits for it
+        and returns its snapshot. Raises ReloadTooSoon within min_interval of the last load.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            metrics.incr("user_snapshot.reload_coalesced")
+            with self._reload_lock:
+                return self.snapshot
+        try:
+            wait = self._loaded + self.min_interval - self.clock()
+            if wait > 0:
+                raise ReloadTooSoon(wait)
+            self.snapshot = UserSnapshot.load(self.session)
+            self._loaded = self.clock()
+        finally:
+            self._reload_lock.release()
+        metrics.incr("user_snapshot.reload")
+        return self.snapshot
@@ -1,9 +1,37 @@
-from flask import Blueprint, jsonify, current_app
+from flask import Blueprint, jsonify, current_app, request
 from models.user import User
+from models import db
+from sqlalchemy import text
+from metrics import metrics
+from pagination import Page, PageError, encode_cursor
+from user_snapshot import ReloadTooSoon
+from functools import wraps
+import hmac
 import logging
+import math
+import uuid
 
 users_blueprint = Blueprint("users", __name__)
 
+INTERNAL_TOKEN_HEADER = "X-Internal-Token"
+
+
+def internal(view):
+    """
+    Operator endpoints: answered only to requests carrying the INTERNAL_TOKEN of the service in
+    the X-Internal-Token header, and not served at all while INTERNAL_TOKEN is unset.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config['INTERNAL_TOKEN']
+        if not token:
+            return jsonify({"error": "Not found."}), 404
+        given = request.headers.get(INTERNAL_TOKEN_HEADER, "")
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            return jsonify({"error": "A valid internal token is required."}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
 
 def health_check():
     """
@@ -21,13 +49,113 @@ def health_check():
         return jsonify({"error": "Service is not healthy."}), 503
 
 
+@users_blueprint.route("/users/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Counters of this worker, e.g. hits and misses of the user cache.
+    """
+    return jsonify(metrics.snapshot()), 200
+
+
+@users_blueprint.route("/users/cache/invalidate", methods=["POST"])
+@internal
+def invalidate_users():
+    """
+    Drop users from the cache of this worker and the shared cache: {"ids": [...]}, or every user
+    without ids. Other workers keep their copy until USER_CACHE_TTL passes.
+    """
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get("ids")
+    if user_ids is not None and not isinstance(user_ids, list):
+        return jsonify({"error": "ids should be a list of user ids."}), 400
+    if user_ids is not None:
+        # cached under their canonical form, see get_user_by_id
+        try:
+            user_ids = [str(uuid.UUID(user_id)) for user_id in user_ids]
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({"error": "ids should be a list of user ids."}), 400
+    current_app.extensions['user_cache'].invalidate(user_ids)
+    return jsonify({"invalidated": "all" if user_ids is None else len(user_ids)}), 200
+
+
+@users_blueprint.route("/users/snapshot/reload", methods=["POST"])
+@internal
+def reload_snapshot():
+    """
+    Read the users table again into the snapshot of this worker (USER_STORE=snapshot), at most
+    once per USER_SNAPSHOT_RELOAD_INTERVAL.
+    """
+    store = current_app.extensions.get('user_snapshot')
+    if store is None:
+        return jsonify({"error": "The users are not served from a snapshot."}), 404
+    try:
+        snapshot = store.reload()
+    except ReloadTooSoon as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": str(math.ceil(e.retry_after))}
+    return jsonify({"users": len(snapshot), "loaded_at": snapshot.loaded_at}), 200
+
+
+def load_user(user_id):
+    user = db.session.get(User, user_id)
+    return user.to_dict() if user is not None else None
+
+
+# users of a batch lookup, in one round trip
+SELECT_USERS_BY_ID = text("SELECT id::text, name, email FROM users WHERE id = ANY(CAST(:ids AS uuid[]))")
+
+
+def load_users(user_ids):
+    rows = db.session.execute(SELECT_USERS_BY_ID, {"ids": user_ids}).all()
+    return {row.id: {"id": row.id, "name": row.name, "email": row.email} for row in rows}
+
+
+def get_users_by_id(user_ids):
+    """
+    GET /users?id=...&id=...: the users among the ids, in the order they were asked for. Unknown
+    ids are left out, repeated ones answered once.
+    """
+    try:
+        user_ids = list(dict.fromkeys(str(uuid.UUID(user_id)) for user_id in user_ids))
+    except ValueError:
+        return jsonify({"error": "The user ids are not valid."}), 400
+    if len(user_ids) > current_app.config['USER_BATCH_MAX']:
+        return jsonify({"error": f"At most {current_app.config['USER_BATCH_MAX']} ids per request."}), 400
+
+    store = current_app.extensions.get('user_snapshot')
+    if store is not None:
+        snapshot = store.snapshot
+        users = {user_id: snapshot.get(user_id) for user_id in user_ids}
+    else:
+        users = current_app.extensions['user_cache'].get_many(user_ids, load_users)
+    return jsonify([users[user_id] for user_id in user_ids if users.get(user_id) is not None]), 200
+
+
 @users_blueprint.route("/users", methods=["GET"])
 def get_all_users():
+    if "id" in request.args:
+        return get_users_by_id(request.args.getlist("id"))
+    try:
+        page = Page.from_request()
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
     try:
         logging.info("Handling request for /api/v1/users")
-        users_data = User.query.all()
+        store = current_app.extensions.get('user_snapshot')
+        if store is not None:
+            users_data, last_id = store.snapshot.page(page.after, page.limit) if page else store.snapshot.page(None, None)
+            response = jsonify(users_data)
+            if last_id:
+                response.headers["Link"] = page.link(encode_cursor(last_id))
+            return response, 200
+        if page:
+            users_data, next_cursor = page.rows(User.query, User.id)
+        else:
+            users_data, next_cursor = User.query.all(), None
         users_data = [user.to_dict() for user in users_data]
-        return jsonify(users_data), 200
+        response = jsonify(users_data)
+        if next_cursor:
+            response.headers["Link"] = page.link(next_cursor)
+        return response, 200
     except Exception as e:
         logging.error(f"Error in get_all_users: {e}")
         return jsonify({"error": "Internal server error./users"}), 500
@@ -37,10 +165,20 @@ def get_all_users():
 def get_user_by_id(user_id):
     if user_id == "health":
         return health_check()
+    store = current_app.extensions.get('user_snapshot')
+    if store is not None:
+        user_data = store.snapshot.get(user_id)
+        if user_data is None:
+            return jsonify({"error": "User not found."}), 404
+        return jsonify(user_data), 200
+    # one cache entry per user, however the id is spelled
+    try:
+        user_id = str(uuid.UUID(user_id))
+    except ValueError:
+        return jsonify({"error": "User not found."}), 404
     try:
-        user_data = User.query.get(user_id)
+        user_data = current_app.extensions['user_cache'].get(user_id, load_user)
         if user_data is not None:
-            user_data = user_data.to_dict()
             return jsonify(user_data), 200
         else:
             return jsonify({"error": "User not found."}), 404
@@ -25,6 +25,19 @@ resource "null_resource" "init_db" {
   }
 }
 
+resource "null_resource" "migrate_db" {
+  depends_on = [null_resource.init_db]
+
+  # re-run whenever a migration file is added or changed
+  triggers = {
+    migrations = sha1(join(",", [for f in fileset("${path.module}/database/migrations", "*.sql") : filesha1("${path.module}/database/migrations/${f}")]))
+  }
+
+  provisioner "local-exec" {
+    command = "python3 ./database/migrate.py ${local.rds_uri}/${aws_db_instance.taskoverflow.db_name}"
+  }
+}
+
 resource "aws_db_parameter_group" "ticketoverflow" {
   name   = "ticketoverflow"
   family = "postgres14"
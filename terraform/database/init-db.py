@@ -2,6 +2,8 @@ import json
 import psycopg2
 import sys
 
+import migrate
+
 db_host = sys.argv[1]
 db_name = sys.argv[2]
 db_user = sys.argv[3]
@@ -23,27 +25,9 @@ conn = psycopg2.connect(
     password=db_password
 )
 
-print("init tables..")
-# with conn.cursor() as cursor:
-#     cursor.execute("SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'users')")
-#     exists = cursor.fetchone()[0]
-#
-# if not exists:
-#     print("Tables do not exist. Initializing..")
-#     # execute the sql file init-db.sql to create the table
-#     with conn.cursor() as cursor:
-#         with open("./database/init-db.sql", "r") as f:
-#             cursor.execute(f.read())
-#         conn.commit()
-# else:
-#     print("Tables already exist. Skipping initialization.")
-
-
-# execute the sql file init-db.sql to create the table
-with conn.cursor() as cursor:
-    with open("./database/init-db.sql", "r") as f:
-        cursor.execute(f.read())
-    conn.commit()
+print("migrate tables..")
+# apply the versioned migrations in ./database/migrations, a no-op when the schema is up to date
+migrate.migrate(conn)
 
 #todo: downlaod the latest data
 
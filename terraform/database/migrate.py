@@ -0,0 +1,152 @@
+"""
+Versioned schema migrations for the TicketOverFlow database.
+
+Every file in ./migrations named NNNN_description.sql is one migration. They are applied in
+version order, each in its own transaction, and recorded in the schema_migrations table.
+A session level advisory lock serialises concurrent runners, so a deploy that starts the
+migration from several places at once still applies every version exactly once.
+
+The web services never run DDL. They only check at startup that schema_migrations has reached
+the SCHEMA_VERSION their models expect (see models/__init__.py of each service).
+
+Usage:
+    python3 migrate.py <database uri>            apply all pending migrations
+    python3 migrate.py <database uri> --status   print applied and pending versions
+"""
+import os
+import re
+import sys
+
+import psycopg2
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+# Key of the pg advisory lock held while migrating. Any constant works as long as every runner uses the same one.
+ADVISORY_LOCK_KEY = 6440_0001
+
+CREATE_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+  version INTEGER PRIMARY KEY,
+  name VARCHAR(255) NOT NULL,
+  applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def read(self):
+        with open(self.path, "r") as f:
+            return f.read()
+
+    def __repr__(self):
+        return f"{self.version:04d}_{self.name}"
+
+
+def discover(migrations_dir=MIGRATIONS_DIR):
+    """
+    List the migrations found in migrations_dir, sorted by version.
+    """
+    migrations = []
+    for file_name in os.listdir(migrations_dir):
+        match = MIGRATION_FILE.match(file_name)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(migrations_dir, file_name)))
+    migrations.sort(key=lambda migration: migration.version)
+
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {migrations_dir}")
+    return migrations
+
+
+def applied_versions(conn):
+    """
+    Versions recorded in schema_migrations, empty if the table does not exist yet.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return set()
+        cur.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn, migrations_dir=MIGRATIONS_DIR):
+    """
+    Apply the pending migrations and return the ones applied by this call.
+    Blocks while another runner holds the migration lock.
+    """
+    conn.autocommit = False
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+    conn.commit()
+
+    applied = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_VERSION_TABLE)
+        conn.commit()
+
+        # read the applied versions after taking the lock, a concurrent runner may just have finished
+        done = applied_versions(conn)
+        for migration in discover(migrations_dir):
+            if migration.version in done:
+                continue
+            print(f">> applying migration {migration}")
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(migration.read())
+                    cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                (migration.version, migration.name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(migration)
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+        conn.commit()
+    return applied
+
+
+def status(conn, migrations_dir=MIGRATIONS_DIR):
+    """
+    Return (applied, pending) migrations.
+    """
+    done = applied_versions(conn)
+    conn.rollback()
+    migrations = discover(migrations_dir)
+    return ([migration for migration in migrations if migration.version in done],
+            [migration for migration in migrations if migration.version not in done])
+
+
+def main(argv):
+    if len(argv) < 2:
+        print(__doc__)
+        return 2
+
+    conn = psycopg2.connect(argv[1])
+    try:
+        if "--status" in argv[2:]:
+            applied, pending = status(conn)
+            for migration in applied:
+                print(f"applied  {migration}")
+            for migration in pending:
+                print(f"pending  {migration}")
+        else:
+            applied = migrate(conn)
+            print(f">> {len(applied)} migration(s) applied")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
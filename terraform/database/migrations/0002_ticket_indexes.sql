@@ -0,0 +1,12 @@
+-- Tickets are always looked up by concert or by user, never scanned as a whole.
+-- The INCLUDE columns let listings and counts be answered from the index alone.
+
+-- get_all_tickets?concert_id=, the sold count when purchasing, update_concert and the
+-- lambda's get_concert_info subquery
+CREATE INDEX IF NOT EXISTS ix_tickets_concert_id ON tickets (concert_id) INCLUDE (id, user_id, print_status);
+
+-- get_all_tickets?user_id=
+CREATE INDEX IF NOT EXISTS ix_tickets_user_id ON tickets (user_id) INCLUDE (id, concert_id, print_status);
+
+-- print status lookups by ticket id (POST/GET /tickets/<id>/print) without touching the svg in the heap
+CREATE INDEX IF NOT EXISTS ix_tickets_id_print_status ON tickets (id) INCLUDE (print_status);
@@ -0,0 +1,8 @@
+-- Number of tickets sold per concert. Purchases reserve a seat with one conditional
+-- UPDATE ... WHERE tickets_sold < capacity instead of counting the tickets of the concert.
+ALTER TABLE concerts ADD COLUMN IF NOT EXISTS tickets_sold INTEGER NOT NULL DEFAULT 0;
+
+UPDATE concerts
+SET tickets_sold = sold.num_tickets
+FROM (SELECT concert_id, COUNT(*) AS num_tickets FROM tickets GROUP BY concert_id) AS sold
+WHERE concerts.id = sold.concert_id;
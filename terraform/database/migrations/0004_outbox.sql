@@ -0,0 +1,7 @@
+-- Transactional outbox for Hamilton render requests. Rows are written in the same transaction
+-- as the ticket or concert change and drained to SQS by the relay thread of each service worker.
+CREATE TABLE IF NOT EXISTS outbox (
+  id BIGSERIAL PRIMARY KEY,
+  body TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
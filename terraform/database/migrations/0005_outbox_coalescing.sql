@@ -0,0 +1,9 @@
+-- Coalesce seating plan renders: at most one pending render request per concert.
+-- Purchases insert with ON CONFLICT (dedup_key) DO UPDATE, which only bumps `coalesced` while a request
+-- is pending. available_at holds a request back for the coalescing window so a presale burst collapses
+-- into one render per window. Requests without a dedup_key (ticket prints) are never coalesced.
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS dedup_key VARCHAR(255);
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS available_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS coalesced INTEGER NOT NULL DEFAULT 0;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_outbox_dedup_key ON outbox (dedup_key);
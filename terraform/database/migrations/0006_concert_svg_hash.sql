@@ -0,0 +1,17 @@
+-- Content hash of the rendered seating plan, the ETag of GET /concerts/<id>/seats.
+-- Kept by a trigger so every writer of concerts.svg (the Hamilton lambda, concert updates) keeps it
+-- current, and a conditional request can be answered from this column without reading the svg.
+ALTER TABLE concerts ADD COLUMN IF NOT EXISTS svg_hash CHAR(32);
+
+CREATE OR REPLACE FUNCTION concerts_svg_hash() RETURNS trigger AS $$
+BEGIN
+  NEW.svg_hash := md5(NEW.svg);
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS concerts_svg_hash ON concerts;
+CREATE TRIGGER concerts_svg_hash BEFORE INSERT OR UPDATE OF svg ON concerts
+  FOR EACH ROW EXECUTE FUNCTION concerts_svg_hash();
+
+UPDATE concerts SET svg_hash = md5(svg) WHERE svg_hash IS DISTINCT FROM md5(svg);
@@ -0,0 +1,8 @@
+-- GET /tickets?concert_id= and ?user_id= are paginated by ticket id (WHERE id > :cursor ORDER BY id
+-- LIMIT). With id as the second key column a page is a range scan of the index, without it every
+-- page sorts all tickets of the concert or user. The replaced indexes served the same lookups.
+CREATE INDEX IF NOT EXISTS ix_tickets_concert_id_id ON tickets (concert_id, id) INCLUDE (user_id, print_status);
+CREATE INDEX IF NOT EXISTS ix_tickets_user_id_id ON tickets (user_id, id) INCLUDE (concert_id, print_status);
+
+DROP INDEX IF EXISTS ix_tickets_concert_id;
+DROP INDEX IF EXISTS ix_tickets_user_id;
@@ -0,0 +1,21 @@
+-- Announce every committed change of what readers cache about a concert on the concert_changed channel,
+-- with the concert id as payload. A trigger, so every writer is covered: concert create/update, the
+-- ticket service marking a concert SOLD_OUT and the Hamilton lambda storing a new plan (svg_hash).
+-- Workers LISTEN and evict the concert, see service_concert/invalidation.py. tickets_sold changes on
+-- every purchase and is not announced. NOTIFY is sent on commit and merged per transaction.
+CREATE OR REPLACE FUNCTION concerts_notify_changed() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'UPDATE'
+     AND (OLD.name, OLD.venue, OLD.date, OLD.capacity, OLD.status, OLD.svg_seat_num, OLD.svg_hash)
+         IS NOT DISTINCT FROM
+         (NEW.name, NEW.venue, NEW.date, NEW.capacity, NEW.status, NEW.svg_seat_num, NEW.svg_hash) THEN
+    RETURN NULL;
+  END IF;
+  PERFORM pg_notify('concert_changed', NEW.id::text);
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS concerts_notify_changed ON concerts;
+CREATE TRIGGER concerts_notify_changed AFTER INSERT OR UPDATE ON concerts
+  FOR EACH ROW EXECUTE FUNCTION concerts_notify_changed();
@@ -0,0 +1,4 @@
+-- ix_tickets_id_print_status duplicated the primary key: a print status lookup by id is one row, read
+-- through tickets_pkey and its heap tuple (a rendered svg is TOASTed, so it is not read along). The
+-- index only cost a B-tree write on every ticket insert.
+DROP INDEX IF EXISTS ix_tickets_id_print_status;
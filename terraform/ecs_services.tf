@@ -14,7 +14,7 @@ resource "aws_ecs_service" "concert" {
     container_name = "concert"
     container_port = "7777"
   }
-  depends_on = [aws_lb_listener.ticketoverflow]
+  depends_on = [aws_lb_listener.ticketoverflow, null_resource.migrate_db]
 }
 
 resource "aws_ecs_service" "user" {
@@ -33,7 +33,7 @@ resource "aws_ecs_service" "user" {
     container_name = "user"
     container_port = "8888"
   }
-  depends_on = [aws_lb_listener.ticketoverflow]
+  depends_on = [aws_lb_listener.ticketoverflow, null_resource.migrate_db]
 }
 
 resource "aws_ecs_service" "ticket" {
@@ -52,5 +52,5 @@ resource "aws_ecs_service" "ticket" {
     container_name = "ticket"
     container_port = "9999"
   }
-  depends_on = [aws_lb_listener.ticketoverflow]
+  depends_on = [aws_lb_listener.ticketoverflow, null_resource.migrate_db]
 }
\ No newline at end of file
@@ -16,7 +16,7 @@ resource "aws_lambda_function" "hamilton" {
       "DB_NAME" = aws_db_instance.taskoverflow.db_name
       "DB_USER" = aws_db_instance.taskoverflow.username
       "DB_PASS" = aws_db_instance.taskoverflow.password
-
+      "RENDER_ENGINE" = "pipe"
     }
   }
 }
@@ -24,7 +24,11 @@ resource "aws_lambda_function" "hamilton" {
 resource "aws_lambda_event_source_mapping" "hamilton_sqs" {
   event_source_arn = aws_sqs_queue.hamilton.arn
   function_name = aws_lambda_function.hamilton.arn
-  batch_size = 1
+  # one invocation renders up to 10 records over one db connection, lambda_handler reports the
+  # records that failed so only those are redelivered
+  batch_size = 10
+  maximum_batching_window_in_seconds = 1
+  function_response_types = ["ReportBatchItemFailures"]
 }
 
 #resource "aws_lambda_permission" "allow_api_gateway" {
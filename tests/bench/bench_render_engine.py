@@ -0,0 +1,83 @@
+"""
+Renders per second of the lambda render engines (lambda_hamilton/render_engine.py) with the stub
+Hamilton of tests/stubs/hamilton.py:
+
+    shell     the render before the engines: a shell per render, input and output through /tmp files
+    oneshot   Hamilton started from an argument list, input and output through files
+    pipe      Hamilton started from an argument list, input over stdin and the SVG over a pipe
+    native    the in-process ticket template (tickets only)
+
+--startup-ms models the start of the renderer binary, --render-ms the render itself.
+
+    python tests/bench/bench_render_engine.py --iterations 200 --startup-ms 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import REPO_ROOT, STUB_HAMILTON, measure, print_result
+
+sys.path.append(os.path.join(REPO_ROOT, "lambda_hamilton"))
+
+import render_engine  # noqa: E402
+
+TICKET = {"id": "9d5a5ac6-3d8a-4c8e-a1b3-6b0c8a1f0d7e", "name": "Buyer", "email": "buyer@example.org",
+          "concert": {"id": "75fdeba8-0d46-4381-ba82-f5c369bd767e", "name": "Concert 1", "date": "2023-10-02",
+                      "venue": "Venue 1"}}
+SEATING = {"id": "75fdeba8-0d46-4381-ba82-f5c369bd767e", "name": "Concert 1", "date": "2023-10-02",
+           "venue": "Venue 1", "seats": {"max": 2000, "purchased": 700}}
+
+
+class ShellEngine:
+    """
+    The render of lambda_function before the render engines, for comparison.
+    """
+
+    def __init__(self, hamilton_path, work_dir):
+        self.hamilton_path = hamilton_path
+        self.work_dir = work_dir
+
+    def render(self, kind, render_input):
+        input_path = f"{self.work_dir}/{render_input['id']}.json"
+        output_path = f"{self.work_dir}/{render_input['id']}"
+        with open(input_path, "w") as f:
+            json.dump(render_input, f)
+        subprocess.check_output(f"{self.hamilton_path} generate {kind} --input {input_path} --output {output_path}",
+                                shell=True, stderr=subprocess.STDOUT)
+        with open(f"{output_path}.svg", "r") as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--startup-ms", type=float, default=5.0)
+    parser.add_argument("--render-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    os.environ["STUB_HAMILTON_STARTUP_MS"] = str(args.startup_ms)
+    os.environ["STUB_HAMILTON_RENDER_MS"] = str(args.render_ms)
+
+    print(f"stub Hamilton, startup {args.startup_ms} ms, render {args.render_ms} ms")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for kind, render_input in (("ticket", TICKET), ("seating", SEATING)):
+            for name in ("shell", "oneshot", "pipe", "native"):
+                if kind not in render_engine.ENGINES.get(name, render_engine.KINDS):
+                    continue
+                if name == "shell":
+                    engine = ShellEngine(STUB_HAMILTON, work_dir)
+                else:
+                    engine = render_engine.create_engine(name, STUB_HAMILTON, work_dir)
+                try:
+                    print_result(f"{kind} {name}", measure(lambda: engine.render(kind, render_input), args.iterations))
+                finally:
+                    engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Cost of updating the seating plan of a large venue after one more sale: a full one-shot render
+with the stub Hamilton of tests/stubs/hamilton.py, against lambda_hamilton/seating.py marking the
+new seat on a plan it already holds (warm) or first has to parse (cold).
+
+    python tests/bench/bench_seating.py --capacity 5000 --iterations 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from common import REPO_ROOT, STUB_HAMILTON, measure, print_result
+
+sys.path.append(os.path.join(REPO_ROOT, "lambda_hamilton"))
+sys.path.append(os.path.join(REPO_ROOT, "tests", "stubs"))
+
+import hamilton  # noqa: E402
+import render_engine  # noqa: E402
+import seating  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--capacity", type=int, default=5000)
+    args = parser.parse_args()
+
+    plan = {"id": "75fdeba8-0d46-4381-ba82-f5c369bd767e", "name": "Concert 1", "date": "2023-10-02",
+            "venue": "Venue 1", "seats": {"max": args.capacity, "purchased": 0}}
+    stored = hamilton.seating_plan(plan)
+    print(f"seating plan of {args.capacity} seats, {len(stored)} bytes")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        engine = render_engine.create_engine("oneshot", STUB_HAMILTON, work_dir)
+
+        def full_render():
+            plan["seats"]["purchased"] += 1
+            engine.render("seating", plan)
+
+        print_result("full render (stub one-shot)", measure(full_render, min(args.iterations, 50)))
+
+    seat_map = seating.SeatMap.parse(stored)
+
+    def warm():
+        seat_map.sell(seat_map.purchased + 1)
+        seat_map.render()
+
+    print_result("incremental, warm", measure(warm, args.iterations))
+
+    def cold():
+        cold_map = seating.SeatMap.parse(stored)
+        cold_map.sell(1)
+        cold_map.render()
+
+    print_result("incremental, cold", measure(cold, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
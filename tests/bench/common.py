@@ -0,0 +1,89 @@
+"""
+Shared helpers for the micro benchmarks in this folder.
+
+The services are not installable packages: each one is started from its own
+folder and imports `app`, `models` and `views` as top level modules. The
+helpers below put one service folder on sys.path at a time so a benchmark can
+import it the same way gunicorn does.
+"""
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SERVICE_MODULES = ("app", "asgi", "models", "views")
+# renders like the Hamilton binary, see tests/stubs/hamilton.py
+STUB_HAMILTON = os.path.join(REPO_ROOT, "tests", "stubs", "hamilton.py")
+
+
+def load_service(service_name):
+    """
+    Import the `app` module of a service folder (service_ticket, service_concert, service_user).
+    Modules of a previously loaded service are dropped first, the services share module names.
+    """
+    for name in list(sys.modules):
+        if name.split(".")[0] in SERVICE_MODULES:
+            del sys.modules[name]
+    service_dir = os.path.join(REPO_ROOT, service_name)
+    sys.path = [path for path in sys.path if not path.startswith(os.path.join(REPO_ROOT, "service_"))]
+    sys.path.insert(0, service_dir)
+    import app
+    return app
+
+
+def load_lambda(database, hamilton_path=STUB_HAMILTON):
+    """
+    Import lambda_hamilton/lambda_function with DB_HOST, DB_NAME, DB_USER and DB_PASS taken from a
+    database URI, rendering with hamilton_path. The folder goes to the end of sys.path: its vendored
+    psycopg2 is built for the lambda runtime, the local one is used instead.
+    """
+    from sqlalchemy.engine import make_url
+    url = make_url(database)
+    os.environ.update({
+        "DB_HOST": url.host or url.query.get("host", "localhost"),
+        "DB_NAME": url.database,
+        "DB_USER": url.username or "postgres",
+        "DB_PASS": url.password or "",
+        "HAMILTON_PATH": hamilton_path,
+    })
+    sys.modules.pop("lambda_function", None)
+    sys.modules.pop("render_engine", None)
+    lambda_dir = os.path.join(REPO_ROOT, "lambda_hamilton")
+    if lambda_dir not in sys.path:
+        sys.path.append(lambda_dir)
+    import lambda_function
+    return lambda_function
+
+
+def database_uri():
+    """
+    Database used by the benchmarks. Point BENCH_DATABASE_URI at the local postgres from
+    dev_db/dev_local_postgres for numbers that are comparable with production.
+    """
+    return os.environ.get("BENCH_DATABASE_URI", "sqlite:////tmp/ticketoverflow_bench.db")
+
+
+def measure(fn, iterations):
+    """
+    Call fn `iterations` times and return a dict with the throughput and latency percentiles.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "per_sec": iterations / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def print_result(label, result):
+    print(f"{label:<32} {result['per_sec']:>10.1f}/s  p50 {result['p50_ms']:>8.3f} ms  "
+          f"p99 {result['p99_ms']:>8.3f} ms  ({result['iterations']} iterations)")
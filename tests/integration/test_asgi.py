@@ -0,0 +1,180 @@
+import asyncio
+import contextlib
+import json
+import re
+import uuid
+
+import httpx
+
+from .base import PostgresCase, load_service
+
+USER_ID = str(uuid.uuid4())
+CONCERT_ID = str(uuid.uuid4())
+SMALL_CONCERT_ID = str(uuid.uuid4())
+NEXT = re.compile(r'^<(?P<url>[^>]+)>; rel="next"$')
+
+
+class AsgiClient:
+    """
+    Requests to an ASGI app with its lifespan started, all on one event loop like a worker's.
+    """
+
+    def __init__(self, app):
+        self.loop = asyncio.new_event_loop()
+        self.lifespan = contextlib.AsyncExitStack()
+        self.loop.run_until_complete(self.lifespan.enter_async_context(app.router.lifespan_context(app)))
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver")
+
+    def get(self, url, **kwargs):
+        return self.loop.run_until_complete(self.client.get(url, **kwargs))
+
+    def post(self, url, **kwargs):
+        return self.loop.run_until_complete(self.client.post(url, **kwargs))
+
+    def close(self):
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.run_until_complete(self.lifespan.aclose())
+        self.loop.close()
+
+
+class TestAsgiTicketService(PostgresCase):
+    """
+    asgi.py answers like the Flask app: same bodies for the lists and lookups, same status codes and
+    database effects for purchases and prints.
+    """
+    tickets = 9
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (id, name, email) VALUES (%s, 'buyer', 'buyer@example.org')", (USER_ID,))
+            cur.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                        "VALUES (%s, 'async', 'venue', '2023-07-05', 100, 'ACTIVE')", (CONCERT_ID,))
+            cur.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                        "VALUES (%s, 'small', 'venue', '2023-07-05', 1, 'ACTIVE')", (SMALL_CONCERT_ID,))
+            cur.execute("INSERT INTO tickets (id, concert_id, user_id, print_status) "
+                        "SELECT gen_random_uuid(), %s, %s, 'NOT_PRINTED' FROM generate_series(1, %s)",
+                        (CONCERT_ID, USER_ID, cls.tickets))
+        conn.commit()
+        conn.close()
+        cls.service = load_service("service_ticket")
+        import asgi
+        cls.asgi = asgi
+
+    def config(self, **config):
+        return {"SQLALCHEMY_DATABASE_URI": self.database_uri, "SQS_QUEUE_URL": None,
+                "SERVICE_CONCERT_URL": "http://concerts/api/v1/concerts",
+                "SERVICE_USER_URL": "http://users/api/v1/users", **config}
+
+    def clients(self, **config):
+        """
+        A Flask test client and an ASGI client of the same configuration.
+        """
+        flask_client = self.service.create_app(self.config(**config)).test_client()
+        asgi_client = AsgiClient(self.asgi.create_app(self.config(**config)))
+        self.addCleanup(asgi_client.close)
+        return flask_client, asgi_client
+
+    def test_same_responses_as_flask(self):
+        ticket_id = self.execute("SELECT id::text FROM tickets ORDER BY id LIMIT 1")[0][0]
+        paths = (
+            "/api/v1/tickets",
+            "/api/v1/tickets?limit=4",
+            f"/api/v1/tickets?concert_id={CONCERT_ID}&limit=2",
+            f"/api/v1/tickets?user_id={USER_ID}",
+            f"/api/v1/tickets?concert_id={uuid.uuid4()}",
+            "/api/v1/tickets?concert_id=not-a-uuid",
+            "/api/v1/tickets?venue=somewhere",
+            "/api/v1/tickets?limit=0",
+            f"/api/v1/tickets/{ticket_id}",
+            f"/api/v1/tickets/{uuid.uuid4()}",
+            "/api/v1/tickets/health",
+            f"/api/v1/tickets/{ticket_id}/print",
+        )
+        for config in ({"LIST_PAGE_SIZE": 0, "LIST_STREAM_ROWS": 4}, {"LIST_PAGE_SIZE": 0, "LIST_STREAM_ROWS": 0},
+                       {"LIST_PAGE_SIZE": 3}):
+            flask_client, asgi_client = self.clients(**config)
+            for path in paths:
+                with self.subTest(path=path, config=config):
+                    expected = flask_client.get(path)
+                    response = asgi_client.get(path)
+                    self.assertEqual(expected.status_code, response.status_code)
+                    if expected.status_code == 200:
+                        self.assertEqual(expected.data, response.content)
+                        self.assertEqual(expected.headers.get("Link"), response.headers.get("link"))
+
+    def test_pages_link_to_the_next_one(self):
+        _, client = self.clients()
+        ids, url = [], f"/api/v1/tickets?concert_id={CONCERT_ID}&limit=4"
+        while url:
+            response = client.get(url)
+            ids += [ticket["id"] for ticket in response.json()]
+            link = response.headers.get("link")
+            url = NEXT.match(link).group("url") if link else None
+        self.assertEqual([row[0] for row in self.execute(
+            "SELECT id::text FROM tickets WHERE concert_id = %s ORDER BY id", (CONCERT_ID,))], ids)
+
+    def test_purchase(self):
+        _, client = self.clients()
+        response = client.post("/api/v1/tickets", json={"concert_id": SMALL_CONCERT_ID, "user_id": USER_ID})
+        self.assertEqual(201, response.status_code, response.text)
+        ticket = response.json()
+        self.assertEqual({
+            "id": ticket["id"],
+            "concert": {"id": SMALL_CONCERT_ID, "url": f"http://concerts/api/v1/concerts/{SMALL_CONCERT_ID}"},
+            "user": {"id": USER_ID, "url": f"http://users/api/v1/users/{USER_ID}"},
+            "print_status": "NOT_PRINTED",
+        }, ticket)
+        self.assertEqual([(SMALL_CONCERT_ID, USER_ID, "NOT_PRINTED")], self.execute(
+            "SELECT concert_id::text, user_id::text, print_status FROM tickets WHERE id = %s", (ticket["id"],)))
+        self.assertEqual(1, self.execute("SELECT count(*) FROM outbox WHERE dedup_key = %s",
+                                         (f"concert:{SMALL_CONCERT_ID}",))[0][0])
+
+        # the concert has one seat: the next purchase finds it full and marks it sold out
+        response = client.post("/api/v1/tickets", json={"concert_id": SMALL_CONCERT_ID, "user_id": USER_ID})
+        self.assertEqual(422, response.status_code)
+        self.assertEqual([("SOLD_OUT", 1)], self.execute(
+            "SELECT status, tickets_sold FROM concerts WHERE id = %s", (SMALL_CONCERT_ID,)))
+
+    def test_invalid_purchases(self):
+        flask_client, asgi_client = self.clients()
+        tickets = self.execute("SELECT count(*) FROM tickets")[0][0]
+        bodies = (
+            {"concert_id": CONCERT_ID},
+            {"concert_id": "nope", "user_id": USER_ID},
+            {"concert_id": 1, "user_id": USER_ID},
+            {"concert_id": str(uuid.uuid4()), "user_id": USER_ID},
+            {"concert_id": CONCERT_ID, "user_id": str(uuid.uuid4())},
+            [CONCERT_ID, USER_ID],
+        )
+        for body in bodies:
+            with self.subTest(body=body):
+                expected = flask_client.post("/api/v1/tickets", json=body)
+                response = asgi_client.post("/api/v1/tickets", json=body)
+                self.assertEqual(400, expected.status_code)
+                self.assertEqual(400, response.status_code)
+        response = asgi_client.post("/api/v1/tickets", content=json.dumps({"concert_id": CONCERT_ID}))
+        self.assertEqual(flask_client.post("/api/v1/tickets", data="{}").status_code, response.status_code)
+        self.assertEqual(tickets, self.execute("SELECT count(*) FROM tickets")[0][0])
+
+    def test_print(self):
+        ticket_id, printed_id = (row[0] for row in self.execute(
+            "SELECT id::text FROM tickets WHERE concert_id = %s ORDER BY id DESC LIMIT 2", (CONCERT_ID,)))
+        self.execute("UPDATE tickets SET print_status = 'PRINTED', svg = '<svg />' WHERE id = %s", (printed_id,))
+        _, client = self.clients()
+
+        self.assertEqual(202, client.post(f"/api/v1/tickets/{ticket_id}/print").status_code)
+        self.assertEqual("PENDING", self.execute("SELECT print_status FROM tickets WHERE id = %s", (ticket_id,))[0][0])
+        self.assertEqual(1, self.execute("SELECT count(*) FROM outbox WHERE body = %s",
+                                         (json.dumps({"event": "ticket", "id": ticket_id}),))[0][0])
+        self.assertEqual(500, client.post(f"/api/v1/tickets/{ticket_id}/print").status_code)
+        self.assertEqual(404, client.get(f"/api/v1/tickets/{ticket_id}/print").status_code)
+
+        response = client.get(f"/api/v1/tickets/{printed_id}/print")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("image/svg+xml", response.headers["content-type"])
+        self.assertEqual("<svg />", response.text)
+        self.assertEqual(500, client.post(f"/api/v1/tickets/{printed_id}/print").status_code)
+        self.assertEqual(404, client.post(f"/api/v1/tickets/{uuid.uuid4()}/print").status_code)
@@ -0,0 +1,121 @@
+import select
+import time
+import uuid
+
+from .base import PostgresCase, load_service
+
+
+class TestConcertInvalidation(PostgresCase):
+    """
+    Changes of a concert by any writer are announced on concert_changed, and a concert worker with a
+    long CONCERT_CACHE_TTL evicts the concert as soon as it hears of it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.service = load_service("service_concert")
+        from metrics import metrics
+        cls.metrics = metrics
+
+    def setUp(self):
+        self.metrics.reset()
+        self.concert_id = str(uuid.uuid4())
+        self.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                     "VALUES (%s, 'before', 'venue', '2023-07-05', 10, 'ACTIVE')", (self.concert_id,))
+
+    def notifications(self, *statements):
+        """
+        Payloads announced on concert_changed while statements ran, each in its own transaction.
+        """
+        listener = self.connect()
+        listener.autocommit = True
+        try:
+            with listener.cursor() as cur:
+                cur.execute("LISTEN concert_changed")
+            for statement, params in statements:
+                self.execute(statement, params)
+            select.select([listener], [], [], 0.5)
+            listener.poll()
+            return [notify.payload for notify in listener.notifies]
+        finally:
+            listener.close()
+
+    def test_changes_are_announced(self):
+        changes = (
+            ("UPDATE concerts SET name = 'after' WHERE id = %s", (self.concert_id,)),
+            ("UPDATE concerts SET status = 'SOLD_OUT' WHERE id = %s", (self.concert_id,)),
+            # the Hamilton lambda storing a plan changes svg_hash
+            ("UPDATE concerts SET svg = '<svg />', svg_seat_num = 1 WHERE id = %s", (self.concert_id,)),
+        )
+        for change in changes:
+            with self.subTest(change[0]):
+                self.assertEqual([self.concert_id], self.notifications(change))
+
+        new_id = str(uuid.uuid4())
+        self.assertEqual([new_id], self.notifications(
+            ("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+             "VALUES (%s, 'new', 'venue', '2023-07-05', 10, 'ACTIVE')", (new_id,))))
+
+    def test_purchases_and_rewrites_are_not_announced(self):
+        self.assertEqual([], self.notifications(
+            ("UPDATE concerts SET tickets_sold = tickets_sold + 1 WHERE id = %s", (self.concert_id,)),
+            ("UPDATE concerts SET name = 'before', status = 'ACTIVE' WHERE id = %s", (self.concert_id,)),
+        ))
+
+    def client(self, **config):
+        app = self.service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri, "SQS_QUEUE_URL": None,
+                                       "CONCERT_CACHE_TTL": 300, **config})
+        listener = app.extensions["concert_listener"]
+        self.addCleanup(listener.stop)
+        self.assertTrue(listener.listening.wait(5))
+        return app.test_client(), listener
+
+    def eventually(self, fetch, expected):
+        deadline = time.monotonic() + 5
+        while fetch() != expected:
+            if time.monotonic() > deadline:
+                self.assertEqual(expected, fetch())
+            time.sleep(0.02)
+
+    def test_worker_evicts_concerts_changed_elsewhere(self):
+        client, _ = self.client()
+        url = f"/api/v1/concerts/{self.concert_id}"
+        self.assertEqual("ACTIVE", client.get(url).get_json()["status"])
+
+        # as the ticket service marks a full concert
+        self.execute("UPDATE concerts SET status = 'SOLD_OUT' WHERE id = %s", (self.concert_id,))
+        self.eventually(lambda: client.get(url).get_json()["status"], "SOLD_OUT")
+        self.assertGreaterEqual(self.metrics.snapshot()["counters"]["concert_listener.notify"], 1)
+
+        # as the Hamilton lambda stores a plan
+        seats = f"/api/v1/concerts/{self.concert_id}/seats"
+        self.assertEqual(404, client.get(seats).status_code)
+        self.execute("UPDATE concerts SET svg = '<svg />', svg_seat_num = 0 WHERE id = %s", (self.concert_id,))
+        self.eventually(lambda: client.get(seats).status_code, 200)
+
+    def test_cache_dropped_after_a_reconnect(self):
+        client, listener = self.client()
+        url = f"/api/v1/concerts/{self.concert_id}"
+        client.get(url)
+        self.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                     "WHERE datname = current_database() AND query LIKE 'LISTEN%%'")
+        self.eventually(lambda: self.metrics.snapshot()["counters"].get("concert_listener.error", 0), 1)
+        # changed while nobody listened
+        self.execute("UPDATE concerts SET name = 'missed' WHERE id = %s", (self.concert_id,))
+        self.assertTrue(listener.listening.wait(5))
+        self.assertEqual("missed", client.get(url).get_json()["name"])
+
+    def test_without_invalidation_the_ttl_applies(self):
+        app = self.service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri, "SQS_QUEUE_URL": None,
+                                       "CONCERT_CACHE_TTL": 300, "CONCERT_INVALIDATION": "none"})
+        self.assertNotIn("concert_listener", app.extensions)
+        client = app.test_client()
+        url = f"/api/v1/concerts/{self.concert_id}"
+        client.get(url)
+        self.execute("UPDATE concerts SET name = 'after' WHERE id = %s", (self.concert_id,))
+        time.sleep(0.2)
+        self.assertEqual("before", client.get(url).get_json()["name"])
+
+        with self.assertRaises(ValueError):
+            self.service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri, "CONCERT_INVALIDATION": "redis"})
@@ -0,0 +1,137 @@
+import gzip
+import re
+import unittest
+import uuid
+
+from sqlalchemy import event
+
+from .base import PostgresCase, load_service
+
+PLAN = '<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg">\n<desc>{}|10|{}</desc>\n</svg>\n'
+# a statement reading the svg column itself, not svg_hash or svg_seat_num
+READS_SVG = re.compile(r"concerts\.svg\b(?!_)")
+
+
+class TestConcertSeats(PostgresCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.service = load_service("service_concert")
+        # plans re-rendered by the lambda are served right away, without the short read cache
+        cls.app = cls.service.create_app({"SQLALCHEMY_DATABASE_URI": cls.database_uri, "SQS_QUEUE_URL": None,
+                                          "CONCERT_CACHE_TTL": 0})
+        cls.client = cls.app.test_client()
+        cls.statements = []
+        with cls.app.app_context():
+            event.listen(cls.service.db.engine, "before_cursor_execute",
+                         lambda conn, cursor, statement, *args: cls.statements.append(statement))
+
+    def setUp(self):
+        self.concert_id = str(uuid.uuid4())
+        self.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                     "VALUES (%s, 'seats', 'venue', '2023-07-05', 10, 'ACTIVE')", (self.concert_id,))
+
+    def render(self, purchased):
+        svg = PLAN.format(self.concert_id, purchased)
+        # as the Hamilton lambda stores it
+        self.execute("UPDATE concerts SET svg = %s, svg_seat_num = %s WHERE id = %s", (svg, purchased, self.concert_id))
+        return svg
+
+    def get(self, **headers):
+        self.statements.clear()
+        return self.client.get(f"/api/v1/concerts/{self.concert_id}/seats", headers=headers)
+
+    def reads_svg(self):
+        return any(READS_SVG.search(statement) for statement in self.statements)
+
+    def test_plan_with_etag(self):
+        svg = self.render(1)
+        response = self.get()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("image/svg+xml", response.headers["Content-Type"])
+        self.assertEqual(svg.encode(), response.data)
+        self.assertEqual(f'"{self.execute("SELECT md5(%s)", (svg,))[0][0]}"', response.headers["ETag"])
+
+    def test_not_modified_without_reading_the_plan(self):
+        self.render(1)
+        etag = self.get().headers["ETag"]
+
+        response = self.get(**{"If-None-Match": etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response.headers["ETag"])
+        self.assertFalse(self.reads_svg())
+
+        # the lambda rendered a new plan
+        svg = self.render(2)
+        response = self.get(**{"If-None-Match": etag})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(svg.encode(), response.data)
+        self.assertNotEqual(etag, response.headers["ETag"])
+
+    def test_cached_plan_is_served_without_reading_it(self):
+        from metrics import metrics
+        svg = self.render(3)
+        self.get()
+        hits = metrics.snapshot()["counters"].get("blob_cache.hit", 0)
+
+        response = self.get()
+        self.assertEqual(svg.encode(), response.data)
+        self.assertFalse(self.reads_svg())
+        self.assertEqual(hits + 1, metrics.snapshot()["counters"]["blob_cache.hit"])
+
+    def test_gzip_variant(self):
+        svg = self.render(4)
+        identity = self.get()
+        response = self.get(**{"Accept-Encoding": "gzip"})
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(svg.encode(), gzip.decompress(response.data))
+        self.assertNotEqual(identity.headers["ETag"], response.headers["ETag"])
+
+        self.assertEqual(304, self.get(**{"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+                         .status_code)
+        self.assertEqual(200, self.get(**{"If-None-Match": response.headers["ETag"]}).status_code)
+
+    def test_brotli_variant(self):
+        import blob_cache
+        if blob_cache.brotli is None:
+            raise unittest.SkipTest("brotli is not installed")
+        svg = self.render(5)
+        response = self.get(**{"Accept-Encoding": "gzip, deflate, br"})
+        self.assertEqual("br", response.headers["Content-Encoding"])
+        self.assertEqual(svg.encode(), blob_cache.brotli.decompress(response.data))
+        self.assertTrue(response.headers["ETag"].endswith('-br"'), response.headers["ETag"])
+
+        self.assertEqual(304, self.get(**{"Accept-Encoding": "br", "If-None-Match": response.headers["ETag"]})
+                         .status_code)
+        self.assertFalse(self.reads_svg())
+        # a client without brotli gets gzip
+        self.assertEqual("gzip", self.get(**{"Accept-Encoding": "gzip"}).headers["Content-Encoding"])
+
+    def test_missing_plan_or_concert(self):
+        self.assertEqual(404, self.get().status_code)
+        self.render(1)
+        # PUT /concerts/<id> clears the plan
+        self.assertEqual(200, self.client.put(f"/api/v1/concerts/{self.concert_id}", json={"name": "new"})
+                         .status_code)
+        self.assertEqual(404, self.get().status_code)
+        self.assertEqual(404, self.client.get(f"/api/v1/concerts/{uuid.uuid4()}/seats").status_code)
+
+
+class TestBlobCache(unittest.TestCase):
+    def test_bounded_by_size(self):
+        load_service("service_concert")
+        from blob_cache import BlobCache, Blob
+
+        size = Blob("a", "x" * 1000).size
+        cache = BlobCache(max_bytes=size * 2)
+        for digest in "abc":
+            cache.put(digest, "x" * 1000)
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("b"))
+        cache.put("d", "x" * 1000)
+        # b was used more recently than c
+        self.assertIsNotNone(cache.get("b"))
+        self.assertIsNone(cache.get("c"))
+        self.assertLessEqual(cache.size, cache.max_bytes)
@@ -0,0 +1,56 @@
+import os
+import unittest
+from unittest import mock
+
+from .base import PostgresCase, load_service
+
+
+class TestEngineOptions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_service("service_ticket")
+        import db_pool
+        cls.db_pool = db_pool
+
+    def options(self, background_threads=0, **environ):
+        with mock.patch.dict(os.environ, environ):
+            for name in ("GUNICORN_THREADS", "DB_POOL_SIZE", "DB_MAX_OVERFLOW"):
+                if name not in environ:
+                    os.environ.pop(name, None)
+            return self.db_pool.engine_options(background_threads)
+
+    def test_sized_from_the_gunicorn_threads(self):
+        self.assertEqual(1, self.options()["pool_size"])
+        self.assertEqual(2, self.options(GUNICORN_THREADS="2")["pool_size"])
+        self.assertEqual(3, self.options(background_threads=1, GUNICORN_THREADS="2")["pool_size"])
+        self.assertTrue(self.options()["pool_pre_ping"])
+
+    def test_overrides(self):
+        options = self.options(GUNICORN_THREADS="2", DB_POOL_SIZE="8", DB_MAX_OVERFLOW="0", DB_POOL_RECYCLE="60")
+        self.assertEqual((8, 0, 60), (options["pool_size"], options["max_overflow"], options["pool_recycle"]))
+
+
+class TestTimedPool(PostgresCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.service = load_service("service_user")
+        cls.app = cls.service.create_app({"SQLALCHEMY_DATABASE_URI": cls.database_uri, "USER_CACHE_SIZE": 0})
+        cls.client = cls.app.test_client()
+
+    def setUp(self):
+        from metrics import metrics
+        self.metrics = metrics
+        metrics.reset()
+
+    def test_checkout_wait_is_reported(self):
+        for _ in range(3):
+            self.assertEqual(200, self.client.get("/api/v1/users?limit=5").status_code)
+        timers = self.client.get("/api/v1/users/metrics").get_json()["timers"]
+        self.assertEqual(3, timers["db.pool.checkout_wait"]["count"])
+
+    def test_pre_ping_replaces_a_dead_connection(self):
+        self.assertEqual(200, self.client.get("/api/v1/users?limit=5").status_code)
+        self.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                     "WHERE datname = current_database() AND pid <> pg_backend_pid()")
+        self.assertEqual(200, self.client.get("/api/v1/users?limit=5").status_code)
@@ -0,0 +1,80 @@
+import re
+import unittest
+import uuid
+
+from sqlalchemy import event
+
+from .base import PostgresCase, load_service
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+SVG = '<svg xmlns="http://www.w3.org/2000/svg"><desc>{}</desc></svg>'
+# a statement reading an svg column itself, not svg_hash or svg_seat_num
+READS_SVG = re.compile(r"(tickets|concerts)\.svg\b(?!_)")
+
+
+class DeferredSvgCase(PostgresCase):
+    service_name = None
+
+    @classmethod
+    def setUpClass(cls):
+        if cls.service_name is None:
+            raise unittest.SkipTest("base class")
+        super().setUpClass()
+        cls.service = load_service(cls.service_name)
+        cls.app = cls.service.create_app({"SQLALCHEMY_DATABASE_URI": cls.database_uri, "SQS_QUEUE_URL": None})
+        cls.client = cls.app.test_client()
+        cls.statements = []
+        with cls.app.app_context():
+            event.listen(cls.service.db.engine, "before_cursor_execute",
+                         lambda conn, cursor, statement, *args: cls.statements.append(statement))
+
+        cls.concert_id = str(uuid.uuid4())
+        cls.ticket_id = str(uuid.uuid4())
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (id, name, email) VALUES (%s, 'buyer', 'buyer@example.org')", (USER_ID,))
+            cur.execute("INSERT INTO concerts (id, name, venue, date, capacity, status, svg) "
+                        "VALUES (%s, 'svg', 'venue', '2023-07-05', 10, 'ACTIVE', %s)",
+                        (cls.concert_id, SVG.format(cls.concert_id)))
+            cur.execute("INSERT INTO tickets (id, concert_id, user_id, print_status, svg) "
+                        "VALUES (%s, %s, %s, 'PRINTED', %s)",
+                        (cls.ticket_id, cls.concert_id, USER_ID, SVG.format(cls.ticket_id)))
+        conn.commit()
+        conn.close()
+
+    def get(self, path):
+        self.statements.clear()
+        return self.client.get(f"/api/v1{path}")
+
+    def reads_svg(self):
+        return any(READS_SVG.search(statement) for statement in self.statements)
+
+
+class TestTicketSvgIsDeferred(DeferredSvgCase):
+    service_name = "service_ticket"
+
+    def test_lists_and_lookups_do_not_read_svg(self):
+        for path in ("/tickets", f"/tickets?concert_id={self.concert_id}", f"/tickets?user_id={USER_ID}",
+                     f"/tickets/{self.ticket_id}"):
+            self.assertEqual(200, self.get(path).status_code, path)
+            self.assertFalse(self.reads_svg(), path)
+
+    def test_print_reads_svg(self):
+        response = self.get(f"/tickets/{self.ticket_id}/print")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(SVG.format(self.ticket_id).encode(), response.data)
+        self.assertTrue(self.reads_svg())
+
+
+class TestConcertSvgIsDeferred(DeferredSvgCase):
+    service_name = "service_concert"
+
+    def test_lists_and_lookups_do_not_read_svg(self):
+        for path in ("/concerts", f"/concerts/{self.concert_id}"):
+            self.assertEqual(200, self.get(path).status_code, path)
+            self.assertFalse(self.reads_svg(), path)
+
+    def test_seats_reads_svg(self):
+        response = self.get(f"/concerts/{self.concert_id}/seats")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(SVG.format(self.concert_id).encode(), response.data)
@@ -0,0 +1,162 @@
+import json
+import os
+import tempfile
+import uuid
+from unittest import mock
+
+import psycopg2.extensions
+
+from .base import PostgresCase, load_lambda
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class RenderLog:
+    """
+    Ids rendered by the stub Hamilton (tests/stubs/hamilton.py) while active.
+    """
+
+    def __enter__(self):
+        self.file = tempfile.NamedTemporaryFile(mode="r", suffix=".log")
+        self.environ = mock.patch.dict(os.environ, {"STUB_HAMILTON_LOG": self.file.name})
+        self.environ.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.environ.stop()
+        self.file.close()
+
+    @property
+    def rendered(self):
+        self.file.seek(0)
+        return [line.split()[1] for line in self.file.read().splitlines()]
+
+
+def record(event, _id):
+    return {"messageId": str(uuid.uuid4()), "body": json.dumps({"event": event, "id": _id})}
+
+
+class TestLambdaBatch(PostgresCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.lambda_function = load_lambda(cls.database_uri)
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (id, name, email) VALUES (%s, 'buyer', 'buyer@example.org')", (USER_ID,))
+        conn.commit()
+        conn.close()
+
+    def setUp(self):
+        self.hamilton = RenderLog().__enter__()
+        self.addCleanup(self.hamilton.__exit__, None, None, None)
+
+    def create_concert(self):
+        concert_id = str(uuid.uuid4())
+        self.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                     "VALUES (%s, 'batch', 'venue', '2023-07-05', 10, 'ACTIVE')", (concert_id,))
+        return concert_id
+
+    def create_ticket(self, concert_id):
+        ticket_id = str(uuid.uuid4())
+        self.execute("INSERT INTO tickets (id, concert_id, user_id, print_status) VALUES (%s, %s, %s, 'PENDING')",
+                     (ticket_id, concert_id, USER_ID))
+        return ticket_id
+
+    def test_batch_renders_each_concert_once(self):
+        concert_a, concert_b = self.create_concert(), self.create_concert()
+        ticket_id = self.create_ticket(concert_a)
+        records = [record("concert", concert_a), record("concert", concert_b), record("concert", concert_a),
+                   record("ticket", ticket_id), record("concert", concert_a)]
+
+        response = self.lambda_function.lambda_handler({"Records": records}, None)
+
+        self.assertEqual({"batchItemFailures": []}, response)
+        self.assertEqual(sorted([ticket_id, concert_a, concert_b]), sorted(self.hamilton.rendered))
+        self.assertEqual([("PRINTED",)], self.execute("SELECT print_status FROM tickets WHERE id = %s", (ticket_id,)))
+        rendered = self.execute("SELECT count(*) FROM concerts WHERE id IN (%s, %s) AND svg IS NOT NULL",
+                                (concert_a, concert_b))
+        self.assertEqual([(2,)], rendered)
+
+    def test_failed_records_are_reported(self):
+        concert_id = self.create_concert()
+        missing = [record("ticket", str(uuid.uuid4())), record("ticket", str(uuid.uuid4()))]
+        missing_twice = record("concert", str(uuid.uuid4()))
+        records = [missing[0], record("concert", concert_id), missing[1], missing_twice,
+                   dict(missing_twice, messageId=str(uuid.uuid4())),
+                   {"messageId": str(uuid.uuid4()), "body": "not json"},
+                   {"messageId": str(uuid.uuid4()), "body": json.dumps({"event": "user", "id": USER_ID})}]
+
+        response = self.lambda_function.lambda_handler({"Records": records}, None)
+
+        # every record of a failed id is redelivered, malformed and unknown records are dropped
+        failed = {failure["itemIdentifier"] for failure in response["batchItemFailures"]}
+        self.assertEqual({records[0]["messageId"], records[2]["messageId"],
+                          records[3]["messageId"], records[4]["messageId"]}, failed)
+        self.assertEqual([concert_id], self.hamilton.rendered)
+
+
+class TestLambdaConnection(PostgresCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.lambda_function = load_lambda(cls.database_uri)
+
+    def setUp(self):
+        self.concert_id = str(uuid.uuid4())
+        self.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                     "VALUES (%s, 'warm', 'venue', '2023-07-05', 10, 'ACTIVE')", (self.concert_id,))
+
+    def invoke(self):
+        return self.lambda_function.lambda_handler({"Records": [record("concert", self.concert_id)]}, None)
+
+    def test_warm_invocations_reuse_the_connection(self):
+        stats = self.lambda_function.connection_stats
+        connects = stats["connects"]
+        for _ in range(3):
+            self.assertEqual({"batchItemFailures": []}, self.invoke())
+        self.assertLessEqual(stats["connects"] - connects, 1)
+        self.assertGreaterEqual(stats["reuses"], 2)
+
+    def test_reconnects_after_the_server_dropped_the_connection(self):
+        self.invoke()
+        backend = self.lambda_function._conn.get_backend_pid()
+        self.execute("SELECT pg_terminate_backend(%s)", (backend,))
+
+        connects = self.lambda_function.connection_stats["connects"]
+        self.assertEqual({"batchItemFailures": []}, self.invoke())
+        self.assertEqual(connects + 1, self.lambda_function.connection_stats["connects"])
+        self.assertNotEqual(backend, self.lambda_function._conn.get_backend_pid())
+
+    def test_no_transaction_is_left_open_after_an_aborted_render(self):
+        self.invoke()
+        # a plan drawn for more seats than sold, the render returns without an update
+        self.execute("UPDATE concerts SET svg_seat_num = 5 WHERE id = %s", (self.concert_id,))
+        self.assertEqual({"batchItemFailures": []}, self.invoke())
+
+        conn = self.lambda_function._conn
+        self.assertEqual(psycopg2.extensions.TRANSACTION_STATUS_IDLE, conn.get_transaction_status())
+        locks = self.execute("SELECT count(*) FROM pg_locks WHERE pid = %s AND relation = 'concerts'::regclass",
+                             (conn.get_backend_pid(),))
+        self.assertEqual([(0,)], locks)
+
+    def test_connection_broken_during_a_render(self):
+        self.invoke()
+        conn = self.lambda_function._conn
+
+        def broken_render(_id, conn):
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            # the server drops the connection, the render fails before psycopg2 notices
+            self.execute("SELECT pg_terminate_backend(%s)", (conn.get_backend_pid(),))
+            raise RuntimeError("hamilton failed")
+
+        broken = record("ticket", str(uuid.uuid4()))
+        with mock.patch.dict(self.lambda_function.RENDERERS, {"ticket": broken_render}):
+            response = self.lambda_function.lambda_handler(
+                {"Records": [broken, record("concert", self.concert_id)]}, None)
+
+        # only the broken record is retried, the concert after it rendered over a new connection
+        self.assertEqual({"batchItemFailures": [{"itemIdentifier": broken["messageId"]}]}, response)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(conn, self.lambda_function._conn)
@@ -0,0 +1,57 @@
+import threading
+
+from .base import PostgresCase, load_service, migrate
+
+
+class TestMigrations(PostgresCase):
+    migrate = False
+
+    def versions(self):
+        return [row[0] for row in self.execute("SELECT version FROM schema_migrations ORDER BY version")]
+
+    def test_migrate_applies_every_version_once(self):
+        """
+        Concurrent runners serialise on the advisory lock, every version is applied exactly once
+        """
+        errors = []
+
+        def run():
+            conn = self.connect()
+            try:
+                migrate.migrate(conn)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual([migration.version for migration in migrate.discover()], self.versions())
+        for table in ("users", "tickets", "concerts"):
+            self.assertTrue(self.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))[0][0])
+
+        # a second run has nothing left to do
+        conn = self.connect()
+        self.assertEqual([], migrate.migrate(conn))
+        conn.close()
+
+    def test_service_schema_check(self):
+        """
+        SCHEMA_MODE=check refuses to start on an unmigrated database and starts without DDL once migrated
+        """
+        self.execute("DROP TABLE IF EXISTS schema_migrations")
+        service = load_service("service_ticket")
+        overrides = {"SQLALCHEMY_DATABASE_URI": self.database_uri, "SCHEMA_MODE": "check"}
+        with self.assertRaises(RuntimeError):
+            service.create_app(overrides)
+
+        conn = self.connect()
+        migrate.migrate(conn)
+        conn.close()
+        app = service.create_app(overrides)
+        self.assertEqual(200, app.test_client().get("/api/v1/tickets/health").status_code)
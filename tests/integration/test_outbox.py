@@ -0,0 +1,255 @@
+import json
+import os
+import threading
+import unittest
+import uuid
+from unittest import mock
+
+from .base import PostgresCase, load_service
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class StandInQueue:
+    """
+    Records send_message_batch calls like SQS would accept them. Message bodies listed in
+    `reject` are reported as failed.
+    """
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def send_message_batch(self, QueueUrl, Entries):
+        assert 1 <= len(Entries) <= 10
+        with self.lock:
+            self.batches.append([entry["MessageBody"] for entry in Entries])
+        return {
+            "Successful": [{"Id": entry["Id"]} for entry in Entries if entry["MessageBody"] not in self.reject],
+            "Failed": [{"Id": entry["Id"], "Message": "rejected"} for entry in Entries
+                       if entry["MessageBody"] in self.reject],
+        }
+
+    @property
+    def sent(self):
+        return [json.loads(body) for batch in self.batches for body in batch]
+
+
+class TestOutbox(PostgresCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.service = load_service("service_ticket")
+        from outbox import OutboxRelay
+        cls.OutboxRelay = OutboxRelay
+        cls.app = cls.service.create_app({"SQLALCHEMY_DATABASE_URI": cls.database_uri, "SQS_QUEUE_URL": None,
+                                          "RENDER_COALESCE_WINDOW": 0})
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (id, name, email) VALUES (%s, 'buyer', 'buyer@example.org')", (USER_ID,))
+        conn.commit()
+        conn.close()
+
+    def setUp(self):
+        self.execute("DELETE FROM outbox")
+
+    def relay(self, queue):
+        with self.app.app_context():
+            engine = self.service.db.engine
+        return self.OutboxRelay(engine, "stand-in", mock.Mock(), client_factory=lambda: queue)
+
+    def create_concert(self, capacity=100):
+        concert_id = str(uuid.uuid4())
+        self.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                     "VALUES (%s, 'outbox', 'venue', '2023-07-05', %s, 'ACTIVE')", (concert_id, capacity))
+        return concert_id
+
+    def outbox(self):
+        return [json.loads(row[0]) for row in self.execute("SELECT body FROM outbox ORDER BY id")]
+
+    def test_render_requests_commit_with_the_change(self):
+        concert_id = self.create_concert(capacity=1)
+        client = self.app.test_client()
+        response = client.post("/api/v1/tickets", json={"concert_id": concert_id, "user_id": USER_ID})
+        self.assertEqual(201, response.status_code)
+        ticket_id = response.json["id"]
+
+        # sold out: nothing is committed, so nothing is queued
+        response = client.post("/api/v1/tickets", json={"concert_id": concert_id, "user_id": USER_ID})
+        self.assertEqual(422, response.status_code)
+
+        self.assertEqual(202, client.post(f"/api/v1/tickets/{ticket_id}/print").status_code)
+        self.assertEqual([{"event": "concert", "id": concert_id}, {"event": "ticket", "id": ticket_id}], self.outbox())
+
+    def test_relay_sends_batches_of_ten(self):
+        client = self.app.test_client()
+        for _ in range(25):
+            client.post("/api/v1/tickets", json={"concert_id": self.create_concert(), "user_id": USER_ID})
+
+        queue = StandInQueue()
+        relay = self.relay(queue)
+        self.assertEqual([10, 10, 5, 0], [relay.drain_once() for _ in range(4)])
+        self.assertEqual([10, 10, 5], [len(batch) for batch in queue.batches])
+        self.assertEqual([], self.outbox())
+
+    def test_purchases_coalesce_into_one_seating_render(self):
+        from metrics import metrics
+        metrics.reset()
+        concert_id = self.create_concert()
+        client = self.app.test_client()
+        for _ in range(20):
+            self.assertEqual(201, client.post("/api/v1/tickets", json={"concert_id": concert_id, "user_id": USER_ID})
+                             .status_code)
+        self.assertEqual([(19,)], self.execute("SELECT coalesced FROM outbox"))
+
+        queue = StandInQueue()
+        self.assertEqual(1, self.relay(queue).drain_once())
+        self.assertEqual([{"event": "concert", "id": concert_id}], queue.sent)
+        self.assertEqual(19, metrics.snapshot()["counters"]["outbox.coalesced"])
+
+        # once sent, the next purchase queues a new render
+        client.post("/api/v1/tickets", json={"concert_id": concert_id, "user_id": USER_ID})
+        self.assertEqual([{"event": "concert", "id": concert_id}], self.outbox())
+
+    def test_seating_render_waits_for_the_coalesce_window(self):
+        concert_id = self.create_concert()
+        self.app.config["RENDER_COALESCE_WINDOW"] = 60
+        try:
+            self.app.test_client().post("/api/v1/tickets", json={"concert_id": concert_id, "user_id": USER_ID})
+        finally:
+            self.app.config["RENDER_COALESCE_WINDOW"] = 0
+
+        queue = StandInQueue()
+        self.assertEqual(0, self.relay(queue).drain_once())
+        self.assertEqual([{"event": "concert", "id": concert_id}], self.outbox())
+
+        self.execute("UPDATE outbox SET available_at = now()")
+        self.assertEqual(1, self.relay(queue).drain_once())
+
+    def test_purchases_during_a_send_are_not_lost(self):
+        concert_id = self.create_concert()
+        client = self.app.test_client()
+        client.post("/api/v1/tickets", json={"concert_id": concert_id, "user_id": USER_ID})
+
+        queue = StandInQueue()
+        statuses = []
+
+        def send_message_batch(**kwargs):
+            # a purchase while the claimed render is on its way to SQS merges into it without waiting
+            purchase = threading.Thread(target=lambda: statuses.append(
+                client.post("/api/v1/tickets", json={"concert_id": concert_id, "user_id": USER_ID}).status_code))
+            purchase.start()
+            purchase.join(timeout=5)
+            self.assertFalse(purchase.is_alive())
+            return StandInQueue.send_message_batch(queue, **kwargs)
+
+        queue.send_message_batch = send_message_batch
+        self.assertEqual(1, self.relay(queue).drain_once())
+        self.assertEqual([201], statuses)
+
+        # the send may have read the seats before that purchase, so its render stays queued
+        self.assertEqual([(0,)], self.execute("SELECT coalesced FROM outbox"))
+        self.assertEqual(1, self.relay(StandInQueue()).drain_once())
+        self.assertEqual([], self.outbox())
+
+    def test_rejected_messages_stay_in_the_outbox(self):
+        rejected = {"event": "ticket", "id": str(uuid.uuid4())}
+        accepted = {"event": "concert", "id": str(uuid.uuid4())}
+        for body in (rejected, accepted):
+            self.execute("INSERT INTO outbox (body) VALUES (%s)", (json.dumps(body),))
+
+        queue = StandInQueue(reject={json.dumps(rejected)})
+        self.assertEqual(1, self.relay(queue).drain_once())
+        self.assertEqual([rejected], self.outbox())
+
+        # retried once its lease ran out
+        queue.reject.clear()
+        self.assertEqual(0, self.relay(queue).drain_once())
+        self.execute("UPDATE outbox SET available_at = now()")
+        self.assertEqual(1, self.relay(queue).drain_once())
+        self.assertEqual([], self.outbox())
+
+    def test_concurrent_relays_send_each_message_once(self):
+        for i in range(200):
+            self.execute("INSERT INTO outbox (body) VALUES (%s)", (json.dumps({"event": "ticket", "id": str(i)}),))
+
+        queue = StandInQueue()
+        relays = [self.relay(queue) for _ in range(4)]
+
+        def drain(relay):
+            while relay.drain_once():
+                pass
+
+        threads = [threading.Thread(target=drain, args=(relay,)) for relay in relays]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(str(i) for i in range(200)), sorted(message["id"] for message in queue.sent))
+        self.assertEqual([], self.outbox())
+
+    def test_failed_send_is_retried_after_the_lease(self):
+        self.execute("INSERT INTO outbox (body) VALUES (%s)", (json.dumps({"event": "ticket", "id": "1"}),))
+        queue = mock.Mock()
+        queue.send_message_batch.side_effect = ConnectionError("SQS is unreachable")
+        with self.assertRaises(ConnectionError):
+            self.relay(queue).drain_once()
+
+        # the claim committed before the send, no transaction waited on it
+        self.assertEqual([(True,)], self.execute("SELECT available_at > now() + interval '50 seconds' FROM outbox"))
+        self.assertEqual(0, self.relay(StandInQueue()).drain_once())
+        self.execute("UPDATE outbox SET available_at = now()")
+        self.assertEqual(1, self.relay(StandInQueue()).drain_once())
+
+    def test_send_time_is_reported(self):
+        from metrics import metrics
+        metrics.reset()
+        self.execute("INSERT INTO outbox (body) VALUES (%s)", (json.dumps({"event": "ticket", "id": "1"}),))
+        self.relay(StandInQueue()).drain_once()
+
+        response = self.app.test_client().get("/api/v1/tickets/metrics")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.json["timers"]["sqs.send_message_batch"]["count"])
+        self.assertEqual(1, response.json["counters"]["outbox.sent"])
+
+
+class TestSharedSQSClient(unittest.TestCase):
+    @mock.patch.dict(os.environ, {"AWS_DEFAULT_REGION": "us-east-1"})
+    def test_one_client_per_worker(self):
+        load_service("service_ticket")
+        import sqs_client
+        from metrics import metrics
+
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(sqs_client.get_client(max_pool_connections=25)))
+                   for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len({id(client) for client in clients}))
+        self.assertEqual(25, clients[0].meta.config.max_pool_connections)
+        self.assertEqual(1, metrics.snapshot()["timers"]["sqs.client_build"]["count"])
+
+
+class TestConcertOutbox(PostgresCase):
+    def test_create_and_update_queue_render_requests(self):
+        service = load_service("service_concert")
+        app = service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri, "SQS_QUEUE_URL": None})
+        client = app.test_client()
+
+        response = client.post("/api/v1/concerts", json={
+            "name": "outbox", "venue": "venue", "date": "2023-07-05", "capacity": 10, "status": "ACTIVE"})
+        self.assertEqual(201, response.status_code)
+        concert_id = response.json["id"]
+        response = client.put(f"/api/v1/concerts/{concert_id}", json={"name": "renamed"})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("renamed", response.json["name"])
+
+        # the update merges into the render still pending from the create
+        rows = [(json.loads(body), coalesced) for body, coalesced in
+                self.execute("SELECT body, coalesced FROM outbox ORDER BY id")]
+        self.assertEqual([({"event": "concert", "id": concert_id}, 1)], rows)
@@ -0,0 +1,119 @@
+import re
+import uuid
+
+from .base import PostgresCase, load_service
+
+USER_ID = str(uuid.uuid4())
+CONCERT_ID = str(uuid.uuid4())
+OTHER_CONCERT_ID = str(uuid.uuid4())
+NEXT = re.compile(r'^<(?P<url>[^>]+)>; rel="next"$')
+
+
+class TestPagination(PostgresCase):
+    """
+    Walks GET /tickets, /concerts and /users page by page: every row is listed once, in id order.
+    """
+    tickets = 7
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (id, name, email) VALUES (%s, 'buyer', 'buyer@example.org')", (USER_ID,))
+            for i in range(4):
+                cur.execute("INSERT INTO users (id, name, email) VALUES (%s, 'user', %s)",
+                            (str(uuid.uuid4()), f"user{i}@example.org"))
+            for concert_id in (CONCERT_ID, OTHER_CONCERT_ID):
+                cur.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                            "VALUES (%s, 'paged', 'venue', '2023-07-05', 100, 'ACTIVE')", (concert_id,))
+            for i in range(cls.tickets):
+                cur.execute("INSERT INTO tickets (id, concert_id, user_id, print_status) "
+                            "VALUES (%s, %s, %s, 'NOT_PRINTED')",
+                            (str(uuid.uuid4()), CONCERT_ID if i % 2 else OTHER_CONCERT_ID, USER_ID))
+        conn.commit()
+        conn.close()
+
+    def client(self, service_name, **config):
+        service = load_service(service_name)
+        app = service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri, "SQS_QUEUE_URL": None, **config})
+        return app.test_client()
+
+    def walk(self, client, url):
+        """
+        Ids of every page from url on, and the number of pages.
+        """
+        ids, pages = [], 0
+        while url:
+            response = client.get(url)
+            self.assertEqual(200, response.status_code, response.data)
+            ids += [row["id"] for row in response.get_json()]
+            pages += 1
+            link = response.headers.get("Link")
+            url = NEXT.match(link).group("url") if link else None
+        return ids, pages
+
+    def ids(self, sql, params=None):
+        return [str(row[0]) for row in self.execute(sql, params)]
+
+    def test_pages_of_every_list(self):
+        lists = (
+            ("service_ticket", "/api/v1/tickets", "SELECT id FROM tickets ORDER BY id::text"),
+            ("service_concert", "/api/v1/concerts", "SELECT id FROM concerts ORDER BY id::text"),
+            ("service_user", "/api/v1/users", "SELECT id FROM users ORDER BY id::text"),
+        )
+        for service_name, path, sql in lists:
+            with self.subTest(path):
+                client = self.client(service_name)
+                ids, pages = self.walk(client, f"{path}?limit=2")
+                expected = self.ids(sql)
+                self.assertEqual(expected, ids)
+                self.assertEqual((len(expected) + 1) // 2, pages)
+
+    def test_filtered_pages_keep_the_filter(self):
+        client = self.client("service_ticket")
+        ids, pages = self.walk(client, f"/api/v1/tickets?concert_id={CONCERT_ID}&limit=2")
+        self.assertEqual(self.ids("SELECT id FROM tickets WHERE concert_id = %s ORDER BY id::text", (CONCERT_ID,)), ids)
+        self.assertEqual(2, pages)
+
+    def test_default_page_size(self):
+        client = self.client("service_ticket", LIST_PAGE_SIZE=3)
+        response = client.get("/api/v1/tickets")
+        self.assertEqual(3, len(response.get_json()))
+        self.assertIn("limit=3", response.headers["Link"])
+
+        client = self.client("service_ticket", LIST_PAGE_SIZE=3, LIST_MAX_PAGE_SIZE=4)
+        self.assertEqual(4, len(client.get("/api/v1/tickets?limit=50").get_json()))
+
+    def test_whole_lists_by_default(self):
+        lists = (
+            ("service_ticket", "/api/v1/tickets", "SELECT id FROM tickets"),
+            ("service_concert", "/api/v1/concerts", "SELECT id FROM concerts"),
+            ("service_user", "/api/v1/users", "SELECT id FROM users"),
+        )
+        for service_name, path, sql in lists:
+            with self.subTest(path):
+                client = self.client(service_name)
+                response = client.get(path)
+                self.assertEqual(sorted(self.ids(sql)), sorted(row["id"] for row in response.get_json()))
+                self.assertNotIn("Link", response.headers)
+                # a client can still ask for pages
+                self.assertEqual(2, len(client.get(f"{path}?limit=2").get_json()))
+
+    def test_page_past_the_end_of_a_filter_is_empty(self):
+        client = self.client("service_ticket")
+        last = self.ids("SELECT id FROM tickets WHERE concert_id = %s ORDER BY id::text DESC LIMIT 1", (CONCERT_ID,))[0]
+        from pagination import encode_cursor
+
+        response = client.get(f"/api/v1/tickets?concert_id={CONCERT_ID}&cursor={encode_cursor(last)}")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], response.get_json())
+        # the first page of an unknown filter is still a 404
+        self.assertEqual(404, client.get(f"/api/v1/tickets?concert_id={uuid.uuid4()}").status_code)
+
+    def test_invalid_page_parameters(self):
+        for service_name, path in (("service_ticket", "/api/v1/tickets"), ("service_user", "/api/v1/users")):
+            client = self.client(service_name)
+            for query in ("limit=abc", "limit=0", "cursor=not-a-cursor"):
+                with self.subTest(path=path, query=query):
+                    self.assertEqual(400, client.get(f"{path}?{query}").status_code)
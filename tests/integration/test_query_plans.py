@@ -0,0 +1,114 @@
+import json
+import os
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql
+
+from .base import PostgresCase, load_service
+
+# 1M tickets spread over 2000 concerts and 1000 users, override with TEST_PLAN_TICKETS for a quicker run
+TICKETS = int(os.environ.get("TEST_PLAN_TICKETS", 1_000_000))
+CONCERTS = 2000
+USERS = 1000
+
+
+def seeded_uuid(prefix, n):
+    """
+    Ids of the seeded rows: users are 00000001-..., concerts 00000002-...
+    """
+    return f"{prefix:08x}-0000-0000-0000-{n:012x}"
+
+
+class TestQueryPlans(PostgresCase):
+    """
+    The hot ticket queries must use the primary key or the indexes from 0002_ticket_indexes.sql and
+    0007_ticket_keyset_indexes.sql. Fails when any of them falls back to a sequential scan of tickets on a seeded dataset.
+    """
+    concert_id = seeded_uuid(2, 7)
+    user_id = seeded_uuid(1, 7)
+    ticket_id = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO tickets (id, concert_id, user_id, print_status)
+                SELECT gen_random_uuid(),
+                       ('00000002-0000-0000-0000-' || lpad(to_hex(mod(i, %(concerts)s)), 12, '0'))::uuid,
+                       ('00000001-0000-0000-0000-' || lpad(to_hex(mod(i, %(users)s)), 12, '0'))::uuid,
+                       'NOT_PRINTED'
+                FROM generate_series(1, %(tickets)s) AS i
+            """, {"concerts": CONCERTS, "users": USERS, "tickets": TICKETS})
+            cur.execute("""
+                INSERT INTO concerts (id, name, venue, date, capacity, status)
+                SELECT ('00000002-0000-0000-0000-' || lpad(to_hex(i), 12, '0'))::uuid,
+                       'concert', 'venue', '2023-07-05', 5000, 'ACTIVE'
+                FROM generate_series(0, %(concerts)s - 1) AS i
+            """, {"concerts": CONCERTS})
+            cur.execute("SELECT id FROM tickets LIMIT 1")
+            cls.ticket_id = str(cur.fetchone()[0])
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE tickets")
+            cur.execute("VACUUM ANALYZE concerts")
+        conn.close()
+
+        cls.service = load_service("service_ticket")
+        cls.app = cls.service.create_app({"SQLALCHEMY_DATABASE_URI": cls.database_uri, "SCHEMA_MODE": "skip"})
+
+    def hot_queries(self):
+        """
+        The statements the services and the lambda run against tickets, compiled from the models where they exist.
+        """
+        from models.ticket import Ticket
+
+        with self.app.app_context():
+            statements = {
+                "list tickets of a concert": Ticket.query.filter_by(concert_id=self.concert_id).statement,
+                "list tickets of a user": Ticket.query.filter_by(user_id=self.user_id).statement,
+                "page of the tickets of a concert": Ticket.query.filter_by(concert_id=self.concert_id).filter(
+                    Ticket.id > seeded_uuid(0, 0)).order_by(Ticket.id).limit(100).statement,
+                "page of the tickets of a user": Ticket.query.filter_by(user_id=self.user_id).filter(
+                    Ticket.id > seeded_uuid(0, 0)).order_by(Ticket.id).limit(100).statement,
+                "list tickets of a user at a concert":
+                    Ticket.query.filter_by(user_id=self.user_id, concert_id=self.concert_id).statement,
+                "count sold tickets": select(func.count()).select_from(Ticket).where(
+                    Ticket.concert_id == self.concert_id),
+                "reset tickets of an updated concert": update(Ticket).where(
+                    Ticket.concert_id == self.concert_id).values(print_status="NOT_PRINTED", svg=None),
+                "print status of a ticket": select(Ticket.print_status).where(Ticket.id == self.ticket_id),
+            }
+            queries = {
+                name: str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+                for name, statement in statements.items()
+            }
+
+        # lambda_hamilton get_concert_info
+        queries["lambda concert info"] = (
+            f"SELECT id, name, date, venue, capacity, (SELECT COUNT(*) FROM tickets WHERE concert_id = "
+            f"'{self.concert_id}') FROM concerts WHERE id = '{self.concert_id}'")
+        return queries
+
+    def scanned_relations(self, plan, scans=None):
+        scans = [] if scans is None else scans
+        scans.append((plan["Node Type"], plan.get("Relation Name")))
+        for child in plan.get("Plans", []):
+            self.scanned_relations(child, scans)
+        return scans
+
+    def test_seeded_rows(self):
+        self.assertEqual(TICKETS, self.execute("SELECT count(*) FROM tickets")[0][0])
+
+    def test_hot_queries_use_indexes(self):
+        for name, sql in self.hot_queries().items():
+            with self.subTest(name):
+                plan = self.execute(f"EXPLAIN (FORMAT JSON) {sql}")[0][0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = self.scanned_relations(plan[0]["Plan"])
+                self.assertNotIn(("Seq Scan", "tickets"), scans, f"{name} scans tickets sequentially:\n{sql}")
+                if name.startswith("page"):
+                    self.assertNotIn("Sort", [node for node, _ in scans], f"{name} sorts the tickets:\n{sql}")
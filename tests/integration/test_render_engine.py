@@ -0,0 +1,129 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+from unittest import mock
+
+from .base import REPO_ROOT, STUB_HAMILTON
+
+LAMBDA_DIR = os.path.join(REPO_ROOT, "lambda_hamilton")
+# the native engine's own output, reviewed by hand; Hamilton's ticket output is not in the repository
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+# a seating plan drawn by Hamilton v1.1.0
+HAMILTON_SEATING = os.path.join(REPO_ROOT, "deprecated_service_hamilton", "bin", "output.svg")
+if LAMBDA_DIR not in sys.path:
+    sys.path.append(LAMBDA_DIR)
+
+import render_engine  # noqa: E402
+
+SEATING = {"id": "75fdeba8-0d46-4381-ba82-f5c369bd767e", "name": "Concert 1", "date": "2023-10-02",
+           "venue": "Venue 1", "seats": {"max": 505, "purchased": 7}}
+TICKET = {"id": "9d5a5ac6-3d8a-4c8e-a1b3-6b0c8a1f0d7e", "name": "Buyer", "email": "buyer@example.org",
+          "concert": {"id": SEATING["id"], "name": "Concert 1", "date": "2023-10-02", "venue": "Venue 1"}}
+
+
+class TestRenderEngines(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+
+    def engine(self, name):
+        engine = render_engine.create_engine(name, STUB_HAMILTON, self.work_dir.name)
+        self.addCleanup(engine.close)
+        return engine
+
+    def test_one_shot_renders_every_kind(self):
+        one_shot = self.engine("oneshot")
+        self.assertIn(f"<desc>{TICKET['id']}</desc>", one_shot.render("ticket", TICKET))
+        self.assertIn(f"<desc>{SEATING['id']}|505|7</desc>", one_shot.render("seating", SEATING))
+
+    def test_pipe_renders_like_one_shot(self):
+        one_shot, pipe = self.engine("oneshot"), self.engine("pipe")
+        for kind, render_input in (("seating", SEATING), ("ticket", TICKET)):
+            self.assertEqual(one_shot.render(kind, render_input), pipe.render(kind, render_input))
+        self.assertFalse(pipe.unavailable)
+
+    def test_pipe_writes_no_files(self):
+        pipe = self.engine("pipe")
+        for _ in range(3):
+            pipe.render("seating", SEATING)
+        # only the output symlinks kept across renders
+        for name in os.listdir(self.work_dir.name):
+            self.assertTrue(os.path.islink(os.path.join(self.work_dir.name, name)), name)
+
+    @mock.patch.dict(os.environ, {"STUB_HAMILTON_FILES_ONLY": "1"})
+    def test_pipe_falls_back_to_files(self):
+        pipe = self.engine("pipe")
+        self.assertIn(f"<desc>{TICKET['id']}</desc>", pipe.render("ticket", TICKET))
+        self.assertTrue(pipe.unavailable)
+        self.assertIn(f"<desc>{SEATING['id']}|505|7</desc>", pipe.render("seating", SEATING))
+
+    def test_bad_input_keeps_the_pipes(self):
+        pipe = self.engine("pipe")
+        # fails through the files too, so it is the input that is wrong
+        with self.assertRaises(subprocess.CalledProcessError):
+            pipe.render("seating", dict(SEATING, seats=None))
+        self.assertFalse(pipe.unavailable)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            render_engine.create_engine("gpu", STUB_HAMILTON)
+
+
+class TestNativeTicketEngine(unittest.TestCase):
+    engine = render_engine.NativeTicketEngine()
+
+    def test_matches_snapshot(self):
+        with open(os.path.join(SNAPSHOT_DIR, "native_ticket.svg")) as f:
+            self.assertEqual(f.read(), self.engine.render("ticket", TICKET))
+
+    def test_has_the_hamilton_output_shape(self):
+        svg = self.engine.render("ticket", TICKET)
+        with open(HAMILTON_SEATING) as f:
+            hamilton = f.read().splitlines()
+        lines = svg.splitlines()
+        # XML declaration, SVGo comment, namespaces, then desc and the background
+        self.assertEqual(hamilton[:2] + hamilton[3:5], lines[:2] + lines[3:5])
+        self.assertTrue(lines[5].startswith("<desc>") and hamilton[5].startswith("<desc>"))
+        self.assertTrue(lines[6].startswith('<rect x="0" y="0" width="1200"'))
+
+        tree = ElementTree.fromstring(svg)
+        self.assertEqual(TICKET["id"], tree.find("{http://www.w3.org/2000/svg}desc").text)
+
+    def test_escapes_fields(self):
+        ticket = dict(TICKET, name="O'Brien <&> \"Co\"", concert=dict(TICKET["concert"], venue="R&B </text>"))
+        svg = self.engine.render("ticket", ticket)
+        # no raw quote can end the literal the lambda writes the svg into
+        self.assertNotIn("'", svg)
+        texts = [node.text for node in ElementTree.fromstring(svg).iter("{http://www.w3.org/2000/svg}text")]
+        self.assertIn("O'Brien <&> \"Co\"", texts)
+        self.assertIn("R&B </text>", texts)
+
+    def test_renders_tickets_only(self):
+        with self.assertRaises(render_engine.RenderError):
+            self.engine.render("seating", SEATING)
+
+
+class TestEngineSelection(unittest.TestCase):
+    def from_environ(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            for key in ("RENDER_ENGINE", "RENDER_ENGINE_TICKET", "RENDER_ENGINE_SEATING"):
+                if key not in environ:
+                    os.environ.pop(key, None)
+            engine = render_engine.from_environ(STUB_HAMILTON)
+        self.addCleanup(engine.close)
+        return engine
+
+    def test_default_is_pipe(self):
+        self.assertEqual("ticket=pipe,seating=pipe", self.from_environ().name)
+
+    def test_per_kind(self):
+        engine = self.from_environ(RENDER_ENGINE="oneshot", RENDER_ENGINE_TICKET="native")
+        self.assertEqual("ticket=native,seating=oneshot", engine.name)
+        self.assertIn(f"<desc>{SEATING['id']}|505|7</desc>", engine.render("seating", SEATING))
+
+    def test_native_seating_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.from_environ(RENDER_ENGINE="native")
@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+import unittest
+import uuid
+
+from .base import PostgresCase, REPO_ROOT, load_lambda
+from .test_lambda_batch import RenderLog, record
+
+sys.path.append(os.path.join(REPO_ROOT, "lambda_hamilton"))
+sys.path.append(os.path.join(REPO_ROOT, "tests", "stubs"))
+
+import hamilton  # noqa: E402
+import seating  # noqa: E402
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+# seating plans drawn by Hamilton v1.1.0
+HAMILTON_EMPTY_PLAN = os.path.join(REPO_ROOT, "deprecated_service_hamilton", "bin", "output.svg")
+HAMILTON_PLANS = os.path.join(REPO_ROOT, "dev_db", "deprecated_dev_local_mongodb", "test_data", "concerts.json")
+
+
+def hamilton_plan(concert_id):
+    with open(HAMILTON_PLANS) as f:
+        return next(concert["svg"] for concert in json.load(f) if concert["id"] == concert_id)
+
+
+class TestSeatMap(unittest.TestCase):
+    def test_parses_hamilton_plans(self):
+        with open(HAMILTON_EMPTY_PLAN) as f:
+            seat_map = seating.SeatMap.parse(f.read())
+        self.assertEqual((505, 0), (seat_map.max_seats, seat_map.purchased))
+
+        seat_map = seating.SeatMap.parse(hamilton_plan("198ddd71-5279-4e1c-b492-ea46614b9a73"))
+        self.assertEqual((315, 3), (seat_map.max_seats, seat_map.purchased))
+
+    def test_sell_only_touches_new_seats(self):
+        before = hamilton_plan("198ddd71-5279-4e1c-b492-ea46614b9a73")
+        seat_map = seating.SeatMap.parse(before)
+        seat_map.sell(5)
+        after = seat_map.render()
+
+        changed = [(old, new) for old, new in zip(before.split("\n"), after.split("\n")) if old != new]
+        self.assertEqual(3, len(changed))
+        self.assertEqual(("<desc>198ddd71-5279-4e1c-b492-ea46614b9a73|315|3</desc>",
+                          "<desc>198ddd71-5279-4e1c-b492-ea46614b9a73|315|5</desc>"), changed[0])
+        for old, new in changed[1:]:
+            self.assertEqual(old.replace(" />", seating.SOLD_STYLE), new)
+        self.assertEqual(seat_map.digest, seating.digest(after))
+
+    def test_matches_a_full_render(self):
+        plan = {"id": str(uuid.uuid4()), "name": "Concert", "venue": "Venue", "seats": {"max": 1200, "purchased": 10}}
+        seat_map = seating.SeatMap.parse(hamilton.seating_plan(plan))
+        seat_map.sell(700)
+        plan["seats"]["purchased"] = 700
+        self.assertEqual(hamilton.seating_plan(plan), seat_map.render())
+
+    def test_rejects_other_shapes(self):
+        plan = hamilton_plan("198ddd71-5279-4e1c-b492-ea46614b9a73")
+        self.assertIsNone(seating.SeatMap.parse("<svg><desc>9d5a5ac6</desc></svg>"))
+        self.assertIsNone(seating.SeatMap.parse(plan.replace("|315|3<", "|315|4<")))
+        self.assertIsNone(seating.SeatMap.parse(plan.replace("|315|3<", "|316|3<")))
+
+    def test_cannot_unsell(self):
+        seat_map = seating.SeatMap.parse(hamilton_plan("198ddd71-5279-4e1c-b492-ea46614b9a73"))
+        with self.assertRaises(ValueError):
+            seat_map.sell(2)
+        with self.assertRaises(ValueError):
+            seat_map.sell(316)
+
+    def test_cache_is_bounded_and_checks_the_digest(self):
+        cache = seating.SeatMapCache(size=2)
+        maps = []
+        for _ in range(3):
+            plan = {"id": str(uuid.uuid4()), "name": "n", "venue": "v", "seats": {"max": 5, "purchased": 0}}
+            maps.append(seating.SeatMap.parse(hamilton.seating_plan(plan)))
+            cache.put(maps[-1])
+        self.assertIsNone(cache.get(maps[0].concert_id, maps[0].digest))
+        self.assertIs(maps[2], cache.get(maps[2].concert_id, maps[2].digest))
+        self.assertIsNone(cache.get(maps[2].concert_id, "plan replaced by another render"))
+
+
+class TestIncrementalSeating(PostgresCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.lambda_function = load_lambda(cls.database_uri)
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (id, name, email) VALUES (%s, 'buyer', 'buyer@example.org')", (USER_ID,))
+        conn.commit()
+        conn.close()
+
+    def setUp(self):
+        self.hamilton = RenderLog().__enter__()
+        self.addCleanup(self.hamilton.__exit__, None, None, None)
+        self.concert_id = str(uuid.uuid4())
+        self.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                     "VALUES (%s, 'Concert', 'Venue', '2023-07-05', 3000, 'ACTIVE')", (self.concert_id,))
+
+    def sell(self, count):
+        for _ in range(count):
+            self.execute("INSERT INTO tickets (id, concert_id, user_id, print_status) "
+                         "VALUES (%s, %s, %s, 'NOT_PRINTED')", (str(uuid.uuid4()), self.concert_id, USER_ID))
+
+    def render(self):
+        response = self.lambda_function.lambda_handler({"Records": [record("concert", self.concert_id)]}, None)
+        self.assertEqual({"batchItemFailures": []}, response)
+        return self.execute("SELECT svg, svg_seat_num FROM concerts WHERE id = %s", (self.concert_id,))[0]
+
+    def expected(self, purchased):
+        return hamilton.seating_plan({"id": self.concert_id, "name": "Concert", "venue": "Venue",
+                                      "seats": {"max": 3000, "purchased": purchased}})
+
+    def test_new_sales_update_the_stored_plan(self):
+        self.sell(3)
+        self.assertEqual((self.expected(3), 3), self.render())
+        self.sell(2)
+        self.assertEqual((self.expected(5), 5), self.render())
+        # drawn once by Hamilton, then updated in place
+        self.assertEqual([self.concert_id], self.hamilton.rendered)
+        # the kept map matches the svg_hash maintained by the database
+        (svg_hash,), = self.execute("SELECT svg_hash FROM concerts WHERE id = %s", (self.concert_id,))
+        self.assertIsNotNone(self.lambda_function.seat_maps.get(self.concert_id, svg_hash))
+
+    def test_plan_replaced_elsewhere_is_parsed_again(self):
+        self.sell(1)
+        self.render()
+        # another execution environment drew the plan meanwhile
+        self.sell(1)
+        self.execute("UPDATE concerts SET svg = %s, svg_seat_num = 2 WHERE id = %s",
+                     (self.expected(2), self.concert_id))
+        self.sell(1)
+        self.assertEqual((self.expected(3), 3), self.render())
+        self.assertEqual([self.concert_id], self.hamilton.rendered)
+
+    def test_updated_concert_is_drawn_in_full(self):
+        self.sell(1)
+        self.render()
+        # PUT /concerts/<id> clears the plan
+        self.execute("UPDATE concerts SET svg = NULL, svg_seat_num = NULL, capacity = 2000 WHERE id = %s",
+                     (self.concert_id,))
+        svg, _ = self.render()
+        self.assertIn(f"<desc>{self.concert_id}|2000|1</desc>", svg)
+        self.assertEqual([self.concert_id] * 2, self.hamilton.rendered)
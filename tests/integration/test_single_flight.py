@@ -0,0 +1,195 @@
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+
+from .base import PostgresCase, load_service
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSingleFlight(PostgresCase):
+    """
+    Concurrent identical concert reads of a worker share one query, and its result for CONCERT_CACHE_TTL.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.service = load_service("service_concert")
+        from metrics import metrics
+        from single_flight import SingleFlight
+        cls.metrics = metrics
+        cls.SingleFlight = SingleFlight
+
+    def setUp(self):
+        self.metrics.reset()
+        self.concert_id = str(uuid.uuid4())
+        self.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                     "VALUES (%s, 'hot', 'venue', '2023-07-05', 10, 'ACTIVE')", (self.concert_id,))
+
+    def counter(self, name):
+        return self.metrics.snapshot()["counters"].get(name, 0)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("timed out")
+            time.sleep(0.01)
+
+    def in_threads(self, target, count):
+        results = [None] * count
+
+        def run(i):
+            try:
+                results[i] = target()
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_concurrent_calls_share_one_load(self):
+        reads = self.SingleFlight("reads", ttl=0, max_entries=10)
+        started, release, loads = threading.Event(), threading.Event(), []
+
+        def load():
+            loads.append(1)
+            started.set()
+            release.wait()
+            return {"id": "x"}
+
+        leader, results = self.in_threads(lambda: reads.do("x", load), 1)
+        started.wait()
+        followers, follower_results = self.in_threads(lambda: reads.do("x", load), 5)
+        self.wait_for(lambda: self.counter("reads.coalesced") == 5)
+        release.set()
+        for thread in leader + followers:
+            thread.join()
+
+        self.assertEqual(1, len(loads))
+        self.assertEqual([{"id": "x"}] * 6, results + follower_results)
+        self.assertIs(results[0], follower_results[0])
+        # nothing is kept without a ttl
+        reads.do("x", load)
+        self.assertEqual(2, len(loads))
+
+    def test_errors_reach_every_caller(self):
+        reads = self.SingleFlight("reads", ttl=10, max_entries=10)
+        started, release = threading.Event(), threading.Event()
+
+        def load():
+            started.set()
+            release.wait()
+            raise RuntimeError("database is down")
+
+        leader, results = self.in_threads(lambda: reads.do("x", load), 1)
+        started.wait()
+        followers, follower_results = self.in_threads(lambda: reads.do("x", load), 3)
+        self.wait_for(lambda: self.counter("reads.coalesced") == 3)
+        release.set()
+        for thread in leader + followers:
+            thread.join()
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results + follower_results))
+        # a failed load is not kept
+        self.assertEqual("up", reads.do("x", lambda: "up"))
+
+    def test_results_kept_for_the_ttl(self):
+        clock = FakeClock()
+        reads = self.SingleFlight("reads", ttl=1, max_entries=2, clock=clock)
+        self.assertEqual(1, reads.do("a", lambda: 1))
+        self.assertEqual(1, reads.do("a", lambda: 2))
+        clock.now = 1.5
+        self.assertEqual(3, reads.do("a", lambda: 3))
+        self.assertEqual(1, self.counter("reads.hit"))
+        self.assertEqual(2, self.counter("reads.load"))
+
+        reads.do("b", lambda: 4)
+        reads.do("c", lambda: 5)
+        self.assertEqual(2, len(reads))
+        self.assertEqual(6, reads.do("a", lambda: 6))
+
+    def test_forget_during_a_load(self):
+        reads = self.SingleFlight("reads", ttl=10, max_entries=10)
+        started, release = threading.Event(), threading.Event()
+
+        def stale():
+            started.set()
+            release.wait()
+            return "stale"
+
+        leader, results = self.in_threads(lambda: reads.do("x", stale), 1)
+        started.wait()
+        reads.forget("x")
+        # a caller after forget does not join the load that may have read the old row
+        self.assertEqual("fresh", reads.do("x", lambda: "fresh"))
+        release.set()
+        leader[0].join()
+        self.assertEqual("stale", results[0])
+        self.assertEqual("fresh", reads.do("x", lambda: "later"))
+
+    def client(self, **config):
+        app = self.service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri, "SQS_QUEUE_URL": None,
+                                       **config})
+        self.statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if statement.lstrip().startswith("SELECT") and "FROM concerts" in statement:
+                self.statements.append(statement)
+                # a slow database, so the requests overlap
+                time.sleep(0.2)
+
+        with app.app_context():
+            event.listen(self.service.db.engine, "before_cursor_execute", before_cursor_execute)
+        listener = app.extensions.get("concert_listener")
+        if listener is not None:
+            self.addCleanup(listener.stop)
+            # the listener clears the reads once it listens, which would split a burst already in flight
+            self.assertTrue(listener.listening.wait(5))
+        return app
+
+    def test_concurrent_requests_share_one_query(self):
+        app = self.client()
+        for path in (f"/api/v1/concerts/{self.concert_id}", f"/api/v1/concerts/{self.concert_id}/seats"):
+            with self.subTest(path):
+                self.statements.clear()
+                self.metrics.reset()
+                threads, responses = self.in_threads(lambda: app.test_client().get(path), 8)
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(1, len(self.statements))
+                self.assertEqual(len({response.status_code for response in responses}), 1)
+                self.assertEqual(7, self.counter("concert_reads.coalesced") + self.counter("concert_reads.hit"))
+
+        body = app.test_client().get(f"/api/v1/concerts/{self.concert_id}").get_json()
+        self.assertEqual("hot", body["name"])
+
+    def test_update_is_seen_by_the_worker_that_made_it(self):
+        app = self.client()
+        client = app.test_client()
+        url = f"/api/v1/concerts/{self.concert_id}"
+        self.assertEqual("hot", client.get(url).get_json()["name"])
+        self.assertEqual(200, client.put(url, json={"name": "renamed"}).status_code)
+        self.assertEqual("renamed", client.get(url).get_json()["name"])
+
+    def test_changes_of_other_workers_within_the_ttl(self):
+        url = f"/api/v1/concerts/{self.concert_id}"
+        cached = self.client(CONCERT_CACHE_TTL=60, CONCERT_INVALIDATION="none").test_client()
+        uncached = self.client(CONCERT_CACHE_TTL=0, CONCERT_INVALIDATION="none").test_client()
+        for client in (cached, uncached):
+            client.get(url)
+        self.execute("UPDATE concerts SET name = 'elsewhere' WHERE id = %s", (self.concert_id,))
+        self.assertEqual("hot", cached.get(url).get_json()["name"])
+        self.assertEqual("elsewhere", uncached.get(url).get_json()["name"])
+
@@ -0,0 +1,125 @@
+import datetime
+import json
+import unittest
+import uuid
+
+from sqlalchemy import event
+
+from .base import PostgresCase, load_service
+
+USER_ID = str(uuid.uuid4())
+CONCERT_ID = str(uuid.uuid4())
+
+
+class TestStreamedTicketList(PostgresCase):
+    """
+    GET /tickets without a page is streamed from a server side cursor, in the bytes jsonify wrote.
+    """
+    tickets = 25
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (id, name, email) VALUES (%s, 'buyer', 'buyer@example.org')", (USER_ID,))
+            cur.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                        "VALUES (%s, 'streamed', 'venue', '2023-07-05', 100, 'ACTIVE')", (CONCERT_ID,))
+            cur.execute("INSERT INTO tickets (id, concert_id, user_id, print_status) "
+                        "SELECT gen_random_uuid(), %s, %s, 'NOT_PRINTED' FROM generate_series(1, %s)",
+                        (CONCERT_ID, USER_ID, cls.tickets))
+        conn.commit()
+        conn.close()
+        cls.service = load_service("service_ticket")
+
+    def client(self, **config):
+        app = self.service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri, "SQS_QUEUE_URL": None,
+                                       "LIST_PAGE_SIZE": 0, **config})
+        self.cursors = []
+        with app.app_context():
+            event.listen(self.service.db.engine, "before_cursor_execute",
+                         lambda conn, cursor, *args: self.cursors.append(getattr(cursor, "name", None)))
+        return app.test_client()
+
+    def test_same_body_as_the_list_built_in_memory(self):
+        for path in ("/api/v1/tickets", f"/api/v1/tickets?concert_id={CONCERT_ID}", f"/api/v1/tickets?user_id={USER_ID}"):
+            with self.subTest(path):
+                streamed = self.client(LIST_STREAM_ROWS=4).get(path)
+                built = self.client(LIST_STREAM_ROWS=0).get(path)
+                self.assertEqual(200, streamed.status_code)
+                self.assertEqual("application/json", streamed.content_type)
+                self.assertEqual(built.data, streamed.data)
+                self.assertEqual(self.tickets, len(json.loads(streamed.data)))
+
+    def test_ticket_response(self):
+        ticket_id = self.execute("SELECT id::text FROM tickets ORDER BY id LIMIT 1")[0][0]
+        for config in ({"LIST_STREAM_ROWS": 4}, {"LIST_PAGE_SIZE": 1}):
+            with self.subTest(config):
+                client = self.client(SERVICE_CONCERT_URL="http://concerts/api/v1/concerts",
+                                     SERVICE_USER_URL="http://users/api/v1/users", **config)
+                self.assertEqual({
+                    "id": ticket_id,
+                    "concert": {"id": CONCERT_ID, "url": f"http://concerts/api/v1/concerts/{CONCERT_ID}"},
+                    "user": {"id": USER_ID, "url": f"http://users/api/v1/users/{USER_ID}"},
+                    "print_status": "NOT_PRINTED",
+                }, next(ticket for ticket in json.loads(client.get("/api/v1/tickets").data) if ticket["id"] == ticket_id))
+
+    def test_reads_from_a_server_side_cursor(self):
+        client = self.client(LIST_STREAM_ROWS=4)
+        client.get("/api/v1/tickets").data
+        # psycopg2 names the cursors it declares on the server
+        self.assertTrue(any(self.cursors))
+
+    def test_unknown_filter(self):
+        client = self.client()
+        response = client.get(f"/api/v1/tickets?concert_id={uuid.uuid4()}")
+        self.assertEqual(404, response.status_code)
+        self.assertEqual("Unknown identifier provided as filter parameter", response.get_json()["error"])
+
+
+class TestJsonArray(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_service("service_ticket")
+        import streaming
+        cls.json_array = staticmethod(streaming.json_array)
+
+    def test_chunks(self):
+        items = [{"b": i, "a": str(i)} for i in range(5)]
+        pieces = list(self.json_array(items, 2, json.dumps))
+        self.assertEqual(["[", 2, 2, 1, "]\n"], [pieces[0]] + [piece.count("{") for piece in pieces[1:-1]] + [pieces[-1]])
+        self.assertEqual(items, json.loads("".join(pieces)))
+
+    def test_empty(self):
+        self.assertEqual("[]\n", "".join(self.json_array([], 10, json.dumps)))
+
+
+class TestFastJSONProvider(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app = load_service("service_ticket")
+        import json_provider
+        if json_provider.orjson is None:
+            raise unittest.SkipTest("orjson is not installed")
+        flask_app = app.Flask(__name__)
+        cls.fast = json_provider.FastJSONProvider(flask_app)
+        cls.default = json_provider.DefaultJSONProvider(flask_app)
+
+    def test_same_output_as_the_default_provider(self):
+        value = {"id": uuid.uuid4(), "b": [1, 2.5, None, True], "a": {"date": datetime.date(2023, 7, 5)},
+                 "when": datetime.datetime(2023, 7, 5, 20, 30)}
+        for kwargs in ({}, {"separators": (",", ":")}):
+            with self.subTest(kwargs):
+                self.assertEqual(json.loads(self.default.dumps(value, **kwargs)),
+                                 json.loads(self.fast.dumps(value, **kwargs)))
+        self.assertEqual(self.default.dumps(value, separators=(",", ":")), self.fast.dumps(value))
+
+    def test_the_app_encodes_with_orjson(self):
+        app = load_service("service_ticket")
+        flask_app = app.create_app({"SQLALCHEMY_DATABASE_URI": "postgresql://localhost/unused", "SCHEMA_MODE": "skip",
+                                    "SQS_QUEUE_URL": None})
+        # the json module would escape the non-ASCII text
+        self.assertEqual('{"name":"Zoë"}', flask_app.json.dumps({"name": "Zoë"}))
+
+    def test_indented_output_uses_the_json_module(self):
+        self.assertEqual(self.default.dumps({"a": 1}, indent=2), self.fast.dumps({"a": 1}, indent=2))
@@ -0,0 +1,88 @@
+import threading
+import uuid
+
+from .base import PostgresCase, load_service
+
+BUYERS = 300
+CAPACITY = 120
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class TestTicketCapacity(PostgresCase):
+    """
+    Hundreds of concurrent buyers against one concert: exactly `capacity` tickets are sold.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.service = load_service("service_ticket")
+        cls.app = cls.service.create_app({
+            "SQLALCHEMY_DATABASE_URI": cls.database_uri,
+            "SQLALCHEMY_ENGINE_OPTIONS": {"pool_size": 20, "max_overflow": 0},
+        })
+        cls.execute_class("INSERT INTO users (id, name, email) VALUES (%s, 'buyer', 'buyer@example.org')", (USER_ID,))
+
+    @classmethod
+    def execute_class(cls, sql, params=None):
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    def create_concert(self, capacity):
+        concert_id = str(uuid.uuid4())
+        self.execute("INSERT INTO concerts (id, name, venue, date, capacity, status) "
+                     "VALUES (%s, 'presale', 'venue', '2023-07-05', %s, 'ACTIVE')", (concert_id, capacity))
+        return concert_id
+
+    def buy_concurrently(self, concert_id, buyers):
+        statuses = []
+        barrier = threading.Barrier(buyers)
+
+        def buy():
+            client = self.app.test_client()
+            barrier.wait()
+            response = client.post("/api/v1/tickets", json={"concert_id": concert_id, "user_id": USER_ID})
+            statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=buy) for _ in range(buyers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_concurrent_buyers_do_not_oversell(self):
+        concert_id = self.create_concert(CAPACITY)
+        statuses = self.buy_concurrently(concert_id, BUYERS)
+
+        self.assertEqual(CAPACITY, statuses.count(201))
+        self.assertEqual(BUYERS - CAPACITY, statuses.count(422))
+        # one pending seating plan render, every other purchase merged into it
+        render_requests = self.execute("SELECT coalesced FROM outbox WHERE body LIKE %s", (f"%{concert_id}%",))
+        self.assertEqual([(CAPACITY - 1,)], render_requests)
+        sold = self.execute("SELECT count(*) FROM tickets WHERE concert_id = %s", (concert_id,))[0][0]
+        counter, status = self.execute("SELECT tickets_sold, status FROM concerts WHERE id = %s", (concert_id,))[0]
+        self.assertEqual(CAPACITY, sold)
+        self.assertEqual(CAPACITY, counter)
+        self.assertEqual("SOLD_OUT", status)
+
+    def test_counter_matches_tickets_below_capacity(self):
+        concert_id = self.create_concert(BUYERS)
+        statuses = self.buy_concurrently(concert_id, 50)
+
+        self.assertEqual([201] * 50, statuses)
+        counter, status = self.execute("SELECT tickets_sold, status FROM concerts WHERE id = %s", (concert_id,))[0]
+        self.assertEqual(50, counter)
+        self.assertEqual("ACTIVE", status)
+
+    def test_unknown_concert_or_user(self):
+        concert_id = self.create_concert(1)
+        client = self.app.test_client()
+        response = client.post("/api/v1/tickets", json={"concert_id": str(uuid.uuid4()), "user_id": USER_ID})
+        self.assertEqual(400, response.status_code)
+        response = client.post("/api/v1/tickets", json={"concert_id": concert_id, "user_id": str(uuid.uuid4())})
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(0, self.execute("SELECT tickets_sold FROM concerts WHERE id = %s", (concert_id,))[0][0])
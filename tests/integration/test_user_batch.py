@@ -0,0 +1,90 @@
+import uuid
+
+from sqlalchemy import event
+
+from .base import PostgresCase, load_service
+from .test_user_cache import FakeRedis
+
+
+class TestUserBatchGet(PostgresCase):
+    """
+    GET /users?id=...&id=... answers many ids with at most one query.
+    """
+    users = 6
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_ids = [str(uuid.uuid4()) for _ in range(cls.users)]
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            for i, user_id in enumerate(cls.user_ids):
+                cur.execute("INSERT INTO users (id, name, email) VALUES (%s, %s, %s)",
+                            (user_id, f"user {i}", f"user{i}@example.org"))
+        conn.commit()
+        conn.close()
+        cls.service = load_service("service_user")
+
+    def setUp(self):
+        from metrics import metrics
+        self.metrics = metrics
+        metrics.reset()
+
+    def client(self, **config):
+        app = self.service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri, **config})
+        self.app = app
+        self.queries = []
+        with app.app_context():
+            event.listen(self.service.db.engine, "before_cursor_execute",
+                         lambda conn, cursor, statement, *args: self.queries.append(statement))
+        return app.test_client()
+
+    def batch_get(self, client, user_ids):
+        self.queries.clear()
+        return client.get("/api/v1/users", query_string=[("id", user_id) for user_id in user_ids])
+
+    def test_request_order_in_one_query(self):
+        client = self.client(USER_CACHE_SIZE=0)
+        asked = [self.user_ids[4], self.user_ids[0], str(uuid.uuid4()), self.user_ids[2], self.user_ids[4]]
+        response = self.batch_get(client, asked)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([self.user_ids[4], self.user_ids[0], self.user_ids[2]], [u["id"] for u in response.get_json()])
+        self.assertEqual({"id": self.user_ids[0], "name": "user 0", "email": "user0@example.org"},
+                         response.get_json()[1])
+        self.assertEqual(1, len(self.queries))
+
+    def test_cached_users_are_not_queried(self):
+        client = self.client()
+        client.get(f"/api/v1/users/{self.user_ids[0]}")
+        self.batch_get(client, self.user_ids[:3])
+        self.assertEqual(1, len(self.queries))
+        self.assertEqual(self.user_ids[:3], [u["id"] for u in self.batch_get(client, self.user_ids[:3]).get_json()])
+        self.assertEqual([], self.queries)
+        counters = self.metrics.snapshot()["counters"]
+        self.assertEqual({"user_cache.miss": 3, "user_cache.hit": 4},
+                         {name: count for name, count in counters.items() if name.startswith("user_cache.")})
+
+    def test_shared_cache(self):
+        import user_cache
+        shared = FakeRedis()
+        for _ in range(2):
+            client = self.client()
+            self.app.extensions['user_cache'] = user_cache.UserCache(
+                user_cache.LocalCache(100, 60), user_cache.SharedCache(shared, 60))
+            response = self.batch_get(client, self.user_ids)
+            self.assertEqual(self.user_ids, [u["id"] for u in response.get_json()])
+        # the second worker found every user in the shared cache
+        self.assertEqual([], self.queries)
+
+    def test_snapshot(self):
+        client = self.client(USER_STORE="snapshot")
+        asked = [self.user_ids[5], str(uuid.uuid4()), self.user_ids[1]]
+        response = self.batch_get(client, asked)
+        self.assertEqual([self.user_ids[5], self.user_ids[1]], [u["id"] for u in response.get_json()])
+        self.assertEqual([], self.queries)
+
+    def test_invalid_requests(self):
+        client = self.client(USER_BATCH_MAX=3)
+        self.assertEqual(400, self.batch_get(client, ["not-a-uuid"]).status_code)
+        self.assertEqual(400, self.batch_get(client, self.user_ids[:4]).status_code)
+        self.assertEqual(200, self.batch_get(client, self.user_ids[:3] * 2).status_code)
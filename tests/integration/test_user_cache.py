@@ -0,0 +1,216 @@
+import fnmatch
+import unittest
+import uuid
+
+from sqlalchemy import event
+
+from .base import PostgresCase, load_service
+
+USER_ID = str(uuid.uuid4())
+INTERNAL = {"X-Internal-Token": "internal-secret"}
+
+
+class FakeRedis:
+    """
+    Local stand-in for redis.Redis with the commands the shared user cache uses.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.fail = False
+
+    def _check(self):
+        if self.fail:
+            raise ConnectionError("redis is down")
+
+    def get(self, name):
+        self._check()
+        return self.values.get(name)
+
+    def mget(self, names):
+        self._check()
+        return [self.values.get(name) for name in names]
+
+    def set(self, name, value, ex=None):
+        self._check()
+        self.values[name] = value.encode() if isinstance(value, str) else value
+
+    def delete(self, *names):
+        self._check()
+        for name in names:
+            self.values.pop(name, None)
+
+    def scan_iter(self, match="*"):
+        self._check()
+        return [name for name in list(self.values) if fnmatch.fnmatch(name, match)]
+
+
+class TestUserCache(PostgresCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.execute_class("INSERT INTO users (id, name, email) VALUES (%s, 'cached', 'cached@example.org')", (USER_ID,))
+        cls.service = load_service("service_user")
+
+    @classmethod
+    def execute_class(cls, sql, params=None):
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    def setUp(self):
+        self.execute("UPDATE users SET name = 'cached' WHERE id = %s", (USER_ID,))
+        from metrics import metrics
+        self.metrics = metrics
+        metrics.reset()
+
+    def client(self, **config):
+        app = self.service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri,
+                                       "INTERNAL_TOKEN": INTERNAL["X-Internal-Token"], **config})
+        self.app = app
+        self.queries = []
+        with app.app_context():
+            event.listen(self.service.db.engine, "before_cursor_execute",
+                         lambda conn, cursor, statement, *args: self.queries.append(statement))
+        return app.test_client()
+
+    def counters(self):
+        # only the user cache's, metrics is shared with the workers of other services in this process
+        return {name: count for name, count in self.metrics.snapshot()["counters"].items()
+                if name.startswith("user_cache.")}
+
+    def get_user(self, client):
+        self.queries.clear()
+        response = client.get(f"/api/v1/users/{USER_ID}")
+        self.assertEqual(200, response.status_code)
+        return response.get_json()
+
+    def test_second_lookup_is_served_from_memory(self):
+        client = self.client()
+        first = self.get_user(client)
+        self.assertEqual(1, len(self.queries))
+        self.assertEqual(first, self.get_user(client))
+        self.assertEqual([], self.queries)
+        self.assertEqual({"user_cache.miss": 1, "user_cache.hit": 1}, self.counters())
+        counters = client.get("/api/v1/users/metrics").get_json()["counters"]
+        self.assertEqual(self.counters(), {name: count for name, count in counters.items()
+                                           if name.startswith("user_cache.")})
+
+    def test_unknown_users_are_not_cached(self):
+        client = self.client()
+        unknown = str(uuid.uuid4())
+        for _ in range(2):
+            self.assertEqual(404, client.get(f"/api/v1/users/{unknown}").status_code)
+        self.assertEqual(2, self.counters()["user_cache.miss"])
+
+    def test_ids_are_cached_in_canonical_form(self):
+        client = self.client()
+        self.get_user(client)
+        self.queries.clear()
+        response = client.get(f"/api/v1/users/{USER_ID.upper()}")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(USER_ID, response.get_json()["id"])
+        self.assertEqual([], self.queries)
+
+        self.execute("UPDATE users SET name = 'renamed' WHERE id = %s", (USER_ID,))
+        client.post("/api/v1/users/cache/invalidate", json={"ids": [USER_ID.upper()]}, headers=INTERNAL)
+        self.assertEqual("renamed", self.get_user(client)["name"])
+
+        self.queries.clear()
+        self.assertEqual(404, client.get("/api/v1/users/not-a-uuid").status_code)
+        self.assertEqual([], self.queries)
+
+    def test_invalidate(self):
+        client = self.client()
+        self.get_user(client)
+        self.execute("UPDATE users SET name = 'renamed' WHERE id = %s", (USER_ID,))
+        self.assertEqual("cached", self.get_user(client)["name"])
+
+        response = client.post("/api/v1/users/cache/invalidate", json={"ids": [USER_ID]}, headers=INTERNAL)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("renamed", self.get_user(client)["name"])
+
+        self.execute("UPDATE users SET name = 'again' WHERE id = %s", (USER_ID,))
+        client.post("/api/v1/users/cache/invalidate", headers=INTERNAL)
+        self.assertEqual("again", self.get_user(client)["name"])
+        self.assertEqual(400, client.post("/api/v1/users/cache/invalidate", json={"ids": USER_ID},
+                                          headers=INTERNAL).status_code)
+
+    def test_invalidate_needs_the_internal_token(self):
+        client = self.client()
+        self.get_user(client)
+        self.execute("UPDATE users SET name = 'renamed' WHERE id = %s", (USER_ID,))
+        for headers in ({}, {"X-Internal-Token": "guess"}):
+            with self.subTest(headers=headers):
+                self.assertEqual(403, client.post("/api/v1/users/cache/invalidate", headers=headers).status_code)
+        self.assertEqual("cached", self.get_user(client)["name"])
+        # not served at all without a token configured
+        client = self.client(INTERNAL_TOKEN=None)
+        self.assertEqual(404, client.post("/api/v1/users/cache/invalidate", headers=INTERNAL).status_code)
+
+    def test_disabled(self):
+        client = self.client(USER_CACHE_SIZE=0)
+        self.get_user(client)
+        self.get_user(client)
+        self.assertEqual(1, len(self.queries))
+
+    def shared_client(self, redis_client):
+        import user_cache
+        client = self.client()
+        self.app.extensions['user_cache'] = user_cache.UserCache(
+            user_cache.LocalCache(100, 60), user_cache.SharedCache(redis_client, 60), self.app.logger)
+        return client
+
+    def test_shared_cache_between_workers(self):
+        shared = FakeRedis()
+        first_worker = self.shared_client(shared)
+        user = self.get_user(first_worker)
+        self.assertEqual([f"users:{USER_ID}"], list(shared.values))
+
+        second_worker = self.shared_client(shared)
+        self.assertEqual(user, self.get_user(second_worker))
+        self.assertEqual([], self.queries)
+        self.assertEqual(1, self.counters()["user_cache.shared_hit"])
+
+        second_worker.post("/api/v1/users/cache/invalidate", json={"ids": [USER_ID]}, headers=INTERNAL)
+        self.assertEqual({}, shared.values)
+
+    def test_failing_shared_cache_falls_back_to_postgres(self):
+        shared = FakeRedis()
+        shared.fail = True
+        client = self.shared_client(shared)
+        self.assertEqual("cached", self.get_user(client)["name"])
+        self.assertEqual(1, len(self.queries))
+        self.assertEqual(2, self.counters()["user_cache.shared_error"])
+        # still cached in the worker
+        self.get_user(client)
+        self.assertEqual([], self.queries)
+
+
+class TestLocalCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        load_service("service_user")
+        import user_cache
+        cls.LocalCache = user_cache.LocalCache
+
+    def setUp(self):
+        self.now = 0.0
+        self.cache = self.LocalCache(max_entries=2, ttl=10, clock=lambda: self.now)
+
+    def test_expires_after_ttl(self):
+        self.cache.put("a", 1)
+        self.now = 9.9
+        self.assertEqual(1, self.cache.get("a"))
+        self.now = 10
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(0, len(self.cache))
+
+    def test_least_recently_used_goes_first(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.get("a")
+        self.cache.put("c", 3)
+        self.assertEqual((1, None, 3), (self.cache.get("a"), self.cache.get("b"), self.cache.get("c")))
@@ -0,0 +1,141 @@
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+
+from .base import PostgresCase, load_service
+
+INTERNAL = {"X-Internal-Token": "internal-secret"}
+
+
+class TestUserSnapshot(PostgresCase):
+    """
+    USER_STORE=snapshot answers /users and /users/<id> like the database does, without querying it.
+    """
+    users = 7
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        conn = cls.connect()
+        with conn.cursor() as cur:
+            for i in range(cls.users):
+                cur.execute("INSERT INTO users (id, name, email) VALUES (%s, %s, %s)",
+                            (str(uuid.uuid4()), f"user {i}", f"user{i}@example.org"))
+        conn.commit()
+        conn.close()
+        cls.service = load_service("service_user")
+
+    def client(self, **config):
+        app = self.service.create_app({"SQLALCHEMY_DATABASE_URI": self.database_uri, "USER_CACHE_SIZE": 0,
+                                       "INTERNAL_TOKEN": INTERNAL["X-Internal-Token"],
+                                       "USER_SNAPSHOT_RELOAD_INTERVAL": 0, **config})
+        self.app = app
+        self.queries = []
+        with app.app_context():
+            event.listen(self.service.db.engine, "before_cursor_execute",
+                         lambda conn, cursor, statement, *args: self.queries.append(statement))
+        return app.test_client()
+
+    def user_ids(self):
+        return [row[0] for row in self.execute("SELECT id::text FROM users ORDER BY id")]
+
+    def walk(self, client, url):
+        bodies = []
+        while url:
+            response = client.get(url)
+            bodies.append(response.get_json())
+            link = response.headers.get("Link")
+            url = link[1:link.index(">")] if link else None
+        return bodies
+
+    def test_same_answers_as_the_database(self):
+        database = self.client()
+        snapshot = self.client(USER_STORE="snapshot")
+        self.queries.clear()
+        for url in ["/api/v1/users", "/api/v1/users?limit=3", f"/api/v1/users/{uuid.uuid4()}",
+                    "/api/v1/users/not-a-uuid"] + [f"/api/v1/users/{user_id}" for user_id in self.user_ids()]:
+            with self.subTest(url):
+                expected, actual = database.get(url), snapshot.get(url)
+                self.assertEqual(expected.status_code, actual.status_code)
+                if url == "/api/v1/users":
+                    # the whole list comes in no particular order from the database
+                    self.assertEqual(sorted(expected.get_json(), key=lambda user: user["id"]), actual.get_json())
+                elif expected.status_code == 200:
+                    self.assertEqual(expected.get_json(), actual.get_json())
+        self.assertEqual(self.walk(database, "/api/v1/users?limit=3"), self.walk(snapshot, "/api/v1/users?limit=3"))
+
+    def test_served_without_queries(self):
+        client = self.client(USER_STORE="snapshot")
+        self.queries.clear()
+        user_id = self.user_ids()[3]
+        self.assertEqual(200, client.get(f"/api/v1/users/{user_id}").status_code)
+        self.assertEqual(self.users, len(client.get("/api/v1/users?limit=100").get_json()))
+        self.assertEqual([], self.queries)
+
+    def test_reload(self):
+        client = self.client(USER_STORE="snapshot")
+        user_id = str(uuid.uuid4())
+        self.execute("INSERT INTO users (id, name, email) VALUES (%s, 'late', 'late@example.org')", (user_id,))
+        try:
+            self.assertEqual(404, client.get(f"/api/v1/users/{user_id}").status_code)
+            self.assertEqual(403, client.post("/api/v1/users/snapshot/reload").status_code)
+            response = client.post("/api/v1/users/snapshot/reload", headers=INTERNAL)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(self.users + 1, response.get_json()["users"])
+            self.assertEqual("late", client.get(f"/api/v1/users/{user_id}").get_json()["name"])
+        finally:
+            self.execute("DELETE FROM users WHERE id = %s", (user_id,))
+
+    def test_reload_without_snapshot(self):
+        self.assertEqual(404, self.client().post("/api/v1/users/snapshot/reload", headers=INTERNAL).status_code)
+
+    def test_reloads_are_rate_limited(self):
+        client = self.client(USER_STORE="snapshot", USER_SNAPSHOT_RELOAD_INTERVAL=60)
+        response = client.post("/api/v1/users/snapshot/reload", headers=INTERNAL)
+        self.assertEqual(429, response.status_code)
+        self.assertLessEqual(int(response.headers["Retry-After"]), 60)
+
+        store = self.app.extensions['user_snapshot']
+        store.clock = lambda: store._loaded + 60
+        self.assertEqual(200, client.post("/api/v1/users/snapshot/reload", headers=INTERNAL).status_code)
+
+    def test_concurrent_reloads_share_one_scan(self):
+        self.client(USER_STORE="snapshot")
+        from metrics import metrics
+        metrics.reset()
+        store = self.app.extensions['user_snapshot']
+        started, release = threading.Event(), threading.Event()
+
+        def slow_scan(conn, cursor, statement, *args):
+            if "FROM users" in statement:
+                started.set()
+                release.wait()
+
+        with self.app.app_context():
+            event.listen(self.service.db.engine, "before_cursor_execute", slow_scan)
+        snapshots = []
+
+        def reload():
+            with self.app.app_context():
+                snapshots.append(store.reload())
+
+        threads = [threading.Thread(target=reload) for _ in range(3)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while metrics.snapshot()["counters"].get("user_snapshot.reload_coalesced", 0) < 2:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, sum("FROM users" in statement for statement in self.queries))
+        self.assertEqual(1, len({id(snapshot) for snapshot in snapshots}))
+
+    def test_unknown_store(self):
+        with self.assertRaises(ValueError):
+            self.client(USER_STORE="memory")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Hamilton binary used by the lambda tests and benchmarks.
+
+    hamilton.py generate ticket|seating --input <file> --output <path>   writes <path>.svg
+
+A ticket SVG only carries the <desc> Hamilton puts in it, the ticket id. A seating plan has the
+shape of Hamilton's: <desc>id|max|purchased</desc>, the stylesheet, then one rect per seat with the
+purchased ones filled first (the layout is a plain grid). Environment:
+    STUB_HAMILTON_STARTUP_MS   sleep once per process, like the start of the real binary
+    STUB_HAMILTON_RENDER_MS    sleep per render
+    STUB_HAMILTON_LOG          append "<kind> <id>" per render to this file
+    STUB_HAMILTON_FILES_ONLY=1 fail unless --input is a regular file, like a build that cannot read pipes
+"""
+import json
+import os
+import sys
+import time
+
+
+def render(kind, render_input):
+    time.sleep(float(os.environ.get("STUB_HAMILTON_RENDER_MS", 0)) / 1000)
+    if os.environ.get("STUB_HAMILTON_LOG"):
+        with open(os.environ["STUB_HAMILTON_LOG"], "a") as f:
+            f.write(f"{kind} {render_input['id']}\n")
+    if kind == "seating":
+        return seating_plan(render_input)
+    return (f'<?xml version="1.0"?>\n<svg width="1200" height="500" xmlns="http://www.w3.org/2000/svg">\n'
+            f'<desc>{render_input["id"]}</desc>\n</svg>\n')
+
+
+def seating_plan(render_input):
+    seats = render_input["seats"]
+    lines = [
+        '<?xml version="1.0"?>',
+        '<!-- Generated by SVGo -->',
+        '<svg width="1200" height="500"',
+        '     xmlns="http://www.w3.org/2000/svg"',
+        '     xmlns:xlink="http://www.w3.org/1999/xlink">',
+        f'<desc>{render_input["id"]}|{seats["max"]}|{seats["purchased"]}</desc>',
+        '<rect x="0" y="0" width="1200" height="500" style="fill:rgb(255,255,255)" />',
+        f'<text x="600" y="100" style="text-anchor:middle;font-size:36px;fill:black" >{render_input["name"]}</text>',
+        f'<text x="600" y="150" style="text-anchor:middle;font-size:24px;fill:black" >{render_input["venue"]}</text>',
+        '<line x1="300" y1="170" x2="900" y2="170" style="stroke:rgb(0,0,0);stroke-width:2" />',
+        '<style type="text/css">',
+        '<![CDATA[',
+        'rect {fill: white; stroke-width: 1; stroke: black;}',
+        ']]>',
+        '</style>',
+    ]
+    for seat in range(seats["max"]):
+        style = ' style="fill:rgb(50,98,115);"' if seat < seats["purchased"] else ""
+        lines.append(f'<rect x="{200 + seat % 40 * 20}" y="{240 + seat // 40 * 20}" width="20" height="20"{style} />')
+    lines.append("</svg>")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv):
+    time.sleep(float(os.environ.get("STUB_HAMILTON_STARTUP_MS", 0)) / 1000)
+    if argv[1:2] != ["generate"] or len(argv) != 7:
+        print("usage: hamilton generate ticket|seating --input <file> --output <path>")
+        return 1
+    kind, input_path, output_path = argv[2], argv[4], argv[6]
+    if os.environ.get("STUB_HAMILTON_FILES_ONLY") == "1" and not os.path.isfile(input_path):
+        print(f"input {input_path} is not a file")
+        return 1
+    with open(input_path) as f:
+        svg = render(kind, json.load(f))
+    with open(f"{output_path}.svg", "w") as f:
+        f.write(svg)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))